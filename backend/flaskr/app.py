@@ -1,79 +1,98 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template
 from flask_cors import CORS
-from flask_mail import Mail
 from dotenv import load_dotenv
-from routes.auth import auth_bp
-from routes.user_handler import user_handler
+from importlib import import_module
 import os
-from extensions import db, socketio, init_mail
-from models.auth_model import User
-from models.activity_model import Activity
-from routes.activity import activity_bp
-from routes.carpool import carpool_bp
-from routes.message import message_bp
-from routes.admin import admin_bp
-from routes.notifications import notifications_bp
-from routes.mail import mail_bp
-from test_data import add_test_data
-from seed_roles import seed_roles
-from seed_admin import seed_admin
-from seed_activities import seed_activities
+import sys
+from extensions import socketio, init_socketio, init_mail, init_db, check_database
+from calendar_sync import init_calendar_sync
+from carpool_snapshots import init_carpool_snapshots
+from cleanup import init_cleanup
+from mail_outbox import init_mail_outbox
+from maintenance import init_maintenance
+from message_writer import init_message_writer
+from notification_state import init_notification_state
+from workers import init_workers, start_background_workers
+from migrations import init_migrations, upgrade, seed
 
 load_dotenv()
 
+# Blueprints importeras först när appen skapas. Modulerna registrerar även
+# sina Socket.IO-händelser när de importeras.
+BLUEPRINTS = [
+    ('routes.auth', 'auth_bp'),
+    ('routes.user_handler', 'user_handler'),
+    ('routes.activity', 'activity_bp'),
+    ('routes.carpool', 'carpool_bp'),
+    ('routes.message', 'message_bp'),
+    ('routes.notifications', 'notifications_bp'),
+    ('routes.admin', 'admin_bp'),
+    ('routes.mail', 'mail_bp'),
+    ('routes.dashboard', 'dashboard_bp'),
+]
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'secret!'
-socketio.init_app(app, cors_allowed_origins="*")
 
-CORS(app, supports_credentials=True, resources={r"/api/*": {
-    "origins": ["http://localhost:3000"],
-    "methods": ["GET", "POST", "OPTIONS"],
-    "allow_headers": ["Content-Type", "Authorization"],
-}})
+def register_blueprints(app):
+    for module_name, blueprint_name in BLUEPRINTS:
+        app.register_blueprint(getattr(import_module(module_name), blueprint_name))
 
-init_mail(app)
 
-# Database
-basedir = os.path.abspath(os.path.dirname(__file__))
-db_path = os.path.join(basedir, 'instance', 'users.db')
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['JWT_SECRET'] = os.getenv('JWT_SECRET', 'default_secret_key')
+def create_app(config=None):
+    """Skapar appen utan att röra databasen. Schemat uppgraderas med
+    `flask --app app db-upgrade` och seedas med `flask --app app seed`.
 
-db.init_app(app)
+    config är en valfri dict som skriver över standardinställningarna,
+    t.ex. SQLALCHEMY_DATABASE_URI vid test.
+    """
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'secret!'
+    app.config['JWT_SECRET'] = os.getenv('JWT_SECRET', 'default_secret_key')
+    if config:
+        app.config.from_mapping(config)
 
-# DB local storage
-if not os.path.exists(os.path.join(basedir, 'instance')):
-    os.makedirs(os.path.join(basedir, 'instance'))
+    init_socketio(app)
 
-# Create all tables and seed roles
-with app.app_context():
-    db.create_all()
+    CORS(app, supports_credentials=True, resources={r"/api/*": {
+        "origins": ["http://localhost:3000"],
+        "methods": ["GET", "POST", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Authorization"],
+    }})
 
-    seed_roles()
+    init_mail(app)
+    init_calendar_sync(app)
+    init_mail_outbox(app)
+    init_message_writer(app)
+    init_notification_state(app)
+    init_carpool_snapshots(app)
+    init_cleanup(app)
+    init_maintenance(app)
+    init_workers(app)
 
-    # Generate test data (users, cars, children etc)
-    if not User.query.first():
-        seed_admin()
-        add_test_data()
-    
-    if not Activity.query.first():
-        seed_activities()
+    # Database
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    init_db(app, basedir)
+    init_migrations(app)
 
-app.register_blueprint(auth_bp)
-app.register_blueprint(user_handler)
-app.register_blueprint(activity_bp)
-app.register_blueprint(carpool_bp)
-app.register_blueprint(message_bp)
-app.register_blueprint(notifications_bp)
-app.register_blueprint(admin_bp)
-app.register_blueprint(mail_bp)
+    register_blueprints(app)
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+    @app.route('/')
+    def index():
+        return render_template('index.html')
+
+    return app
 
 
 if __name__ == '__main__':
+    sys.stdout.reconfigure(encoding='utf-8')
+    app = create_app()
+
+    # Lokal utveckling: uppgradera schemat och seeda innan servern startar
+    check_database(app)
+    with app.app_context():
+        upgrade()
+        seed()
+
+    # Med reloadern körs modulen i två processer, starta bara workers i den som serverar
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers(app)
     socketio.run(app, debug=True, host='0.0.0.0', allow_unsafe_werkzeug=True)
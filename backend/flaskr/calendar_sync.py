@@ -0,0 +1,195 @@
+import hashlib
+import os
+from datetime import date, datetime, timedelta
+from email.utils import formatdate
+from urllib.parse import urlparse
+from extensions import db, dialect_insert, socketio
+from models.activity_model import Activity, CalendarSyncState
+
+DEFAULT_CALENDAR_URL = 'http://cal.svenskalag.se/19717'
+DEFAULT_SYNC_INTERVAL = 15 * 60  # sekunder
+
+
+class CalendarSync:
+    """Synkar den externa iCal-kalendern till activities-tabellen.
+
+    Hämtningen är villkorad (ETag/Last-Modified) och hoppas över helt om
+    innehållet har samma hash som vid förra synken. Valideringsdatan sparas i
+    calendar_sync_state i samma transaktion som aktiviteterna, så en omstartad
+    process eller ett engångskommando fortsätter där förra synken slutade.
+    Aktiviteterna sparas med en batch-insert där ON CONFLICT DO NOTHING på
+    (name, start_date) hoppar över dem som redan finns, även när två synkar
+    körs samtidigt.
+    """
+
+    def __init__(self, url, role_mapping, timeout=10):
+        self.url = url
+        self.role_mapping = role_mapping
+        self.timeout = timeout
+
+    def load_state(self):
+        return db.session.get(CalendarSyncState, self.url)
+
+    def fetch(self, state=None):
+        """Returnerar (innehåll, valideringsdata), eller (None, None) om
+        kalendern inte har ändrats sedan state."""
+        etag = state.etag if state else None
+        last_modified = state.last_modified if state else None
+
+        parsed = urlparse(self.url)
+        if parsed.scheme in ('http', 'https'):
+            import requests
+
+            headers = {}
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+            response = requests.get(self.url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304:
+                return None, None
+            response.raise_for_status()
+
+            validators = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            content = response.content
+        else:
+            # Lokal fil (file:// eller sökväg), används vid utveckling och test
+            path = parsed.path if parsed.scheme == 'file' else self.url
+            modified = formatdate(os.path.getmtime(path), usegmt=True)
+            if modified == last_modified:
+                return None, None
+            validators = {'etag': None, 'last_modified': modified}
+            with open(path, 'rb') as f:
+                content = f.read()
+
+        return content, validators
+
+    def parse_events(self, content):
+        """Tolkar VEVENTs från iCal-datan till rader för activities-tabellen."""
+        from icalendar import Calendar
+
+        cal = Calendar.from_ical(content.decode('utf-8'))
+        one_month_ago = datetime.utcnow() - timedelta(days=30)
+
+        rows = []
+        for component in cal.walk('VEVENT'):
+            summary = str(component.get('summary'))
+            scout_level = None
+            if "//" in summary:
+                scout_level = summary.split("//")[-1].split('-')[0].strip()
+
+            # Map the scout level from the summary to the correct role_id
+            role_id = self.role_mapping.get(scout_level.lower()) if scout_level else None
+            if not role_id:
+                continue
+
+            start_date = _as_datetime(component.get('dtstart').dt)
+            if start_date < one_month_ago:
+                continue
+
+            rows.append({
+                'name': summary,
+                'start_date': start_date,
+                'end_date': _as_datetime(component.get('dtend').dt) if component.get('dtend') else None,
+                'role_id': role_id,
+                'address': str(component.get('location')),
+                'description': str(component.get('description')).split("Aktiviteten hämtad")[0].strip(),
+                'is_visible': True  # Default to visible
+            })
+        return rows
+
+    def sync(self):
+        """Kör en synk. Returnerar antalet nya aktiviteter.
+
+        Valideringsdatan sparas bara om synken lyckas. Vid fel rullar
+        anroparen tillbaka, så nästa synk hämtar och försöker igen.
+        """
+        state = self.load_state()
+        content, validators = self.fetch(state)
+        if content is None:
+            return 0
+
+        content_hash = hashlib.sha256(content).hexdigest()
+        added = 0
+        if state is None or content_hash != state.content_hash:
+            added = self._store(self.parse_events(content))
+        # Nya valideringsdata sparas även när innehållet är detsamma, annars
+        # hämtas samma kalender igen vid varje synk
+        self._save_state(content_hash=content_hash, **validators)
+        db.session.commit()
+        return added
+
+    def _store(self, rows):
+        if not rows:
+            return 0
+
+        stmt = (
+            dialect_insert(Activity)
+            .on_conflict_do_nothing(index_elements=['name', 'start_date'])
+            .returning(Activity.activity_id)
+        )
+        return len(db.session.execute(stmt, rows).all())
+
+    def _save_state(self, **values):
+        values['synced_at'] = datetime.utcnow()
+        stmt = dialect_insert(CalendarSyncState).values(url=self.url, **values)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=['url'], set_=values))
+
+
+def _as_datetime(value):
+    """Heldagshändelser har datum, inte datetime. Tidszonen tas bort eftersom
+    kolumnerna lagrar lokal tid utan tidszon."""
+    if not isinstance(value, datetime) and isinstance(value, date):
+        value = datetime(value.year, value.month, value.day)
+    return value.replace(tzinfo=None) if value.tzinfo else value
+
+
+def create_calendar_sync(app):
+    from routes.activity import role_mapping
+
+    return CalendarSync(app.config['CALENDAR_URL'], role_mapping)
+
+
+def run_calendar_sync(app, calendar_sync):
+    """Kör en synk inom app-kontexten och loggar resultatet."""
+    with app.app_context():
+        try:
+            added = calendar_sync.sync()
+            if added:
+                app.logger.info(f"Calendar sync added {added} activities.")
+            return added
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Calendar sync failed: {e}")
+            return 0
+
+
+def start_calendar_sync(app):
+    """Startar en bakgrundsuppgift som synkar kalendern med jämna mellanrum."""
+    interval = app.config['CALENDAR_SYNC_INTERVAL']
+    if interval <= 0:
+        return None
+
+    calendar_sync = create_calendar_sync(app)
+
+    def worker():
+        while True:
+            run_calendar_sync(app, calendar_sync)
+            socketio.sleep(interval)
+
+    return socketio.start_background_task(worker)
+
+
+def init_calendar_sync(app):
+    app.config.setdefault('CALENDAR_URL', os.getenv('CALENDAR_URL', DEFAULT_CALENDAR_URL))
+    app.config.setdefault('CALENDAR_SYNC_INTERVAL', int(os.getenv('CALENDAR_SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL)))
+
+    @app.cli.command('sync-calendar')
+    def sync_calendar_command():
+        """Synkar den externa kalendern en gång."""
+        added = run_calendar_sync(app, create_calendar_sync(app))
+        print(f"Calendar sync done, {added} new activities.")
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import threading
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import select
+from cache import TTLCache
+from extensions import db
+from models.auth_model import ParentChildLink
+from models.carpool_model import Car, Carpool, Passenger
+
+# body är färdigserialiserad JSON, version är aktivitetens version när den byggdes
+Snapshot = namedtuple('Snapshot', 'version body etag')
+
+
+class CarpoolSnapshotCache:
+    """Cache med färdigserialiserade carpool-listor per aktivitet.
+
+    Varje aktivitet har ett versionsnummer som räknas upp när något i listan
+    ändras, och en ögonblicksbild gäller bara för den version den byggdes
+    mot. Versionen läses innan listan byggs, så en lista som byggs samtidigt
+    som en ändring committas sparas under den gamla versionen och visas
+    aldrig. Med en delad backend (Redis) ligger versionerna och listorna där,
+    och processernas lokala LRU valideras mot den delade versionen vid
+    varje läsning.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, shared=None):
+        self.ttl = ttl
+        self.local = TTLCache(maxsize, ttl)
+        self.shared = shared
+        self.shared_hits = 0
+        self._versions = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def version(self, activity_id):
+        if self.shared is None:
+            with self._lock:
+                return f"{self._generation}.{self._versions.get(activity_id, 0)}"
+        generation, version = self.shared.get_many('generation', f'version:{activity_id}')
+        return f"{generation or 0}.{version or 0}"
+
+    def get(self, activity_id):
+        """Returnerar (snapshot, version). snapshot är None vid miss, och version
+        ska då skickas med till put när listan har byggts."""
+        version = self.version(activity_id)
+        snapshot = self.local.get(activity_id, validate=lambda s: s.version == version)
+        if snapshot is None and self.shared is not None:
+            snapshot = self.shared.get(f'snapshot:{activity_id}:{version}')
+            if snapshot is not None:
+                with self._lock:
+                    self.shared_hits += 1
+                self.local.set(activity_id, snapshot)
+        return snapshot, version
+
+    def put(self, activity_id, version, body):
+        snapshot = Snapshot(version, body, hashlib.sha1(body).hexdigest())
+        self.local.set(activity_id, snapshot)
+        if self.shared is not None:
+            self.shared.set(f'snapshot:{activity_id}:{version}', snapshot, timeout=self.ttl)
+        return snapshot
+
+    def invalidate(self, activity_ids):
+        for activity_id in set(activity_ids):
+            if activity_id is None:
+                continue
+            if self.shared is not None:
+                self.shared.inc(f'version:{activity_id}')
+            else:
+                with self._lock:
+                    self._versions[activity_id] = self._versions.get(activity_id, 0) + 1
+            self.local.delete(activity_id)
+
+    def clear(self):
+        """Ogiltigförklarar alla aktiviteter, t.ex. efter en större rensning."""
+        if self.shared is not None:
+            self.shared.inc('generation')
+        else:
+            with self._lock:
+                self._generation += 1
+        self.local.clear()
+
+    def stats(self):
+        stats = self.local.stats()
+        stats['backend'] = 'redis' if self.shared is not None else 'local'
+        stats['shared_hits'] = self.shared_hits
+        return stats
+
+
+def create_shared_backend(url):
+    from cachelib import RedisCache
+    import redis
+
+    return RedisCache(host=redis.from_url(url), key_prefix='carpool_snapshot:')
+
+
+def get_snapshot_cache():
+    return current_app.extensions['carpool_snapshots']
+
+
+def invalidate_activities(activity_ids):
+    """Körs efter commit av en ändring som syns i carpool-listan."""
+    get_snapshot_cache().invalidate(activity_ids)
+
+
+def activity_ids_for_carpools(*criteria):
+    return {activity_id for (activity_id,) in db.session.query(Carpool.activity_id).filter(*criteria).distinct()}
+
+
+def activity_ids_for_user(user_id):
+    """Aktiviteter där användaren syns i listan: som förare, bilägare,
+    passagerare eller förälder till ett barn som åker med."""
+    child_ids = select(ParentChildLink.child_id).where(ParentChildLink.user_id == user_id)
+    passenger_carpools = select(Passenger.carpool_id).where(db.or_(
+        Passenger.user_id == user_id,
+        Passenger.child_id.in_(child_ids)
+    ))
+    return activity_ids_for_carpools(db.or_(
+        Carpool.driver_id == user_id,
+        Carpool.car_id.in_(select(Car.car_id).where(Car.owner_id == user_id)),
+        Carpool.id.in_(passenger_carpools)
+    ))
+
+
+def activity_ids_for_child(child_id):
+    return activity_ids_for_carpools(
+        Carpool.id.in_(select(Passenger.carpool_id).where(Passenger.child_id == child_id))
+    )
+
+
+def init_carpool_snapshots(app):
+    app.config.setdefault('CARPOOL_SNAPSHOT_CACHE_SIZE', int(os.getenv('CARPOOL_SNAPSHOT_CACHE_SIZE', 1024)))
+    app.config.setdefault('CARPOOL_SNAPSHOT_TTL', int(os.getenv('CARPOOL_SNAPSHOT_TTL', 300)))
+    # Delad cache för flera processer, t.ex. redis://localhost:6379/1. Utan den
+    # har varje process en egen cache som bara ogiltigförklaras av egna ändringar.
+    app.config.setdefault('CARPOOL_SNAPSHOT_REDIS_URL', os.getenv('CARPOOL_SNAPSHOT_REDIS_URL'))
+
+    url = app.config['CARPOOL_SNAPSHOT_REDIS_URL']
+    app.extensions['carpool_snapshots'] = CarpoolSnapshotCache(
+        maxsize=app.config['CARPOOL_SNAPSHOT_CACHE_SIZE'],
+        ttl=app.config['CARPOOL_SNAPSHOT_TTL'],
+        shared=create_shared_backend(url) if url else None,
+    )
@@ -0,0 +1,178 @@
+import os
+import click
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import inspect, select
+from extensions import db
+from models.activity_model import Activity
+from models.auth_model import Child, ParentChildLink, RoleVersion, User, UserRole
+from models.carpool_model import Car, Carpool, Passenger
+from models.message_model import CarpoolMessage
+from models.notifications_model import Notification, NotificationState, UnreadCounter
+from unread_counters import rebuild_unread_counters
+from carpool_snapshots import activity_ids_for_user, get_snapshot_cache
+
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_ACTIVITY_RETENTION_DAYS = 90
+
+
+class Cleanup:
+    """Raderar objektgrafer med mängdbaserade DELETE i bitar.
+
+    Varje bit är högst chunk_size rader och committas för sig, så att en stor
+    rensning inte håller skrivlåset länge. Beroende tabeller töms före sina
+    föräldrar, så ett avbrott lämnar inga hängande referenser och rensningen
+    kan köras om. counts håller antal raderade rader per tabell.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.counts = Counter()
+
+    def delete_where(self, model, *criteria):
+        """Raderar alla rader som matchar criteria, högst chunk_size per transaktion."""
+        table = model.__tablename__
+        primary_key = inspect(model).primary_key
+
+        # Tabeller med sammansatt nyckel har få rader per användare/samåkning
+        if len(primary_key) != 1:
+            self.counts[table] += db.session.query(model).filter(*criteria).delete(synchronize_session=False)
+            db.session.commit()
+            return
+
+        pk = primary_key[0]
+        while True:
+            ids = [row[0] for row in db.session.query(pk).filter(*criteria).limit(self.chunk_size)]
+            if not ids:
+                return
+            self.counts[table] += db.session.query(model).filter(pk.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            if len(ids) < self.chunk_size:
+                return
+
+    def delete_carpools(self, *criteria):
+        """Raderar samåkningar med passagerare, meddelanden och notiser."""
+        while True:
+            carpool_ids = [carpool_id for (carpool_id,) in db.session.query(Carpool.id).filter(*criteria).limit(self.chunk_size)]
+            if not carpool_ids:
+                return
+            self.delete_where(Notification, Notification.carpool_id.in_(carpool_ids))
+            self.delete_where(UnreadCounter, UnreadCounter.carpool_id.in_(carpool_ids))
+            self.delete_where(NotificationState, NotificationState.carpool_id.in_(carpool_ids))
+            self.delete_where(CarpoolMessage, CarpoolMessage.carpool_id.in_(carpool_ids))
+            self.delete_where(Passenger, Passenger.carpool_id.in_(carpool_ids))
+            self.delete_where(Carpool, Carpool.id.in_(carpool_ids))
+
+    def delete_passengers(self, *criteria):
+        """Raderar passagerare och ger tillbaka deras platser, i samma bit och
+        transaktion som raderingen."""
+        while True:
+            rows = db.session.query(Passenger.id, Passenger.carpool_id).filter(*criteria).limit(self.chunk_size).all()
+            if not rows:
+                return
+            self.counts[Passenger.__tablename__] += (
+                db.session.query(Passenger)
+                .filter(Passenger.id.in_([passenger_id for passenger_id, _ in rows]))
+                .delete(synchronize_session=False)
+            )
+            for carpool_id, released in Counter(carpool_id for _, carpool_id in rows).items():
+                Carpool.query.filter_by(id=carpool_id).update(
+                    {Carpool.available_seats: Carpool.available_seats + released}, synchronize_session=False
+                )
+            db.session.commit()
+            if len(rows) < self.chunk_size:
+                return
+
+    def delete_activities(self, *criteria):
+        activity_ids = select(Activity.activity_id).where(*criteria)
+        self.delete_carpools(Carpool.activity_id.in_(activity_ids))
+        self.delete_where(Activity, *criteria)
+
+    def delete_user(self, user_id):
+        """Raderar användaren med notiser, samåkningar, bilar, meddelanden och
+        barn som inte längre har någon annan förälder."""
+        child_ids = [child_id for (child_id,) in db.session.query(ParentChildLink.child_id).filter_by(user_id=user_id)]
+
+        # Samåkningar som användaren kör eller som använder användarens bilar
+        self.delete_carpools(db.or_(
+            Carpool.driver_id == user_id,
+            Carpool.car_id.in_(select(Car.car_id).where(Car.owner_id == user_id))
+        ))
+        self.delete_where(Car, Car.owner_id == user_id)
+
+        # Användarens meddelanden i andra samåkningar och andras notiser om dem
+        sent_messages = select(CarpoolMessage.id).where(CarpoolMessage.sender_id == user_id)
+        affected_users = [
+            notified_id for (notified_id,) in
+            db.session.query(Notification.user_id).filter(Notification.message_id.in_(sent_messages)).distinct()
+        ]
+        self.delete_where(Notification, Notification.message_id.in_(sent_messages))
+        self.delete_where(CarpoolMessage, CarpoolMessage.sender_id == user_id)
+        if affected_users:
+            rebuild_unread_counters(affected_users)
+
+        self.delete_where(Notification, Notification.user_id == user_id)
+        self.delete_where(UnreadCounter, UnreadCounter.user_id == user_id)
+        self.delete_where(NotificationState, NotificationState.user_id == user_id)
+        self.delete_passengers(Passenger.user_id == user_id)
+
+        # Barn som inte längre är länkade till någon annan förälder
+        self.delete_where(ParentChildLink, ParentChildLink.user_id == user_id)
+        if child_ids:
+            orphans = select(Child.child_id).where(
+                Child.child_id.in_(child_ids),
+                Child.child_id.notin_(select(ParentChildLink.child_id))
+            )
+            self.delete_passengers(Passenger.child_id.in_(orphans))
+            self.delete_where(Child, Child.child_id.in_(orphans))
+
+        self.delete_where(UserRole, UserRole.user_id == user_id)
+        self.delete_where(RoleVersion, RoleVersion.user_id == user_id)
+        self.delete_where(User, User.user_id == user_id)
+        return dict(self.counts)
+
+
+def expired_activities_filter(retention_days, now=None):
+    """Aktiviteter som har slutat, eller som saknar slut och började för mer än retention_days sedan."""
+    now = now or datetime.utcnow()
+    return db.or_(
+        Activity.end_date < now,
+        db.and_(
+            Activity.end_date.is_(None),
+            Activity.start_date < now - timedelta(days=retention_days)
+        )
+    )
+
+
+def cleanup_activities(app):
+    """Raderar passerade aktiviteter med samåkningar. Returnerar antal per tabell."""
+    cleanup = Cleanup(app.config['CLEANUP_CHUNK_SIZE'])
+    cleanup.delete_activities(expired_activities_filter(app.config['ACTIVITY_RETENTION_DAYS']))
+    if cleanup.counts:
+        get_snapshot_cache().clear()
+    return dict(cleanup.counts)
+
+
+def delete_user(app, user_id):
+    activity_ids = activity_ids_for_user(user_id)
+    deleted = Cleanup(app.config['CLEANUP_CHUNK_SIZE']).delete_user(user_id)
+    get_snapshot_cache().invalidate(activity_ids)
+    return deleted
+
+
+def init_cleanup(app):
+    app.config.setdefault('CLEANUP_CHUNK_SIZE', int(os.getenv('CLEANUP_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)))
+    app.config.setdefault('ACTIVITY_RETENTION_DAYS', int(os.getenv('ACTIVITY_RETENTION_DAYS', DEFAULT_ACTIVITY_RETENTION_DAYS)))
+    # Om passerade aktiviteter ska rensas automatiskt av underhållsjobbet
+    app.config.setdefault('ACTIVITY_CLEANUP_ENABLED', os.getenv('ACTIVITY_CLEANUP_ENABLED', 'False') == 'True')
+
+    @app.cli.command('cleanup-activities')
+    def cleanup_activities_command():
+        """Raderar passerade aktiviteter med samåkningar, meddelanden och notiser."""
+        print(f"Deleted: {cleanup_activities(app)}")
+
+    @app.cli.command('delete-user')
+    @click.argument('user_id', type=int)
+    def delete_user_command(user_id):
+        """Raderar en användare och dess data."""
+        print(f"Deleted: {delete_user(app, user_id)}")
@@ -1,17 +1,131 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO
 from flask_mail import Mail
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine, URL
 import os
+import sqlite3
 
 socketio = SocketIO()
 db = SQLAlchemy()
 mail = Mail()
 
+def init_socketio(app):
+    """Kopplar Socket.IO till appen.
+
+    Med SOCKETIO_MESSAGE_QUEUE (t.ex. redis://localhost:6379/0 eller en Kombu-URL
+    som amqp://) når emit till rummen klienter i alla processer, inte bara den
+    egna. memory:// går via Kombus minnestransport och fungerar bara inom en
+    process, vilket räcker för test. Utan kö används en lokal rumshanterare.
+    """
+    app.config.setdefault('SOCKETIO_MESSAGE_QUEUE', os.getenv('SOCKETIO_MESSAGE_QUEUE'))
+    app.config.setdefault('SOCKETIO_CHANNEL', os.getenv('SOCKETIO_CHANNEL', 'flask-socketio'))
+    # threading, eventlet eller gevent. Utan värde väljs det bästa installerade.
+    app.config.setdefault('SOCKETIO_ASYNC_MODE', os.getenv('SOCKETIO_ASYNC_MODE') or None)
+    origins = os.getenv('CORS_ALLOWED_ORIGINS')
+    app.config.setdefault('CORS_ALLOWED_ORIGINS', origins.split(',') if origins else '*')
+
+    socketio.init_app(
+        app,
+        message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'],
+        channel=app.config['SOCKETIO_CHANNEL'],
+        async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+        cors_allowed_origins=app.config['CORS_ALLOWED_ORIGINS'],
+    )
+
+
 def init_mail(app):
-    app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.mailtrap.io')
-    app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 2525))
-    app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
-    app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
-    app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'True') == 'True'
-    app.config['MAIL_USE_SSL'] = os.getenv('MAIL_USE_SSL', 'False') == 'True'
-    mail.init_app(app)
\ No newline at end of file
+    app.config.setdefault('MAIL_SERVER', os.getenv('MAIL_SERVER', 'smtp.mailtrap.io'))
+    app.config.setdefault('MAIL_PORT', int(os.getenv('MAIL_PORT', 2525)))
+    app.config.setdefault('MAIL_USERNAME', os.getenv('MAIL_USERNAME', ''))
+    app.config.setdefault('MAIL_PASSWORD', os.getenv('MAIL_PASSWORD', ''))
+    app.config.setdefault('MAIL_USE_TLS', os.getenv('MAIL_USE_TLS', 'True') == 'True')
+    app.config.setdefault('MAIL_USE_SSL', os.getenv('MAIL_USE_SSL', 'False') == 'True')
+    # Avsändare för mejl som inte anger någon egen, bl.a. alla mejl från utkorgen
+    app.config.setdefault('MAIL_DEFAULT_SENDER', os.getenv('MAIL_DEFAULT_SENDER', 'redo@kustscoutjonstorp.com'))
+    mail.init_app(app)
+
+
+def database_uri(basedir):
+    """Databas-URI från miljön: DATABASE_URL, DB_*-variablerna (PostgreSQL) eller lokal SQLite."""
+    url = os.getenv('DATABASE_URL')
+    if url:
+        # Vissa värdar ger ut postgres://, vilket SQLAlchemy inte längre accepterar
+        if url.startswith('postgres://'):
+            url = 'postgresql://' + url[len('postgres://'):]
+        return url
+
+    if os.getenv('DB_HOST'):
+        return URL.create(
+            'postgresql+psycopg2',
+            username=os.getenv('DB_USERNAME'),
+            password=os.getenv('DB_PASSWORD'),
+            host=os.getenv('DB_HOST'),
+            port=int(os.getenv('DB_PORT', 5432)),
+            database=os.getenv('DB_NAME'),
+        ).render_as_string(hide_password=False)
+
+    return f"sqlite:///{os.path.join(basedir, 'instance', 'users.db')}"
+
+
+def engine_options(uri):
+    statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT', 30000))  # millisekunder
+    if uri.startswith('sqlite'):
+        # busy_timeout sätts även som PRAGMA i _set_sqlite_pragmas
+        return {'connect_args': {'timeout': statement_timeout / 1000}}
+
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': True,
+        'connect_args': {'options': f'-c statement_timeout={statement_timeout}'},
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    busy_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT', 30000))
+    cursor = dbapi_connection.cursor()
+    # WAL låter läsningar fortsätta medan chatten skriver
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+def init_db(app, basedir):
+    uri = app.config.setdefault('SQLALCHEMY_DATABASE_URI', database_uri(basedir))
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(uri))
+
+    if uri.startswith('sqlite'):
+        # DB local storage
+        os.makedirs(os.path.join(basedir, 'instance'), exist_ok=True)
+        if not event.contains(Engine, 'connect', _set_sqlite_pragmas):
+            event.listen(Engine, 'connect', _set_sqlite_pragmas)
+
+    db.init_app(app)
+
+
+def dialect_insert(model):
+    """insert() för aktuell dialekt, med stöd för ON CONFLICT (SQLite och PostgreSQL)."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+
+def check_database(app):
+    """Kontrollerar vid uppstart att databasen går att nå och loggar dess läge."""
+    with app.app_context():
+        with db.engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+            if db.engine.dialect.name == 'sqlite':
+                journal_mode = connection.execute(text('PRAGMA journal_mode')).scalar()
+                app.logger.info(f"Database: SQLite ({journal_mode} journal)")
+            else:
+                app.logger.info(f"Database: {db.engine.dialect.name}, pool size {db.engine.pool.size()}")
@@ -0,0 +1,175 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from extensions import db, mail, socketio
+from models.mail_model import OutboundEmail
+
+def enqueue_email(subject, recipients, body, html=None, sender=None, commit=True):
+    """Lägger ett e-postmeddelande i utkorgen. Skickas av MailOutboxWorker.
+    Med commit=False sparas det med anroparens transaktion."""
+    email = OutboundEmail(
+        subject=subject,
+        sender=sender,
+        recipients=json.dumps(list(recipients)),
+        body=body,
+        html=html,
+        status='pending',
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(email)
+    if commit:
+        db.session.commit()
+    return email
+
+
+class MailOutboxWorker:
+    """Skickar e-post från utkorgen i batchar över en återanvänd SMTP-anslutning.
+
+    Rader reserveras med en villkorad UPDATE och ett lease, så flera processer
+    kan köra workern samtidigt utan att skicka samma meddelande två gånger.
+    Misslyckade försök görs om med exponentiell backoff.
+    """
+
+    def __init__(self, batch_size=50, max_attempts=5, backoff=30, lease=300, keepalive=60):
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.keepalive = keepalive
+        self._connection = None
+        self._last_used = 0
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = mail.connect()
+            self._connection.__enter__()
+        self._last_used = time.monotonic()
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            try:
+                self._connection.__exit__(None, None, None)
+            except Exception:
+                pass
+            self._connection = None
+
+    def _claim(self, email, now):
+        """Reserverar raden åt denna worker. Returnerar False om någon annan hann före."""
+        claimed = OutboundEmail.query.filter_by(
+            id=email.id, status=email.status, next_attempt_at=email.next_attempt_at
+        ).update({
+            'status': 'sending',
+            'attempts': OutboundEmail.attempts + 1,
+            'next_attempt_at': now + timedelta(seconds=self.lease)
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    def _message(self, email):
+        from flask_mail import Message
+
+        msg = Message(
+            subject=email.subject,
+            recipients=json.loads(email.recipients),
+            body=email.body,
+            sender=email.sender or current_app.config['MAIL_DEFAULT_SENDER']
+        )
+        msg.html = email.html
+        return msg
+
+    def run_once(self):
+        """Skickar en batch. Returnerar antalet skickade meddelanden."""
+        now = datetime.utcnow()
+        due = (
+            OutboundEmail.query
+            .filter(OutboundEmail.status.in_(['pending', 'sending']), OutboundEmail.next_attempt_at <= now)
+            .order_by(OutboundEmail.next_attempt_at, OutboundEmail.id)
+            .limit(self.batch_size)
+            .all()
+        )
+
+        if not due:
+            if self._connection is not None and time.monotonic() - self._last_used > self.keepalive:
+                self.close()
+            return 0
+
+        sent = 0
+        for email in due:
+            if not self._claim(email, now):
+                continue
+
+            try:
+                self._connect().send(self._message(email))
+            except Exception as e:
+                # Anslutningen kan vara trasig, öppna en ny vid nästa försök
+                self.close()
+                email.last_error = str(e)
+                if email.attempts >= self.max_attempts:
+                    email.status = 'failed'
+                else:
+                    email.status = 'pending'
+                    email.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.backoff * 2 ** (email.attempts - 1))
+            else:
+                email.status = 'sent'
+                email.sent_at = datetime.utcnow()
+                email.last_error = None
+                sent += 1
+            db.session.commit()
+
+        return sent
+
+
+def create_mail_outbox_worker(app):
+    return MailOutboxWorker(
+        batch_size=app.config['MAIL_OUTBOX_BATCH_SIZE'],
+        max_attempts=app.config['MAIL_OUTBOX_MAX_ATTEMPTS'],
+        backoff=app.config['MAIL_OUTBOX_BACKOFF']
+    )
+
+
+def run_mail_outbox(app, worker):
+    with app.app_context():
+        try:
+            return worker.run_once()
+        except Exception as e:
+            db.session.rollback()
+            worker.close()
+            app.logger.error(f"Mail outbox failed: {e}")
+            return 0
+
+
+def start_mail_outbox(app):
+    """Startar en bakgrundsuppgift som tömmer utkorgen."""
+    interval = app.config['MAIL_OUTBOX_POLL_INTERVAL']
+    if interval <= 0:
+        return None
+
+    worker = create_mail_outbox_worker(app)
+
+    def loop():
+        while True:
+            # Töm utkorgen direkt om batchen var full, annars vänta
+            if run_mail_outbox(app, worker) < worker.batch_size:
+                socketio.sleep(interval)
+
+    return socketio.start_background_task(loop)
+
+
+def init_mail_outbox(app):
+    app.config.setdefault('MAIL_OUTBOX_POLL_INTERVAL', float(os.getenv('MAIL_OUTBOX_POLL_INTERVAL', 2)))
+    app.config.setdefault('MAIL_OUTBOX_BATCH_SIZE', int(os.getenv('MAIL_OUTBOX_BATCH_SIZE', 50)))
+    app.config.setdefault('MAIL_OUTBOX_MAX_ATTEMPTS', int(os.getenv('MAIL_OUTBOX_MAX_ATTEMPTS', 5)))
+    app.config.setdefault('MAIL_OUTBOX_BACKOFF', int(os.getenv('MAIL_OUTBOX_BACKOFF', 30)))
+
+    @app.cli.command('send-mail')
+    def send_mail_command():
+        """Skickar allt i utkorgen som är redo att skickas."""
+        worker = create_mail_outbox_worker(app)
+        total = 0
+        while (sent := run_mail_outbox(app, worker)) > 0:
+            total += sent
+        worker.close()
+        print(f"Sent {total} emails.")
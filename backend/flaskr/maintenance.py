@@ -0,0 +1,107 @@
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from cleanup import cleanup_activities
+from extensions import db, socketio
+from models.mail_model import OutboundEmail
+from models.notifications_model import Notification
+from notification_state import get_state_store
+
+DEFAULT_MAINTENANCE_INTERVAL = 24 * 3600  # sekunder
+
+
+def purge_read_notifications(retention_days, user_id=None, carpool_id=None, notif_type=None):
+    """Raderar lästa notiser som är äldre än retention_days med en enda DELETE.
+
+    Det finns ingen tidpunkt för när en notis lästes, så åldern räknas från
+    created_at. Committar inte, det gör anroparen.
+    """
+    query = Notification.query.filter(Notification.is_read == True)
+    if retention_days > 0:
+        query = query.filter(Notification.created_at < datetime.utcnow() - timedelta(days=retention_days))
+    if user_id is not None:
+        query = query.filter(Notification.user_id == user_id)
+    if carpool_id is not None:
+        query = query.filter(Notification.carpool_id == carpool_id)
+    if notif_type == 'chat':
+        query = query.filter(Notification.message_id.isnot(None))
+    elif notif_type == 'passenger':
+        query = query.filter(Notification.message_id.is_(None))
+    return query.delete(synchronize_session=False)
+
+
+def purge_sent_mail(retention_days):
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    return OutboundEmail.query.filter(
+        OutboundEmail.status.in_(['sent', 'failed']), OutboundEmail.created_at < cutoff
+    ).delete(synchronize_session=False)
+
+
+def vacuum():
+    """Återlämnar utrymme efter rensningen. SQLite saknar VACUUM per tabell,
+    så där komprimeras hela filen och WAL-filen trunkeras."""
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if db.engine.dialect.name == 'sqlite':
+            connection.execute(text('VACUUM'))
+            connection.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+        elif db.engine.dialect.name == 'postgresql':
+            connection.execute(text(f'VACUUM (ANALYZE) {Notification.__tablename__}'))
+
+
+def compact(app):
+    """Rensar lästa notiser, utgånget notistillstånd, gammal e-post och, om
+    ACTIVITY_CLEANUP_ENABLED, passerade aktiviteter. Vakuumar sedan."""
+    notifications = purge_read_notifications(app.config['NOTIFICATION_RETENTION_DAYS'])
+    mail = purge_sent_mail(app.config['MAIL_OUTBOX_RETENTION_DAYS'])
+    db.session.commit()
+    state = get_state_store().purge_expired()
+
+    removed = {'notifications': notifications, 'mail': mail, 'notification_state': state}
+    if app.config['ACTIVITY_CLEANUP_ENABLED']:
+        removed['activities'] = cleanup_activities(app)
+
+    if app.config['MAINTENANCE_VACUUM']:
+        vacuum()
+    return removed
+
+
+def run_maintenance(app):
+    with app.app_context():
+        try:
+            removed = compact(app)
+            app.logger.info(f"Maintenance removed {removed}.")
+            return removed
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Maintenance failed: {e}")
+            return None
+
+
+def start_maintenance(app):
+    """Startar en bakgrundsuppgift som kör compact() med jämna mellanrum."""
+    interval = app.config['MAINTENANCE_INTERVAL']
+    if interval <= 0:
+        return None
+
+    def worker():
+        while True:
+            socketio.sleep(interval)
+            run_maintenance(app)
+
+    return socketio.start_background_task(worker)
+
+
+def init_maintenance(app):
+    # 0 betyder att lästa notiser raderas direkt när de markeras som lästa
+    app.config.setdefault('NOTIFICATION_RETENTION_DAYS', int(os.getenv('NOTIFICATION_RETENTION_DAYS', 0)))
+    app.config.setdefault('MAIL_OUTBOX_RETENTION_DAYS', int(os.getenv('MAIL_OUTBOX_RETENTION_DAYS', 30)))
+    app.config.setdefault('MAINTENANCE_INTERVAL', int(os.getenv('MAINTENANCE_INTERVAL', DEFAULT_MAINTENANCE_INTERVAL)))
+    # VACUUM låser hela SQLite-filen medan det pågår, så det är avstängt som
+    # standard. Slå på det bara om underhållet körs när appen inte används.
+    app.config.setdefault('MAINTENANCE_VACUUM', os.getenv('MAINTENANCE_VACUUM', 'False') == 'True')
+
+    @app.cli.command('compact-db')
+    def compact_db_command():
+        """Rensar gamla rader, och vakuumar databasen om MAINTENANCE_VACUUM är på."""
+        with app.app_context():
+            print(f"Removed: {compact(app)}")
@@ -0,0 +1,180 @@
+import os
+import queue
+import threading
+import time
+from flask import current_app
+from extensions import db, socketio
+from models.message_model import CarpoolMessage
+
+
+class PendingMessage:
+    """Ett chattmeddelande som väntar på att skrivas. done sätts när det är sparat
+    (message_id satt) eller har misslyckats (error satt).
+
+    Meddelandet går från queued till writing när skrivaren tar det, eller till
+    cancelled om avsändaren ger upp innan dess. Ett avbrutet meddelande sparas
+    aldrig, så klienten kan skicka det igen utan att det blir en dubblett.
+    """
+
+    def __init__(self, carpool_id, sender_id, sender_name, content, timestamp, destination=None):
+        self.carpool_id = carpool_id
+        self.sender_id = sender_id
+        self.sender_name = sender_name
+        self.content = content
+        self.timestamp = timestamp  # tidszonsmedveten UTC
+        self.destination = destination
+        self.message_id = None
+        self.error = None
+        self.done = threading.Event()
+        self._state = 'queued'
+        self._state_lock = threading.Lock()
+
+    def _transition(self, state):
+        with self._state_lock:
+            if self._state != 'queued':
+                return False
+            self._state = state
+            return True
+
+    def claim(self):
+        """Anropas av skrivaren. Returnerar False om meddelandet redan är avbrutet."""
+        return self._transition('writing')
+
+    def cancel(self):
+        """Tar bort meddelandet ur kön. Returnerar False om skrivaren redan har tagit det."""
+        return self._transition('cancelled')
+
+    def to_model(self):
+        return CarpoolMessage(
+            sender_id=self.sender_id,
+            carpool_id=self.carpool_id,
+            content=self.content,
+            timestamp=self.timestamp.replace(tzinfo=None),  # UTC i databasen
+            status='sent'
+        )
+
+    def wait(self, timeout):
+        return self.done.wait(timeout)
+
+
+class MessageWriter:
+    """Skriver chattmeddelanden i små batchar.
+
+    Meddelanden som kommer inom samma korta fönster sparas i en transaktion.
+    En enda skrivare per process behandlar kön i ordning och skickar
+    new_message till rummet efter commit, så klienterna ser meddelandena i
+    samma ordning som de sparades.
+
+    Funktioner registrerade med before_commit körs i batchens transaktion,
+    så att det som hör till meddelandena sparas i samma commit.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._hooks = []
+
+    def before_commit(self, hook):
+        """Registrerar hook(batch), som körs efter flush med message_id satt och
+        före commit. Den får inte committa själv. Returnerar den en funktion
+        anropas den efter commit, t.ex. för att skicka socket-händelser."""
+        self._hooks.append(hook)
+        return hook
+
+    def submit(self, pending):
+        self._start(current_app._get_current_object())
+        self._queue.put(pending)
+        return pending
+
+    def _start(self, app):
+        if self._started:
+            return
+        with self._lock:
+            if not self._started:
+                socketio.start_background_task(self._run, app)
+                self._started = True
+
+    def _next_batch(self, window, max_size):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + window
+        while len(batch) < max_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, app):
+        window = app.config['MESSAGE_BATCH_WINDOW_MS'] / 1000
+        max_size = app.config['MESSAGE_BATCH_SIZE']
+        while True:
+            # Meddelanden som avsändaren redan har gett upp hoppas över
+            batch = [pending for pending in self._next_batch(window, max_size) if pending.claim()]
+            if not batch:
+                continue
+            with app.app_context():
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    app.logger.error(f"Message writer failed: {e}")
+                    for pending in batch:
+                        pending.error = pending.error or str(e)
+                finally:
+                    for pending in batch:
+                        pending.done.set()
+
+    def _write(self, batch):
+        try:
+            after_commit = self._commit(batch)
+        except Exception:
+            db.session.rollback()
+            after_commit = []
+            # Spara ett i taget så att ett trasigt meddelande inte fäller hela batchen
+            for pending in batch:
+                try:
+                    after_commit.extend(self._commit([pending]))
+                except Exception as e:
+                    db.session.rollback()
+                    pending.message_id = None
+                    pending.error = str(e)
+
+        for pending in batch:
+            if pending.error is None:
+                self._emit(pending)
+        for callback in after_commit:
+            callback()
+
+    def _commit(self, batch):
+        messages = [pending.to_model() for pending in batch]
+        db.session.add_all(messages)
+        # Läs id:n före commit, annars laddas varje objekt om efteråt
+        db.session.flush()
+        for pending, message in zip(batch, messages):
+            pending.message_id = message.id
+        after_commit = [hook(batch) for hook in self._hooks]
+        db.session.commit()
+        return [callback for callback in after_commit if callback]
+
+    def _emit(self, pending):
+        socketio.emit('new_message', {
+            'carpool_id': pending.carpool_id,
+            'message': {
+                'id': pending.message_id,
+                'sender_id': pending.sender_id,
+                'sender_name': pending.sender_name,
+                'content': pending.content,
+                'timestamp': pending.timestamp.astimezone().isoformat()  # Sending local time to clients
+            }
+        }, room=f'carpool_{pending.carpool_id}')
+
+
+message_writer = MessageWriter()
+
+
+def init_message_writer(app):
+    # Hur länge skrivaren väntar på fler meddelanden innan en batch sparas
+    app.config.setdefault('MESSAGE_BATCH_WINDOW_MS', float(os.getenv('MESSAGE_BATCH_WINDOW_MS', 5)))
+    app.config.setdefault('MESSAGE_BATCH_SIZE', int(os.getenv('MESSAGE_BATCH_SIZE', 200)))
+    app.config.setdefault('MESSAGE_WRITE_TIMEOUT', float(os.getenv('MESSAGE_WRITE_TIMEOUT', 10)))
@@ -0,0 +1,222 @@
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import inspect, text
+from extensions import db
+
+
+class SchemaVersion(db.Model):
+    __tablename__ = 'schema_version'
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(255), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+def create_tables():
+    # Importera alla modeller så att de finns i metadatan
+    import models.activity_model
+    import models.auth_model
+    import models.carpool_model
+    import models.mail_model
+    import models.message_model
+    import models.notifications_model
+
+    db.create_all()
+
+
+def upgrade_indexes(unique=True):
+    """Skapar index som saknas i en befintlig databas (t.ex. en äldre users.db).
+
+    db.create_all() skapar bara tabeller som saknas, så index som lagts till i
+    modellerna i efterhand måste skapas separat. Med unique=False hoppas unika
+    index över, eftersom befintliga data kan ha dubbletter som först måste
+    rensas (se unique_passengers och unique_activities).
+    """
+    inspector = inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.unique and not unique:
+                continue
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                created.append(index.name)
+    return created
+
+
+def upgrade_plain_indexes():
+    """Index för steg som körs innan dubbletterna har rensats."""
+    return upgrade_indexes(unique=False)
+
+
+def create_unique_indexes(table):
+    """Skapar tabellens unika index som saknas, efter att dubbletterna har rensats."""
+    existing = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.unique and index.name not in existing:
+            index.create(bind=db.engine)
+
+
+def create_mail_outbox():
+    from models.mail_model import OutboundEmail
+
+    OutboundEmail.__table__.create(bind=db.engine, checkfirst=True)
+    upgrade_plain_indexes()
+
+
+def create_notification_state():
+    from models.notifications_model import NotificationState
+
+    NotificationState.__table__.create(bind=db.engine, checkfirst=True)
+    upgrade_plain_indexes()
+
+
+def replace_message_index():
+    # (carpool_id, timestamp, id) ersätter (carpool_id, timestamp) för keyset-paginering
+    inspector = inspect(db.engine)
+    if 'ix_carpoolmessage_carpool_timestamp' in {index['name'] for index in inspector.get_indexes('carpoolmessage')}:
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP INDEX ix_carpoolmessage_carpool_timestamp'))
+    upgrade_plain_indexes()
+
+
+def create_unread_counters():
+    from models.notifications_model import UnreadCounter
+    from unread_counters import rebuild_unread_counters
+
+    UnreadCounter.__table__.create(bind=db.engine, checkfirst=True)
+    rebuild_unread_counters()
+
+
+def unique_passengers():
+    """Tar bort dubbletter bland passagerarna och ger tillbaka deras platser,
+    så att de unika indexen kan skapas."""
+    from models.carpool_model import Carpool, Passenger
+
+    duplicates = {}
+    for key in (Passenger.child_id, Passenger.user_id):
+        keep = (
+            db.session.query(db.func.min(Passenger.id))
+            .filter(key.isnot(None))
+            .group_by(Passenger.carpool_id, Passenger.child_id, key)
+        )
+        for passenger_id, carpool_id in (
+            db.session.query(Passenger.id, Passenger.carpool_id)
+            .filter(key.isnot(None), Passenger.id.notin_(keep))
+        ):
+            duplicates[passenger_id] = carpool_id
+
+    if duplicates:
+        Passenger.query.filter(Passenger.id.in_(list(duplicates))).delete(synchronize_session=False)
+        for carpool_id, released in Counter(duplicates.values()).items():
+            Carpool.query.filter_by(id=carpool_id).update(
+                {Carpool.available_seats: Carpool.available_seats + released}, synchronize_session=False
+            )
+        db.session.commit()
+    upgrade_plain_indexes()
+    create_unique_indexes(Passenger.__table__)
+
+
+def unique_activities():
+    """Slår ihop aktiviteter med samma namn och starttid, så att det unika
+    indexet som kalendersynken förlitar sig på kan skapas. Samåkningarna
+    flyttas till den aktivitet som behålls."""
+    from carpool_snapshots import invalidate_activities
+    from models.activity_model import Activity, CalendarSyncState
+    from models.carpool_model import Carpool
+
+    CalendarSyncState.__table__.create(bind=db.engine, checkfirst=True)
+
+    kept = {
+        (name, start_date): activity_id
+        for name, start_date, activity_id in db.session.query(
+            Activity.name, Activity.start_date, db.func.min(Activity.activity_id)
+        ).group_by(Activity.name, Activity.start_date)
+    }
+    duplicates = {
+        activity_id: kept[(name, start_date)]
+        for activity_id, name, start_date in db.session.query(Activity.activity_id, Activity.name, Activity.start_date)
+        .filter(Activity.activity_id.notin_(list(kept.values())))
+    }
+
+    if duplicates:
+        for duplicate_id, activity_id in duplicates.items():
+            Carpool.query.filter_by(activity_id=duplicate_id).update(
+                {Carpool.activity_id: activity_id}, synchronize_session=False
+            )
+        Activity.query.filter(Activity.activity_id.in_(list(duplicates))).delete(synchronize_session=False)
+        db.session.commit()
+        invalidate_activities(set(duplicates) | set(duplicates.values()))
+
+    # (name, start_date) utan unique ersätts av det unika indexet
+    if 'ix_activities_name_start' in {index['name'] for index in inspect(db.engine).get_indexes('activities')}:
+        with db.engine.begin() as connection:
+            connection.execute(text('DROP INDEX ix_activities_name_start'))
+    create_unique_indexes(Activity.__table__)
+    upgrade_indexes()
+
+
+# Versionerade migreringar, körs i ordning och bara en gång per databas.
+# Lägg till nya steg sist, ändra aldrig ett steg som redan har släppts.
+MIGRATIONS = [
+    (1, 'initial schema', create_tables),
+    (2, 'indexes for hot query predicates', upgrade_plain_indexes),
+    (3, 'mail outbox', create_mail_outbox),
+    (4, 'shared notification state', create_notification_state),
+    (5, 'chat history keyset index', replace_message_index),
+    (6, 'unread counters', create_unread_counters),
+    (7, 'notification index for message deletes', upgrade_plain_indexes),
+    (8, 'unique passengers per carpool', unique_passengers),
+    (9, 'notification feed index on id', upgrade_plain_indexes),
+    (10, 'calendar sync state and unique activities', unique_activities),
+]
+
+
+def upgrade():
+    """Kör alla migreringar som inte har körts. Returnerar de versioner som kördes."""
+    SchemaVersion.__table__.create(bind=db.engine, checkfirst=True)
+    applied = {version for (version,) in db.session.query(SchemaVersion.version)}
+
+    ran = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        migrate()
+        db.session.add(SchemaVersion(version=version, description=description))
+        db.session.commit()
+        ran.append(version)
+    return ran
+
+
+def seed():
+    """Idempotent seedning av roller, admin, testdata och aktiviteter."""
+    from models.auth_model import User
+    from models.activity_model import Activity
+    from seed_roles import seed_roles
+    from seed_admin import seed_admin
+    from seed_activities import seed_activities
+    from test_data import add_test_data
+
+    seed_roles()
+
+    # Generate test data (users, cars, children etc)
+    if not User.query.first():
+        seed_admin()
+        add_test_data()
+
+    if not Activity.query.first():
+        seed_activities()
+
+
+def init_migrations(app):
+    @app.cli.command('db-upgrade')
+    def db_upgrade_command():
+        """Uppgraderar databasschemat till senaste versionen."""
+        ran = upgrade()
+        print(f"Applied migrations: {ran}" if ran else "Database schema is up to date.")
+
+    @app.cli.command('seed')
+    def seed_command():
+        """Seedar roller och testdata om de saknas."""
+        seed()
+        print("Seeding done.")
@@ -9,4 +9,21 @@ class Activity(db.Model):
     role_id = db.Column(db.Integer, db.ForeignKey('roles.role_id', ondelete='CASCADE'))
     address = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
-    is_visible = db.Column(db.Boolean, nullable=False, default=True) 
\ No newline at end of file
+    is_visible = db.Column(db.Boolean, nullable=False, default=True)
+
+    __table_args__ = (
+        db.Index('ix_activities_start_visible_role', 'start_date', 'is_visible', 'role_id'),
+        # Kalendersynken förlitar sig på att samma händelse bara kan sparas en gång
+        db.Index('uq_activities_name_start', 'name', 'start_date', unique=True),
+    )
+
+
+class CalendarSyncState(db.Model):
+    """Valideringsdata från senaste lyckade synken per kalender, så att en ny
+    process eller ett engångskommando kan göra en villkorad hämtning."""
+    __tablename__ = 'calendar_sync_state'
+    url = db.Column(db.String(512), primary_key=True)
+    etag = db.Column(db.String(255), nullable=True)
+    last_modified = db.Column(db.String(64), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)
+    synced_at = db.Column(db.DateTime, nullable=False)
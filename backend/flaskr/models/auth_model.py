@@ -33,6 +33,14 @@ class UserRole(db.Model):
     role_id = db.Column(db.Integer, db.ForeignKey('roles.role_id', ondelete='CASCADE'), primary_key=True)
 
 
+# Räknare som ökas när en användares roller ändras, så att JWT:er med
+# inbäddade roller från en äldre version kan avvisas.
+class RoleVersion(db.Model):
+    __tablename__ = 'role_version'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id', ondelete='CASCADE'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
 class Child(db.Model):
     __tablename__ = 'children'
     child_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -49,4 +57,9 @@ class ParentChildLink(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id', ondelete='CASCADE'), primary_key=True)
     child_id = db.Column(db.Integer, db.ForeignKey('children.child_id', ondelete='CASCADE'), primary_key=True)
 
+    # Primärnyckeln täcker uppslag på user_id, indexet täcker uppslag på barn
+    __table_args__ = (
+        db.Index('ix_parent_child_link_child_id', 'child_id'),
+    )
+
 
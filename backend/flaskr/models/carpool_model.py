@@ -1,6 +1,6 @@
 from extensions import db
 from datetime import datetime
-from sqlalchemy import Enum, CheckConstraint
+from sqlalchemy import Enum, CheckConstraint, text
 from sqlalchemy.orm import relationship
 
 class Carpool(db.Model):
@@ -20,6 +20,11 @@ class Carpool(db.Model):
 
     carpool_type = db.Column(Enum('drop-off', 'pick-up', 'both', name='carpool_type_enum'), nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_carpool_activity_id', 'activity_id'),
+        db.Index('ix_carpool_driver_id', 'driver_id'),
+    )
+
 class Passenger(db.Model):
     __tablename__ = 'passengers'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -29,6 +34,15 @@ class Passenger(db.Model):
 
     __table_args__ = (
         CheckConstraint('(child_id IS NOT NULL OR user_id IS NOT NULL)', name='check_child_or_user'),
+        db.Index('ix_passengers_carpool_child_user', 'carpool_id', 'child_id', 'user_id'),
+        # Ett barn eller en vuxen kan bara åka med en gång per samåkning
+        db.Index('uq_passengers_carpool_child', 'carpool_id', 'child_id', unique=True),
+        db.Index(
+            'uq_passengers_carpool_user', 'carpool_id', 'user_id', unique=True,
+            sqlite_where=text('child_id IS NULL'), postgresql_where=text('child_id IS NULL')
+        ),
+        db.Index('ix_passengers_child_id', 'child_id'),
+        db.Index('ix_passengers_user_id', 'user_id'),
     )
 
 class Car(db.Model):
@@ -38,4 +52,8 @@ class Car(db.Model):
     reg_number = db.Column(db.String(20), nullable=False, unique=True)
     fuel_type = db.Column(db.String(50), nullable=True)
     consumption = db.Column(db.Float, nullable=True)
-    model_name = db.Column(db.String(255), nullable=True)
\ No newline at end of file
+    model_name = db.Column(db.String(255), nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_cars_owner_id', 'owner_id'),
+    )
@@ -9,4 +9,8 @@ class CarpoolMessage(db.Model):
     carpool_id = db.Column(db.Integer, db.ForeignKey('carpool.id', ondelete='CASCADE'), nullable=True)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), default='sent')
\ No newline at end of file
+    status = db.Column(db.String(20), default='sent')
+
+    __table_args__ = (
+        db.Index('ix_carpoolmessage_carpool_timestamp_id', 'carpool_id', 'timestamp', 'id'),
+    )
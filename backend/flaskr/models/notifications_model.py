@@ -11,8 +11,41 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_notifications_user_read_created', 'user_id', 'is_read', 'created_at'),
+        db.Index('ix_notifications_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_notifications_user_id_id', 'user_id', 'id'),
+        db.Index('ix_notifications_carpool_user_message', 'carpool_id', 'user_id', 'message_id'),
+        # Raderade meddelanden slår upp notiser via message_id (FK-kontroll och cascade)
+        db.Index('ix_notifications_message_id', 'message_id'),
+    )
+
 
     user = db.relationship('User', backref='notifications', lazy=True)
     carpool = db.relationship('Carpool', backref='notifications', lazy=True)
 
-    carpool_message = db.relationship('CarpoolMessage', backref='notifications', lazy=True)
\ No newline at end of file
+    carpool_message = db.relationship('CarpoolMessage', backref='notifications', lazy=True)
+
+class NotificationState(db.Model):
+    """Delat tillstånd per (användare, samåkning) med utgångstid, t.ex. om ett
+    notismejl redan har skickats eller om användaren har chatten öppen."""
+    __tablename__ = 'notification_state'
+    kind = db.Column(db.String(32), primary_key=True)  # email_sent, active
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    carpool_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_notification_state_kind_carpool_expires', 'kind', 'carpool_id', 'expires_at'),
+    )
+
+
+# Antal olästa notiser per användare, samåkning och typ (chat eller passenger).
+# Underhålls i samma transaktion som notiserna, så att räknaren kan läsas utan
+# att notiserna själva behöver räknas.
+class UnreadCounter(db.Model):
+    __tablename__ = 'unread_counter'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id', ondelete='CASCADE'), primary_key=True)
+    carpool_id = db.Column(db.Integer, db.ForeignKey('carpool.id', ondelete='CASCADE'), primary_key=True)
+    type = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
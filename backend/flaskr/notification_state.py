@@ -0,0 +1,165 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from extensions import db, dialect_insert
+from models.notifications_model import NotificationState
+
+EMAIL_SENT = 'email_sent'
+ACTIVE = 'active'
+
+
+class MemoryStateStore:
+    """Tillstånd i processens minne. Räcker med en enda process, t.ex. vid utveckling."""
+
+    def __init__(self):
+        self._data = {}  # (kind, carpool_id) -> {user_id: expires_at}
+        self._lock = threading.Lock()
+
+    def add(self, kind, user_id, carpool_id, ttl, commit=True):
+        """Sätter nyckeln om den saknas eller har gått ut. Returnerar True om den sattes.
+        commit har ingen betydelse här, nyckeln sätts direkt."""
+        now = datetime.utcnow()
+        with self._lock:
+            users = self._data.setdefault((kind, carpool_id), {})
+            expires_at = users.get(user_id)
+            if expires_at is not None and expires_at > now:
+                return False
+            users[user_id] = now + timedelta(seconds=ttl)
+            return True
+
+    def set(self, kind, user_id, carpool_id, ttl):
+        with self._lock:
+            self._data.setdefault((kind, carpool_id), {})[user_id] = datetime.utcnow() + timedelta(seconds=ttl)
+
+    def exists(self, kind, user_id, carpool_id):
+        with self._lock:
+            expires_at = self._data.get((kind, carpool_id), {}).get(user_id)
+            return expires_at is not None and expires_at > datetime.utcnow()
+
+    def delete(self, kind, user_id, carpool_id):
+        with self._lock:
+            users = self._data.get((kind, carpool_id))
+            if users is not None:
+                users.pop(user_id, None)
+                if not users:
+                    del self._data[(kind, carpool_id)]
+
+    def members(self, kind, carpool_id):
+        now = datetime.utcnow()
+        with self._lock:
+            users = self._data.get((kind, carpool_id), {})
+            return {user_id for user_id, expires_at in users.items() if expires_at > now}
+
+    def purge_expired(self):
+        now = datetime.utcnow()
+        removed = 0
+        with self._lock:
+            for key, users in list(self._data.items()):
+                for user_id in [u for u, expires_at in users.items() if expires_at <= now]:
+                    del users[user_id]
+                    removed += 1
+                if not users:
+                    del self._data[key]
+        return removed
+
+
+class DatabaseStateStore:
+    """Tillstånd i tabellen notification_state, delat mellan alla processer.
+
+    add() är en enda INSERT ... ON CONFLICT DO UPDATE som bara skriver över
+    utgångna rader, så två processer kan aldrig båda få True för samma nyckel.
+    """
+
+    def _upsert(self, kind, user_id, carpool_id, ttl, only_expired, commit=True):
+        now = datetime.utcnow()
+        stmt = dialect_insert(NotificationState).values(
+            kind=kind, user_id=user_id, carpool_id=carpool_id,
+            expires_at=now + timedelta(seconds=ttl)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['kind', 'user_id', 'carpool_id'],
+            set_={'expires_at': stmt.excluded.expires_at},
+            where=(NotificationState.expires_at <= now) if only_expired else None
+        )
+        result = db.session.execute(stmt)
+        if commit:
+            db.session.commit()
+        return result.rowcount == 1
+
+    def add(self, kind, user_id, carpool_id, ttl, commit=True):
+        """Sätter nyckeln om den saknas eller har gått ut. Returnerar True om den sattes.
+        Med commit=False ingår raden i den pågående transaktionen och rullas
+        tillbaka med den."""
+        return self._upsert(kind, user_id, carpool_id, ttl, only_expired=True, commit=commit)
+
+    def set(self, kind, user_id, carpool_id, ttl):
+        self._upsert(kind, user_id, carpool_id, ttl, only_expired=False)
+
+    def exists(self, kind, user_id, carpool_id):
+        state = db.session.get(NotificationState, (kind, user_id, carpool_id))
+        return state is not None and state.expires_at > datetime.utcnow()
+
+    def delete(self, kind, user_id, carpool_id):
+        NotificationState.query.filter_by(kind=kind, user_id=user_id, carpool_id=carpool_id).delete()
+        db.session.commit()
+
+    def members(self, kind, carpool_id):
+        rows = db.session.query(NotificationState.user_id).filter(
+            NotificationState.kind == kind,
+            NotificationState.carpool_id == carpool_id,
+            NotificationState.expires_at > datetime.utcnow()
+        )
+        return {user_id for (user_id,) in rows}
+
+    def purge_expired(self):
+        removed = NotificationState.query.filter(NotificationState.expires_at <= datetime.utcnow()).delete()
+        db.session.commit()
+        return removed
+
+
+BACKENDS = {
+    'memory': MemoryStateStore,
+    'database': DatabaseStateStore,
+}
+
+
+def get_state_store():
+    return current_app.extensions['notification_state']
+
+
+def claim_email_notification(user_id, carpool_id, commit=True):
+    """Returnerar True om mejlet ska skickas, False om någon process redan har skickat det."""
+    return get_state_store().add(
+        EMAIL_SENT, user_id, carpool_id, current_app.config['EMAIL_NOTIFICATION_TTL'], commit=commit
+    )
+
+
+def email_notification_sent(user_id, carpool_id):
+    return get_state_store().exists(EMAIL_SENT, user_id, carpool_id)
+
+
+def reset_email_notification(user_id, carpool_id):
+    get_state_store().delete(EMAIL_SENT, user_id, carpool_id)
+
+
+def mark_active(user_id, carpool_id):
+    get_state_store().set(ACTIVE, user_id, carpool_id, current_app.config['ACTIVE_USER_TTL'])
+
+
+def mark_inactive(user_id, carpool_id):
+    get_state_store().delete(ACTIVE, user_id, carpool_id)
+
+
+def active_user_ids(carpool_id):
+    return get_state_store().members(ACTIVE, carpool_id)
+
+
+def init_notification_state(app):
+    app.config.setdefault('NOTIFICATION_STATE_BACKEND', os.getenv('NOTIFICATION_STATE_BACKEND', 'database'))
+    # Ett skickat notismejl spärrar nya tills användaren läst chatten, men högst så här länge (sekunder)
+    app.config.setdefault('EMAIL_NOTIFICATION_TTL', int(os.getenv('EMAIL_NOTIFICATION_TTL', 7 * 24 * 3600)))
+    # leave_carpool kommer inte alltid (t.ex. vid tappad anslutning), så aktiva användare går ut
+    app.config.setdefault('ACTIVE_USER_TTL', int(os.getenv('ACTIVE_USER_TTL', 2 * 3600)))
+
+    app.extensions['notification_state'] = BACKENDS[app.config['NOTIFICATION_STATE_BACKEND']]()
@@ -1,15 +1,13 @@
 from flask import Blueprint, request, jsonify, make_response, current_app
 from extensions import db
-import requests
-from icalendar import Calendar, Event
 from routes.auth import token_required
-import sys
-from models.auth_model import Child, Role, ParentChildLink, UserRole, User
+from models.auth_model import Child, Role, ParentChildLink, UserRole
 from models.activity_model import Activity
 from models.carpool_model import Passenger, Carpool
-from datetime import datetime, timedelta, timezone
-
-sys.stdout.reconfigure(encoding='utf-8')
+from routes.serializers import serialize_passengers
+from datetime import datetime
+from sqlalchemy import select, union
+from sqlalchemy.exc import IntegrityError
 
 activity_bp = Blueprint('activity', __name__)
 
@@ -26,137 +24,75 @@ role_mapping = {
     'vuxenscout': 10
 }
 
-# Function to fetch calendar events
-def fetch_calendar_events():
-    events_list = []
-    url = 'http://cal.svenskalag.se/19717'
-    response = requests.get(url)
-    
-    if response.status_code == 200:
-        ical_data = response.content.decode('utf-8')
-        cal = Calendar.from_ical(ical_data)
-
-        now = datetime.now(timezone.utc)  
-        one_month_ago = now - timedelta(days=30)
-
-        for component in cal.walk():
-            if component.name == "VEVENT":
-                summary = str(component.get('summary'))
-                scout_level = None
-                if "//" in summary:
-                    scout_level = summary.split("//")[-1].split('-')[0].strip()
-                
-                start_date = component.get('dtstart').dt
-                if start_date < one_month_ago:
-                    continue
-
-                existing_activity = Activity.query.filter_by(
-                    name=summary,
-                    start_date=start_date
-                ).first()
-
-                if not existing_activity:
-                    # Map the scout level from the summary to the correct role_id
-                    role_id = role_mapping.get(scout_level.lower()) if scout_level else None
-                    
-                    # Save new activity if role_id is found
-                    if role_id:
-                        new_activity = Activity(
-                            name=summary,
-                            start_date=start_date,
-                            end_date=component.get('dtend').dt if component.get('dtend') else None,
-                            role_id=role_id,
-                            address=str(component.get('location')),
-                            description=str(component.get('description')).split("Aktiviteten hämtad")[0].strip(),
-                            is_visible=True  # Default to visible
-                        )
-                        db.session.add(new_activity)
-                        db.session.commit()
-                        
-                        events_list.append({
-                            'activity_id': new_activity.activity_id,
-                            'summary': new_activity.name,
-                            'dtstart': str(new_activity.start_date),
-                            'dtend': str(new_activity.end_date),
-                            'location': new_activity.address,
-                            'description': new_activity.description,
-                            'scout_level': scout_level
-                        })
-    
-    return events_list
-
-
-@activity_bp.route('/api/protected/activity/by_role', methods=['GET'])
-@token_required
-def get_activities_by_role(current_user):
-    now = datetime.now()
-
-    # --- Barnaktiviteter ---
-    # Hämta barn som är kopplade till den inloggade användaren
-    children = db.session.query(Child).join(ParentChildLink).filter(
-        ParentChildLink.user_id == current_user.user_id
-    ).all()
+# Omvänd mappning role_id -> scoutnivå, byggs en gång
+scout_level_by_role_id = {role_id: name for name, role_id in role_mapping.items()}
 
-    # Hämta rollnamn baserat på barnens `role_id`
-    children_roles = [Role.query.filter_by(role_id=child.role_id).first().name.lower() for child in children]
-
-    # Matcha `role_ids` för aktiviteter som stämmer överens med barnens roller
-    role_ids = [role_mapping[role] for role in children_roles if role in role_mapping]
-
-    # Hämta aktiviteter för barnens roller
-    children_activities = Activity.query.filter(
-        Activity.role_id.in_(role_ids),
-        Activity.start_date >= now,
-        Activity.is_visible == True
-    ).all()
-
-    # --- Ledaraktiviteter ---
-    # Kontrollera om användaren har rollen "ledare"
-    leader_role_id = role_mapping.get('ledare')  # Hämta role_id för "ledare" från mappningen
-    leader_activities = []
-    if db.session.query(UserRole).filter_by(user_id=current_user.user_id, role_id=leader_role_id).first():
-        leader_activities = Activity.query.filter(
-            Activity.role_id == leader_role_id,
-            Activity.start_date >= now,
-            Activity.is_visible == True
-        ).all()
-
-    # --- Aktiviteter där användaren är förare ---
-    driver_activities = Activity.query.join(Carpool).filter(
-        Carpool.driver_id == current_user.user_id,
-        Activity.start_date >= now,
-        Activity.is_visible == True
-    ).all()
-
-    # --- Aktiviteter där användaren är passagerare ---
-    passenger_activities = Activity.query.join(Carpool).join(Passenger).filter(
-        db.or_(
-            Passenger.user_id == current_user.user_id,
-            Passenger.child_id.in_([child.child_id for child in children])
-        ),
-        Activity.start_date >= now,
-        Activity.is_visible == True
-    ).all()
-
-    # --- Kombinera alla aktiviteter ---
-    all_activities = list({activity.activity_id: activity for activity in (
-        children_activities + leader_activities + driver_activities + passenger_activities
-    )}.values())
-
-    # --- Skapa en lista av aktiviteter ---
-    events_list = [{
+def serialize_activity(activity):
+    return {
         'activity_id': activity.activity_id,
         'summary': activity.name,
         'dtstart': str(activity.start_date),
         'dtend': str(activity.end_date),
         'location': activity.address,
         'description': activity.description,
-        'scout_level': list(role_mapping.keys())[list(role_mapping.values()).index(activity.role_id)]
-    } for activity in all_activities]
+        'scout_level': scout_level_by_role_id.get(activity.role_id)
+    }
+
+
+def children_with_roles(user_id):
+    """Användarens barn med rollnamn, [(child, role_name)], i en fråga."""
+    return (
+        db.session.query(Child, Role.name)
+        .join(ParentChildLink, ParentChildLink.child_id == Child.child_id)
+        .outerjoin(Role, Role.role_id == Child.role_id)
+        .filter(ParentChildLink.user_id == user_id)
+        .all()
+    )
+
+
+def user_activities_criteria(user_id, now=None):
+    """Villkoren för activities_for_user, så att frågeplanen kan kontrolleras
+    av scripts/explain_hot_queries.py.
+
+    Aktivitets-id:n hämtas med en UNION där varje gren kan använda sitt eget
+    index (roll, förare, vuxen passagerare, barnpassagerare). Ett OR av
+    EXISTS-villkor skulle i stället prövas mot varje kommande aktivitet.
+    """
+    upcoming = [Activity.start_date >= (now or datetime.now()), Activity.is_visible == True]
+    leader_role_id = role_mapping['ledare']
+    child_ids = select(ParentChildLink.child_id).where(ParentChildLink.user_id == user_id)
+    role_ids = select(Child.role_id).where(
+        Child.child_id.in_(child_ids),
+        Child.role_id.in_(list(scout_level_by_role_id))
+    ).union(
+        select(UserRole.role_id).where(UserRole.user_id == user_id, UserRole.role_id == leader_role_id)
+    )
+    activity_ids = union(
+        select(Activity.activity_id).where(*upcoming, Activity.role_id.in_(role_ids)),
+        select(Carpool.activity_id).where(Carpool.driver_id == user_id),
+        select(Carpool.activity_id).join(Passenger, Passenger.carpool_id == Carpool.id)
+        .where(Passenger.user_id == user_id),
+        select(Carpool.activity_id).join(Passenger, Passenger.carpool_id == Carpool.id)
+        .where(Passenger.child_id.in_(child_ids)),
+    )
+
+    return upcoming + [Activity.activity_id.in_(activity_ids)]
+
+
+def activities_for_user(user_id):
+    """Kommande synliga aktiviteter för användaren i en fråga: barnens roller,
+    ledaraktiviteter om användaren är ledare, samt aktiviteter där användaren
+    kör eller där användaren eller ett av barnen åker med."""
+    return Activity.query.filter(*user_activities_criteria(user_id)).all()
+
 
-    # --- Hämta nya händelser från den externa kalendern om det behövs ---
-    new_events = fetch_calendar_events()
-    events_list.extend(new_events)
+@activity_bp.route('/api/protected/activity/by_role', methods=['GET'])
+@token_required
+def get_activities_by_role(current_user):
+    all_activities = activities_for_user(current_user.user_id)
+
+    # --- Skapa en lista av aktiviteter ---
+    events_list = [serialize_activity(activity) for activity in all_activities]
 
     return make_response(jsonify({"events": events_list}), 200)
 
@@ -176,19 +112,7 @@ def get_visible_activities(current_user):
     ).all()
 
     # Skapa en lista av aktiviteter
-    events_list = [{
-        'activity_id': activity.activity_id,
-        'summary': activity.name,
-        'dtstart': str(activity.start_date),
-        'dtend': str(activity.end_date),
-        'location': activity.address,
-        'description': activity.description,
-        'scout_level': list(role_mapping.keys())[list(role_mapping.values()).index(activity.role_id)]
-    } for activity in activities]
-
-    # Hämta nya händelser från den externa kalendern om det behövs
-    new_events = fetch_calendar_events()
-    events_list.extend(new_events)
+    events_list = [serialize_activity(activity) for activity in activities]
 
     return make_response(jsonify({"events": events_list}), 200)
 
@@ -208,7 +132,7 @@ def get_all_activities(current_user):
         'location': activity.address,
         'description': activity.description,
         "is_visible": activity.is_visible,
-        'scout_level': list(role_mapping.keys())[list(role_mapping.values()).index(activity.role_id)]
+        'scout_level': scout_level_by_role_id.get(activity.role_id)
     } for activity in activities]
 
     return make_response(jsonify({"events": events_list}), 200)
@@ -323,6 +247,10 @@ def create_activity(current_user):
 
     except ValueError as ve:
         return make_response(jsonify({"error": str(ve)}), 400)
+    except IntegrityError:
+        # Namn och starttid är unika, se uq_activities_name_start
+        db.session.rollback()
+        return make_response(jsonify({"error": "Det finns redan en aktivitet med samma namn och starttid."}), 409)
     except Exception as e:
         # Rollback vid fel
         db.session.rollback()
@@ -344,40 +272,7 @@ def get_activity_by_carpool(current_user, carpool_id):
         if not activity:
             return make_response(jsonify({"error": "Aktiviteten kopplad till carpoolen hittades inte."}), 404)
         
-        passengers = []
-        for passenger in carpool.passengers:
-            # Hantera om passageraren är ett barn
-            if passenger.child_id:
-                child = Child.query.get(passenger.child_id)
-                if child:
-                    # Hämta föräldrar från ParentChildLink
-                    parent_links = ParentChildLink.query.filter_by(child_id=child.child_id).all()
-                    parents = [
-                        {
-                            "parent_id": parent.user_id,
-                            "parent_name": f"{User.query.get(parent.user_id).first_name} {User.query.get(parent.user_id).last_name}",
-                            "parent_phone": User.query.get(parent.user_id).phone
-                        }
-                        for parent in parent_links
-                    ]
-                    passengers.append({
-                        "type": "child",
-                        "child_id": child.child_id,
-                        "name": f"{child.first_name} {child.last_name}",
-                        "phone": child.phone,
-                        "parents": parents
-                    })
-
-            # Hantera om passageraren är en användare
-            elif passenger.user_id:
-                user = User.query.get(passenger.user_id)
-                if user:
-                    passengers.append({
-                        "type": "user",
-                        "user_id": user.user_id,
-                        "name": f"{user.first_name} {user.last_name}",
-                        "phone": user.phone
-                    })
+        passengers = serialize_passengers([carpool.id])[carpool.id]
 
         # Bygg respons med aktivitet och carpool-detaljer
         response = {
@@ -388,8 +283,7 @@ def get_activity_by_carpool(current_user, carpool_id):
                 "dtend": activity.end_date.isoformat() if activity.end_date else None,
                 "location": activity.address,
                 "description": activity.description,
-                "scout_level": list(role_mapping.keys())[list(role_mapping.values()).index(activity.role_id)]
-                if activity.role_id in role_mapping.values() else None
+                "scout_level": scout_level_by_role_id.get(activity.role_id)
             },
             "carpool": {
                 "id": carpool.id,
@@ -1,13 +1,10 @@
 from flask import Blueprint, request, jsonify, current_app
 from extensions import db
-from models.auth_model import User, Role, UserRole, ParentChildLink, Child
-from models.activity_model import Activity
-from models.carpool_model import Car
-from routes.auth import token_required
-from models.carpool_model import Carpool, Passenger
-from models.message_model import CarpoolMessage
-from models.notifications_model import Notification
-import datetime
+from models.auth_model import User, Role, UserRole
+from routes.auth import token_required, invalidate_user_tokens, token_cache, bump_role_version, user_has_role
+from routes.message import room_metadata_cache
+from carpool_snapshots import get_snapshot_cache
+from cleanup import cleanup_activities as run_activity_cleanup, delete_user as delete_user_data
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -75,7 +72,9 @@ def make_user_admin(current_user):
 
     new_user_role = UserRole(user_id=user_id, role_id=admin_role.role_id)
     db.session.add(new_user_role)
+    bump_role_version(user.user_id)
     db.session.commit()
+    invalidate_user_tokens(user.user_id)
 
     return jsonify({"message": f"User {user.email} has been granted admin privileges."}), 200
 
@@ -118,6 +117,7 @@ def accept_user(current_user):
 
     user.is_accepted = True
     db.session.commit()
+    invalidate_user_tokens(user.user_id)
 
     return jsonify({"message": f"User {user.email} has been accepted."}), 200
 
@@ -133,46 +133,13 @@ def delete_user(current_user, user_id):
     if not user:
         return jsonify({"error": "User not found!"}), 404
 
+    email = user.email
     try:
-        # Ta bort notiser kopplade till användaren
-        notifications = Notification.query.filter_by(user_id=user_id).all()
-        for notification in notifications:
-            db.session.delete(notification)
-
-        # Ta bort alla samåkningar som användaren har skapat
-        carpools = Carpool.query.filter_by(driver_id=user_id).all()
-        for carpool in carpools:
-            # Ta bort passagerare kopplade till carpoolen
-            Passenger.query.filter_by(carpool_id=carpool.id).delete()
-
-            # Ta bort meddelanden kopplade till carpoolen
-            CarpoolMessage.query.filter_by(carpool_id=carpool.id).delete()
-
-            # Ta bort själva carpoolen
-            db.session.delete(carpool)
-
-        # Ta bort alla länkar mellan användaren och barn
-        child_links = ParentChildLink.query.filter_by(user_id=user_id).all()
-        for link in child_links:
-            db.session.delete(link)
-
-            # Kontrollera om barnet inte längre är länkat till någon annan användare
-            remaining_links = ParentChildLink.query.filter_by(child_id=link.child_id).all()
-            if not remaining_links:
-                child = Child.query.get(link.child_id)
-                if child:
-                    db.session.delete(child)
-
-        #Ta bort sparade bilar
-        cars = Car.query.filter_by(owner_id=user_id).all()
-        for car in cars:
-             db.session.delete(car)
-
-        # Ta bort själva användaren
-        db.session.delete(user)
-        db.session.commit()
-
-        return jsonify({"message": f"Användare {user.email} och dess data har raderats."}), 200
+        # Raderar användaren och dess data i bitar, se cleanup.Cleanup
+        deleted = delete_user_data(current_app, user_id)
+        invalidate_user_tokens(user_id)
+
+        return jsonify({"message": f"Användare {email} och dess data har raderats.", "deleted": deleted}), 200
 
     except Exception as e:
         db.session.rollback()  # Återställ ändringar om något går fel
@@ -189,52 +156,14 @@ def cleanup_activities(current_user):
         return jsonify({"error": "Access denied!"}), 403
 
     try:
-        now = datetime.datetime.utcnow()
-        three_months_ago = now - datetime.timedelta(days=90)
-
-        # Hämta aktiviteter att rensa
-        activities_to_delete = Activity.query.filter(
-            db.or_(
-                Activity.end_date < now,
-                db.and_(
-                    Activity.end_date.is_(None),
-                    Activity.start_date < three_months_ago
-                )
-            )
-        ).all()
-
-        # Hämta IDs för aktiviteter som ska tas bort
-        activity_ids_to_delete = [activity.activity_id for activity in activities_to_delete]
-
-        # Hämta och ta bort relaterade samåkningar
-        carpools_to_delete = Carpool.query.filter(Carpool.activity_id.in_(activity_ids_to_delete)).all()
-        carpool_ids_to_delete = [carpool.id for carpool in carpools_to_delete]
-
-        # Ta bort relaterade passagerare
-        passengers_to_delete = Passenger.query.filter(Passenger.carpool_id.in_(carpool_ids_to_delete)).all()
-
-        # Räkna antal poster för att logga senare
-        deleted_activities_count = len(activities_to_delete)
-        deleted_carpools_count = len(carpools_to_delete)
-        deleted_passengers_count = len(passengers_to_delete)
-
-        # Ta bort poster från databasen
-        for passenger in passengers_to_delete:
-            db.session.delete(passenger)
-
-        for carpool in carpools_to_delete:
-            db.session.delete(carpool)
-
-        for activity in activities_to_delete:
-            db.session.delete(activity)
-
-        db.session.commit()
+        deleted = run_activity_cleanup(current_app)
 
         return jsonify({
             "message": f"Rensning klar.",
-            "deleted_activities": deleted_activities_count,
-            "deleted_carpools": deleted_carpools_count,
-            "deleted_passengers": deleted_passengers_count
+            "deleted_activities": deleted.get('activities', 0),
+            "deleted_carpools": deleted.get('carpool', 0),
+            "deleted_passengers": deleted.get('passengers', 0),
+            "deleted": deleted
         }), 200
 
     except Exception as e:
@@ -243,13 +172,20 @@ def cleanup_activities(current_user):
         return jsonify({"error": "Ett fel inträffade vid rensning av aktiviteter."}), 500
 
 
+@admin_bp.route('/api/admin/cache-stats', methods=['GET'])
+@token_required
+def get_cache_stats(current_user):
+
+    if not is_user_admin(current_user.user_id):
+        return jsonify({"error": "Access denied!"}), 403
+
+    return jsonify({
+        "token_cache": token_cache.stats(),
+        "room_metadata_cache": room_metadata_cache.stats(),
+        "carpool_snapshots": get_snapshot_cache().stats(),
+    }), 200
+
+
 # Helper function for authentication
 def is_user_admin(user_id):
-    user_roles = (
-        db.session.query(Role.name)
-        .join(UserRole, Role.role_id == UserRole.role_id)
-        .filter(UserRole.user_id == user_id)
-        .all()
-    )
-    user_roles = [role[0] for role in user_roles]
-    return 'admin' in user_roles
+    return user_has_role(user_id, 'admin')
\ No newline at end of file
@@ -1,6 +1,6 @@
-from flask import Blueprint, request, jsonify, make_response, current_app
+from flask import Blueprint, request, jsonify, make_response, current_app, g
 from extensions import db
-from models.auth_model import User, UserRole, Role
+from models.auth_model import User, UserRole, Role, RoleVersion
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 import datetime
@@ -8,6 +8,12 @@ from functools import wraps
 from flask_socketio import join_room, emit
 from flask import request
 from extensions import socketio
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import make_transient_to_detached
+from cache import TTLCache
+import os
+import threading
+import time
 
 
 auth_bp = Blueprint('auth', __name__)
@@ -92,9 +98,12 @@ def login():
     if not user.is_accepted:
         return jsonify({"error": "Användarkontot är inte accepterat än!"}), 402
     
-    # Skapa JWT-token
+    # Skapa JWT-token med användarens roller, så att rollkontroller inte behöver databasen
+    role_ids = [user_role.role_id for user_role in UserRole.query.filter_by(user_id=user.user_id).all()]
     token = jwt.encode({
         'sub': user.user_id,
+        'roles': role_ids,
+        'rv': get_role_version(user.user_id),
         'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=1)
     }, current_app.config['JWT_SECRET'], algorithm='HS256')
 
@@ -103,6 +112,7 @@ def login():
 
     user.last_logged_in = datetime.datetime.utcnow()
     db.session.commit()
+    invalidate_user_tokens(user.user_id)
 
     # Skicka JWT-tokenen som en HttpOnly-cookie
     response = make_response(jsonify({"message": "Login successful!"}))
@@ -122,6 +132,10 @@ def handle_join_user(data):
 
 @auth_bp.route('/api/logout', methods=['POST'])
 def logout():
+    token = request.cookies.get('jwt_token')
+    if token:
+        token_cache.delete(token)
+
     # Create a response to send back to the user
     response = make_response(jsonify({"message": "Logout successful!"}))
     
@@ -131,6 +145,122 @@ def logout():
     return response
 
 
+# Cache med verifierade inloggningar (token -> användarens kolumnvärden), så att
+# token_required inte behöver läsa users-tabellen vid varje anrop.
+token_cache = TTLCache(
+    maxsize=int(os.getenv('TOKEN_CACHE_SIZE', 1024)),
+    ttl=int(os.getenv('TOKEN_CACHE_TTL', 60))
+)
+# Senaste ogiltigförklaringen per användare (time.monotonic()). En cachad post
+# räknas från när användaren lästes och gäller högst token_cache.ttl sekunder,
+# så äldre tider behövs inte och rensas bort
+_user_invalidations = {}
+_all_invalidated_at = float('-inf')
+_user_invalidations_lock = threading.Lock()
+
+
+def invalidate_user_tokens(user_id):
+    """Ogiltigförklarar cachade inloggningar för en användare vars konto har ändrats.
+
+    Gäller bara den här processens cache. Andra processer läser om användaren
+    när deras cachade post går ut, efter högst TOKEN_CACHE_TTL sekunder.
+    """
+    global _all_invalidated_at
+    now = time.monotonic()
+    with _user_invalidations_lock:
+        _user_invalidations.pop(user_id, None)
+        _user_invalidations[user_id] = now
+        # Äldst först, så utgångna tider ligger i början
+        for key, invalidated_at in list(_user_invalidations.items()):
+            if invalidated_at > now - token_cache.ttl:
+                break
+            del _user_invalidations[key]
+        if len(_user_invalidations) > token_cache.maxsize:
+            # Fler ändringar än cachen rymmer inom en TTL: alla läses om från databasen
+            _all_invalidated_at = now
+            _user_invalidations.clear()
+            token_cache.clear()
+
+
+def _is_current(user_id, read_at):
+    """Om en post med användaren läst från databasen vid read_at fortfarande gäller."""
+    if read_at <= max(_all_invalidated_at, time.monotonic() - token_cache.ttl):
+        return False
+    invalidated_at = _user_invalidations.get(user_id)
+    return invalidated_at is None or read_at > invalidated_at
+
+
+def get_role_version(user_id):
+    role_version = RoleVersion.query.get(user_id)
+    return role_version.version if role_version else 0
+
+
+def bump_role_version(user_id):
+    """Markerar att användarens roller har ändrats. Tokens med äldre version avvisas.
+
+    Anroparen ansvarar för commit och för att anropa invalidate_user_tokens efteråt.
+    """
+    role_version = RoleVersion.query.get(user_id)
+    if role_version is None:
+        role_version = RoleVersion(user_id=user_id, version=0)
+        db.session.add(role_version)
+    role_version.version += 1
+
+
+# Rolltabellen ändras bara vid seedning, så namn <-> id kan cachas per process
+_role_names_by_id = None
+
+
+def role_names_by_id():
+    global _role_names_by_id
+    if _role_names_by_id is None:
+        _role_names_by_id = {role.role_id: role.name for role in Role.query.all()}
+    return _role_names_by_id
+
+
+def role_id_for(role_name):
+    for role_id, name in role_names_by_id().items():
+        if name == role_name:
+            return role_id
+    return None
+
+
+def current_role_ids(user_id):
+    """Roll-id:n från den inloggade användarens token, eller None om de inte är kända."""
+    if g.get('principal_id') == user_id:
+        return g.get('principal_role_ids')
+    return None
+
+
+def user_has_role(user_id, role_name):
+    """Kontrollerar en roll via tokenens roll-claims, med databasen som reserv."""
+    role_ids = current_role_ids(user_id)
+    if role_ids is not None:
+        return role_id_for(role_name) in role_ids
+
+    return db.session.query(UserRole).join(Role, Role.role_id == UserRole.role_id).filter(
+        UserRole.user_id == user_id,
+        Role.name == role_name
+    ).first() is not None
+
+
+def _cache_principal(token, user, read_at, expires_at):
+    snapshot = {attr.key: getattr(user, attr.key) for attr in sa_inspect(User).column_attrs}
+    ttl = expires_at - datetime.datetime.now(datetime.timezone.utc).timestamp()
+    token_cache.set(token, (user.user_id, read_at, snapshot), ttl=ttl)
+
+
+def _cached_principal(token):
+    """Returnerar en session-bunden User från cachen utan att fråga databasen."""
+    entry = token_cache.get(token, validate=lambda e: _is_current(e[0], e[1]))
+    if entry is None:
+        return None
+
+    user = User(**entry[2])
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -141,15 +271,35 @@ def token_required(f):
 
         try:
             data = jwt.decode(token, current_app.config['JWT_SECRET'], algorithms=['HS256'])
-            current_user = User.query.get(data['sub'])
 
+            current_user = _cached_principal(token)
             if current_user is None:
-                return jsonify({"error": "User not found!"}), 401
-            
-            # Kontrollera accepteringsstatus
-            if not current_user.is_accepted:
-                return jsonify({"error": "Användaren har inte godkänts av administratören."}), 403
-                    
+                # Tiden tas före läsningen, så en ändring under tiden ogiltigförklarar posten
+                read_at = time.monotonic()
+                row = (
+                    db.session.query(User, RoleVersion.version)
+                    .outerjoin(RoleVersion, RoleVersion.user_id == User.user_id)
+                    .filter(User.user_id == data['sub'])
+                    .first()
+                )
+
+                if row is None:
+                    return jsonify({"error": "User not found!"}), 401
+                current_user, role_version = row
+
+                # Kontrollera accepteringsstatus
+                if not current_user.is_accepted:
+                    return jsonify({"error": "Användaren har inte godkänts av administratören."}), 403
+
+                # Rollerna har ändrats sedan token skapades
+                if 'rv' in data and data['rv'] != (role_version or 0):
+                    return jsonify({"error": "Token has been revoked!"}), 401
+
+                _cache_principal(token, current_user, read_at, data['exp'])
+
+            g.principal_id = current_user.user_id
+            g.principal_role_ids = set(data['roles']) if 'roles' in data else None
+
         except jwt.ExpiredSignatureError:
             return jsonify({"error": "Token has expired!"}), 401
         except Exception as e:
@@ -163,18 +313,9 @@ def requires_role(required_role):
     def decorator(f):
         @wraps(f)
         def decorated_function(current_user, *args, **kwargs):
-            user_roles = (
-                Role.query
-                .join(UserRole, Role.role_id == UserRole.role_id)
-                .filter(UserRole.user_id == current_user.user_id)
-                .with_entities(Role.name)
-                .all()
-            )
-
-            user_roles = [role.name for role in user_roles]
-            if required_role not in user_roles:
+            if not user_has_role(current_user.user_id, required_role):
                 return jsonify({"error": "Access denied! Insufficient role."}), 403
 
             return f(current_user, *args, **kwargs)
         return decorated_function
-    return decorator
\ No newline at end of file
+    return decorator
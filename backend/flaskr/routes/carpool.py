@@ -1,13 +1,18 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify
 from flask_socketio import emit
 from extensions import db
 from models.carpool_model import Carpool, Passenger, Car
 from models.auth_model import Child, ParentChildLink
 from models.activity_model import Activity
 from models.message_model import CarpoolMessage
+from models.notifications_model import Notification, NotificationState, UnreadCounter
 from datetime import datetime
 from routes.auth import token_required, User
 from routes.carpool_notifications import send_passenger_list_notification
+from routes.serializers import get_lookup, serialize_passengers
+from carpool_snapshots import activity_ids_for_carpools, get_snapshot_cache, invalidate_activities
+from unread_counters import push_unread_totals
+from seat_reservations import AlreadyPassenger, NoSeatsAvailable, add_passengers, change_passengers, remove_passengers
 
 carpool_bp = Blueprint('carpool_bp', __name__)
 
@@ -45,67 +50,41 @@ def create_carpool(current_user):
 
     db.session.add(new_carpool)
     db.session.commit()
+    invalidate_activities([new_carpool.activity_id])
 
     return jsonify({"message": "Carpool created successfully!"}), 201
 
 
-# Endpoint to get carpools
-@carpool_bp.route('/api/carpool/list', methods=['GET'])
-@token_required
-def list_carpools(current_user):
-    activity_id = request.args.get('activity_id')
-
-    if not activity_id:
-        return jsonify({"error": "Activity ID is required!"}), 400
+def build_carpool_listing(activity_ids):
+    """Bygger carpool-listor för flera aktiviteter med ett fast antal frågor.
+
+    Carpools, bilar, passagerare, barn, föräldralänkar och användare hämtas
+    med IN-frågor via serializers, oavsett hur många passagerare det finns.
+    Returnerar en dict activity_id -> lista med serialiserade carpools.
+    """
+    activity_ids = [int(activity_id) for activity_id in activity_ids]
+    listing = {activity_id: [] for activity_id in activity_ids}
+    if not activity_ids:
+        return listing
+
+    # Carpool.car är joined-laddad, så bilen följer med i samma fråga
+    carpools = (
+        Carpool.query
+        .filter(Carpool.activity_id.in_(activity_ids))
+        .order_by(Carpool.id)
+        .all()
+    )
+    if not carpools:
+        return listing
 
-    # Hämta carpools baserat på activity_id
-    carpools = Carpool.query.filter_by(activity_id=activity_id).all()
+    lookup = get_lookup()
+    passengers_by_carpool = serialize_passengers([carpool.id for carpool in carpools], lookup=lookup)
+    drivers = lookup.load(User, [carpool.driver_id for carpool in carpools])
 
-    carpool_list = []
     for carpool in carpools:
-        passengers = []
-        for passenger in carpool.passengers:
-            # Hantera om passageraren är ett barn
-            if passenger.child_id:
-                child = Child.query.get(passenger.child_id)
-                if child:
-                    # Hämta föräldrar från ParentChildLink
-                    parent_links = ParentChildLink.query.filter_by(child_id=child.child_id).all()
-                    parents = [
-                        {
-                            "parent_id": parent.user_id,
-                            "parent_name": f"{User.query.get(parent.user_id).first_name} {User.query.get(parent.user_id).last_name}",
-                            "parent_phone": User.query.get(parent.user_id).phone
-                        }
-                        for parent in parent_links
-                    ]
-                    passengers.append({
-                        "type": "child",
-                        "child_id": child.child_id,
-                        "name": f"{child.first_name} {child.last_name}",
-                        "phone": child.phone,
-                        "parents": parents
-                    })
-
-            # Hantera om passageraren är en användare
-            elif passenger.user_id:
-                user = User.query.get(passenger.user_id)
-                if user:
-                    passengers.append({
-                        "type": "user",
-                        "user_id": user.user_id,
-                        "name": f"{user.first_name} {user.last_name}",
-                        "phone": user.phone
-                    })
-
-        # Hämta bilinformation om den finns
-        car = Car.query.get(carpool.car_id)
-
-        # Hämta förarens information om den finns
-        driver = User.query.get(carpool.driver_id)
-
-        # Bygg carpool-objektet
-        carpool_list.append({
+        car = carpool.car
+        driver = drivers.get(carpool.driver_id)
+        listing[carpool.activity_id].append({
             "id": carpool.id,
             "driver_id": carpool.driver_id,
             "driver_name": f"{driver.first_name} {driver.last_name}" if driver else "Ingen förare tilldelad",
@@ -117,10 +96,36 @@ def list_carpools(current_user):
             "departure_postcode": carpool.departure_postcode,
             "departure_city": carpool.departure_city,
             "carpool_type": carpool.carpool_type,
-            "passengers": passengers
+            "passengers": passengers_by_carpool[carpool.id]
         })
 
-    return jsonify({"carpools": carpool_list}), 200
+    return listing
+
+
+# Endpoint to get carpools
+@carpool_bp.route('/api/carpool/list', methods=['GET'])
+@token_required
+def list_carpools(current_user):
+    activity_id = request.args.get('activity_id', type=int)
+
+    if not activity_id:
+        return jsonify({"error": "Activity ID is required!"}), 400
+
+    # Listan serialiseras en gång per version och skickas sedan direkt från cachen
+    snapshots = get_snapshot_cache()
+    snapshot, version = snapshots.get(activity_id)
+    if snapshot is None:
+        carpool_list = build_carpool_listing([activity_id])[activity_id]
+        body = current_app.json.dumps({"carpools": carpool_list}).encode()
+        snapshot = snapshots.put(activity_id, version, body)
+
+    if request.if_none_match.contains(snapshot.etag):
+        response = Response(status=304)
+    else:
+        response = Response(snapshot.body, status=200, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 
@@ -139,19 +144,11 @@ def add_passenger(current_user):
     if not child_id and not user_id:
         return jsonify({"error": "Either child_id or user_id must be provided!"}), 400
 
-    # Kontrollera om passageraren redan är i carpoolen
-    existing_passenger = Passenger.query.filter_by(carpool_id=carpool_id, child_id=child_id, user_id=user_id).first()
-    if existing_passenger:
-        return jsonify({"error": "Passenger already added to this carpool!"}), 401
-
-    # Hitta carpoolen och kontrollera att det finns platser
+    # Hitta carpoolen. Platserna kontrolleras när de reserveras nedan.
     carpool = Carpool.query.get(carpool_id)
     if not carpool:
         return jsonify({"error": "Carpool not found!"}), 404
 
-    if carpool.available_seats <= 0:
-        return jsonify({"error": "No available seats in this carpool!"}), 402
-
     # Om `child_id` inte är angivet och `user_id` inte används, hämta barn baserat på roll och användare
     if not child_id and not user_id:
         activity = Activity.query.get(carpool.activity_id)
@@ -167,19 +164,92 @@ def add_passenger(current_user):
             return jsonify({"error": "Child not found for this parent and role!"}), 404
         child_id = child.child_id
 
-    # Lägg till passageraren och uppdatera tillgängliga platser
-    new_passenger = Passenger(child_id=child_id, user_id=user_id, carpool_id=carpool_id)
-    carpool.available_seats -= 1
-
-    db.session.add(new_passenger)
-    db.session.commit()
+    # Reservera platsen och lägg till passageraren i samma transaktion
+    try:
+        add_passengers(carpool_id, [(child_id, user_id)])
+    except NoSeatsAvailable:
+        return jsonify({"error": "No available seats in this carpool!"}), 402
+    except AlreadyPassenger:
+        return jsonify({"error": "Passenger already added to this carpool!"}), 401
+    invalidate_activities([carpool.activity_id])
 
     # Skicka notis till föraren
-    send_passenger_list_notification(carpool_id, "added", current_user)
+    send_passenger_list_notification(carpool_id, current_user, added=1)
 
     return jsonify({"message": "Passenger added successfully!"}), 201
 
 
+def selected_participant(participant, current_user, child_ids):
+    """Gör om {"type": "user"|"child", "id": ...} från select-join till
+    (child_id, user_id). Bara användaren själv och egna barn kan väljas."""
+    participant_type = participant.get('type')
+    participant_id = participant.get('id')
+    if participant_type == 'user' and participant_id in (None, current_user.user_id):
+        return None, current_user.user_id
+    if participant_type == 'child' and participant_id in child_ids:
+        return participant_id, None
+    raise ValueError(f"Invalid participant: {participant}")
+
+
+@carpool_bp.route('/api/carpool/update-passengers', methods=['POST'])
+@token_required
+def update_passengers(current_user):
+    """Lägger till och tar bort flera deltagare i en transaktion.
+
+    Body: {"carpool_id": 1, "add": [{"type": "child", "id": 3}], "remove": [{"type": "user"}]}
+    Platserna kontrolleras en gång för hela ändringen, och föraren får en
+    samlad notis.
+    """
+    data = request.get_json() or {}
+    carpool_id = data.get('carpool_id')
+    to_add = data.get('add') or []
+    to_remove = data.get('remove') or []
+
+    if not carpool_id or not (to_add or to_remove):
+        return jsonify({"error": "carpool_id and participants to add or remove are required!"}), 400
+
+    carpool = Carpool.query.get(carpool_id)
+    if not carpool:
+        return jsonify({"error": "Carpool not found!"}), 404
+
+    child_ids = {
+        child_id for (child_id,) in
+        db.session.query(ParentChildLink.child_id).filter_by(user_id=current_user.user_id)
+    }
+    try:
+        add = {selected_participant(participant, current_user, child_ids) for participant in to_add}
+        remove = {selected_participant(participant, current_user, child_ids) for participant in to_remove}
+    except (ValueError, AttributeError) as e:
+        return jsonify({"error": str(e)}), 403
+
+    passenger_ids = []
+    if remove:
+        remove_child_ids = [child_id for child_id, _ in remove if child_id]
+        passenger_ids = [
+            passenger_id for (passenger_id,) in
+            db.session.query(Passenger.id).filter(
+                Passenger.carpool_id == carpool_id,
+                db.or_(
+                    Passenger.child_id.in_(remove_child_ids),
+                    db.and_(Passenger.child_id.is_(None), Passenger.user_id == current_user.user_id)
+                    if (None, current_user.user_id) in remove else db.false()
+                )
+            )
+        ]
+
+    try:
+        removed = change_passengers(carpool_id, participants=list(add), passenger_ids=passenger_ids)
+    except NoSeatsAvailable:
+        return jsonify({"error": "Not enough available seats in this carpool!"}), 402
+    except AlreadyPassenger:
+        return jsonify({"error": "Passenger already added to this carpool!"}), 401
+    invalidate_activities([carpool.activity_id])
+
+    send_passenger_list_notification(carpool_id, current_user, added=len(add), removed=removed)
+
+    return jsonify({"message": "Passengers updated!", "added": len(add), "removed": removed}), 200
+
+
 
 
 # Endpoint to check if a parent has multiple children with the same role
@@ -273,9 +343,21 @@ def delete_carpool(current_user, carpool_id):
         # Ta bort alla relaterade meddelanden
         CarpoolMessage.query.filter_by(carpool_id=carpool_id).delete()
 
+        # Notiser, olästa-räknare och notistillstånd pekar på samåkningen
+        unread_user_ids = [
+            user_id for (user_id,) in
+            db.session.query(UnreadCounter.user_id).filter_by(carpool_id=carpool_id).distinct()
+        ]
+        Notification.query.filter_by(carpool_id=carpool_id).delete()
+        UnreadCounter.query.filter_by(carpool_id=carpool_id).delete()
+        NotificationState.query.filter_by(carpool_id=carpool_id).delete()
+
         # Ta bort carpool
+        activity_id = carpool.activity_id
         db.session.delete(carpool)
         db.session.commit()
+        invalidate_activities([activity_id])
+        push_unread_totals(unread_user_ids)
 
         return jsonify({"message": "Carpool deleted successfully!"}), 200
 
@@ -288,39 +370,7 @@ def delete_carpool(current_user, carpool_id):
 @carpool_bp.route('/api/carpool/<int:carpool_id>/passengers', methods=['GET'])
 @token_required
 def list_passengers(current_user, carpool_id):
-    passengers = Passenger.query.filter_by(carpool_id=carpool_id).all()
-
-    passenger_data = []
-    for passenger in passengers:
-        if passenger.child_id:  # Om passageraren är ett barn
-            child = Child.query.get(passenger.child_id)
-            if child:
-                parent_links = ParentChildLink.query.filter_by(child_id=child.child_id).all()
-                parents = [
-                    {
-                        "parent_id": parent.user_id,
-                        "parent_name": f"{User.query.get(parent.user_id).first_name} {User.query.get(parent.user_id).last_name}",
-                        "parent_phone": User.query.get(parent.user_id).phone
-                    }
-                    for parent in parent_links
-                ]
-                passenger_data.append({
-                    "type": "child",
-                    "child_id": child.child_id,
-                    "child_name": f"{child.first_name} {child.last_name}",
-                    "child_phone": child.phone,
-                    "parents": parents
-                })
-        elif passenger.user_id:  # Om passageraren är en användare
-            user = User.query.get(passenger.user_id)
-            if user:
-                passenger_data.append({
-                    "type": "user",
-                    "user_id": user.user_id,
-                    "user_name": f"{user.first_name} {user.last_name}",
-                    "user_phone": user.phone,
-                    "parents": []  # Lägg till tom lista för att matcha frontend-struktur
-                })
+    passenger_data = serialize_passengers([carpool_id], prefixed_keys=True)[carpool_id]
 
     return jsonify({"passengers": passenger_data}), 200
 
@@ -385,9 +435,13 @@ def delete_car(current_user, car_id):
     if not car:
         return jsonify({"error": "Car not found or not authorized to delete this car"}), 404
 
+    # Samåkningar med bilen visar bilens modell
+    activity_ids = activity_ids_for_carpools(Carpool.car_id == car_id)
+
     # Delete the car
     db.session.delete(car)
     db.session.commit()
+    invalidate_activities(activity_ids)
 
     return jsonify({"message": "Car deleted successfully!"}), 200
 
@@ -419,12 +473,12 @@ def remove_passenger(current_user):
     if not carpool:
         return jsonify({"error": "Carpool not found!"}), 404
 
-    # Ta bort passageraren
+    # Ta bort passageraren och ge tillbaka platsen
     try:
-        db.session.delete(passenger)
-        carpool.available_seats += 1
-        db.session.commit()
-        send_passenger_list_notification(carpool_id, "removed", current_user)
+        if not remove_passengers(carpool_id, [passenger.id]):
+            return jsonify({"error": "Passageraren finns inte i den angivna carpoolen"}), 404
+        invalidate_activities([carpool.activity_id])
+        send_passenger_list_notification(carpool_id, current_user, removed=1)
         
         return jsonify({"message": "Passageraren har tagits bort från carpoolen"}), 200
     except Exception as e:
@@ -1,17 +1,35 @@
 import json
 from extensions import db
 from models.carpool_model import Carpool
-from models.auth_model import User, Child, ParentChildLink
+from models.auth_model import User
 from models.activity_model import Activity
-from models.carpool_model import Car
-from routes.mail import mail
-from flask_mail import Message
+from mail_outbox import enqueue_email
 from flask_socketio import emit
 from models.notifications_model import Notification
 from datetime import datetime
-from routes.message import email_notifications_sent
+from notification_state import claim_email_notification, email_notification_sent
+from routes.serializers import serialize_carpool_details, serialize_passengers
+from unread_counters import increment_unread, push_unread_totals
+
+def passenger_count_text(count):
+    return "en passagerare" if count == 1 else f"{count} passagerare"
+
+
+def passenger_change_text(current_user, added, removed):
+    """T.ex. "Anna Svensson har lagt till 2 passagerare och tagit bort en passagerare"."""
+    changes = []
+    if added:
+        changes.append(f"lagt till {passenger_count_text(added)}")
+    if removed:
+        changes.append(f"tagit bort {passenger_count_text(removed)}")
+    return f"{current_user.first_name} {current_user.last_name} har {' och '.join(changes)}"
+
+
+def send_passenger_list_notification(carpool_id, current_user, added=0, removed=0):
+    """Skickar en samlad notis till föraren om ändringar i passagerarlistan."""
+    if not added and not removed:
+        return
 
-def send_passenger_list_notification(carpool_id, action, current_user):
     carpool = Carpool.query.get(carpool_id)
     if not carpool:
         print(f"Carpool {carpool_id} not found.")
@@ -20,7 +38,7 @@ def send_passenger_list_notification(carpool_id, action, current_user):
     # Hämta föraren (skaparen av carpoolen)
     driver = User.query.get(carpool.driver_id)
     if driver and driver.email:
-        if email_notifications_sent.get(driver.user_id, {}).get(carpool_id, False):
+        if email_notification_sent(driver.user_id, carpool_id):
             return
     
     if current_user.user_id == driver.user_id:
@@ -29,7 +47,8 @@ def send_passenger_list_notification(carpool_id, action, current_user):
     # Hämta aktivitet kopplad till carpoolen
     activity = Activity.query.get(carpool.activity_id) if carpool.activity_id else None
 
-    message = f"{current_user.first_name} {current_user.last_name} har {'lagt till' if action == 'added' else 'tagit bort'} en passagerare."
+    change = passenger_change_text(current_user, added, removed)
+    message = f"{change}."
 
     # Skapa notis i databasen
     notification = Notification(
@@ -40,57 +59,12 @@ def send_passenger_list_notification(carpool_id, action, current_user):
         created_at=datetime.utcnow()
     )
     db.session.add(notification)
+    increment_unread([notification])
     db.session.commit()
 
-    car = Car.query.get(carpool.car_id)
-    passengers = []
-    for passenger in carpool.passengers:
-        # Hantera om passageraren är ett barn
-        if passenger.child_id:
-            child = Child.query.get(passenger.child_id)
-            if child:
-                # Hämta föräldrar från ParentChildLink
-                parent_links = ParentChildLink.query.filter_by(child_id=child.child_id).all()
-                parents = [
-                    {
-                        "parent_id": parent.user_id,
-                        "parent_name": f"{User.query.get(parent.user_id).first_name} {User.query.get(parent.user_id).last_name}",
-                        "parent_phone": User.query.get(parent.user_id).phone
-                    }
-                    for parent in parent_links
-                ]
-                passengers.append({
-                    "type": "child",
-                    "child_id": child.child_id,
-                    "name": f"{child.first_name} {child.last_name}",
-                    "phone": child.phone,
-                    "parents": parents
-                })
-
-        # Hantera om passageraren är en användare
-        elif passenger.user_id:
-            user = User.query.get(passenger.user_id)
-            if user:
-                passengers.append({
-                    "type": "user",
-                    "user_id": user.user_id,
-                    "name": f"{user.first_name} {user.last_name}",
-                    "phone": user.phone
-                })
-
     # Förbered data för emit
-    carpool_details = {
-        "id": carpool.id,
-        "driver_id": carpool.driver_id,
-        "car_id": carpool.car_id,
-        "car_model_name": car.model_name if car else "Ingen bil tilldelad",
-        "available_seats": carpool.available_seats,
-        "departure_address": carpool.departure_address,
-        "departure_postcode": carpool.departure_postcode,
-        "departure_city": carpool.departure_city,
-        "carpool_type": carpool.carpool_type,
-        "passengers": passengers
-    }
+    passengers = serialize_passengers([carpool.id])[carpool.id]
+    carpool_details = serialize_carpool_details(carpool, passengers)
 
     activity_details = {
         "activity_id": activity.activity_id,
@@ -113,6 +87,7 @@ def send_passenger_list_notification(carpool_id, action, current_user):
         },
         to=f"user_{driver.user_id}", namespace='/'
     )
+    push_unread_totals([driver.user_id])
 
     # Kontrollera om föraren har aktiverat notiser för passagerarlistan
     if driver.notification_preferences:
@@ -124,33 +99,23 @@ def send_passenger_list_notification(carpool_id, action, current_user):
         print(f"Driver {driver.email} has disabled passenger list notifications. Skipping.")
         return
 
-    # Skapa ett e-postmeddelande baserat på åtgärden
-    if action == "added":
+    # Skapa ett e-postmeddelande baserat på ändringen
+    if added and not removed:
         subject = f"Ny passagerare i din samåkning {carpool_id}"
-        body = f"Hej {driver.first_name},\n\nEn ny passagerare har lagts till i din samåkning.\n\nHälsningar, Redo-supporten."
-        html_body = f"""
-            <p>Hej {driver.first_name},</p>
-            <p>En ny passagerare har lagts till i din samåkning.</p>
-            <p>Hälsningar, Redo-supporten.</p>
-        """
-    elif action == "removed":
+    elif removed and not added:
         subject = f"Passagerare borttagen från din samåkning {carpool_id}"
-        body = f"Hej {driver.first_name},\n\nEn passagerare har tagits bort från din samåkning av {current_user.first_name} {current_user.last_name}.\n\nHälsningar, Redo-supporten."
-        html_body = f"""
-            <p>Hej {driver.first_name},</p>
-            <p>En passagerare har tagits bort från din samåkning av {current_user.first_name} {current_user.last_name}.</p>
-            <p>Hälsningar, Redo-supporten.</p>
-        """
     else:
-        print(f"Unknown action: {action}. No notification sent.")
+        subject = f"Passagerarlistan har ändrats i din samåkning {carpool_id}"
+    body = f"Hej {driver.first_name},\n\n{change} i din samåkning.\n\nHälsningar, Redo-supporten."
+    html_body = f"""
+        <p>Hej {driver.first_name},</p>
+        <p>{change} i din samåkning.</p>
+        <p>Hälsningar, Redo-supporten.</p>
+    """
+
+    # En annan process kan ha hunnit skicka sedan kontrollen ovan
+    if not claim_email_notification(driver.user_id, carpool_id):
         return
 
-    # Skicka e-post
-    try:
-        with mail.connect() as conn:
-            msg = Message(subject=subject, recipients=[driver.email], body=body, sender="redo@kustscoutjonstorp.se")
-            msg.html = html_body
-            conn.send(msg)
-            email_notifications_sent.setdefault(driver.user_id, {})[carpool_id] = True
-    except Exception as e:
-        print(f"Error sending passenger list notification: {e}")
+    # Lägg mejlet i utkorgen, det skickas av bakgrundsworkern
+    enqueue_email(subject, [driver.email], body, html=html_body)
@@ -0,0 +1,83 @@
+from flask import Blueprint, request, jsonify
+from datetime import datetime
+from models.activity_model import Activity
+from routes.activity import activities_for_user, children_with_roles, serialize_activity
+from routes.auth import token_required
+from routes.carpool import build_carpool_listing
+from routes.user_handler import user_role_names
+from unread_counters import unread_counts
+
+dashboard_bp = Blueprint('dashboard_bp', __name__)
+
+
+def participant_flags(carpool, current_user, children):
+    """Samma information som all-children-joined och select-join ger för en carpool."""
+    passenger_user_ids = {p['user_id'] for p in carpool['passengers'] if p['type'] == 'user'}
+    passenger_child_ids = {p['child_id'] for p in carpool['passengers'] if p['type'] == 'child'}
+
+    participants = [{
+        "id": current_user.user_id,
+        "name": f"{current_user.first_name} {current_user.last_name}",
+        "is_booked": current_user.user_id in passenger_user_ids,
+        "type": "user",
+    }]
+    participants.extend({
+        "id": child.child_id,
+        "name": f"{child.first_name} {child.last_name}",
+        "is_booked": child.child_id in passenger_child_ids,
+        "type": "child",
+    } for child, _ in children)
+
+    return {
+        "all_children_joined": all(child.child_id in passenger_child_ids for child, _ in children),
+        "user_already_joined": current_user.user_id in passenger_user_ids,
+        "participants": participants,
+    }
+
+
+@dashboard_bp.route('/api/protected/dashboard', methods=['GET'])
+@token_required
+def get_dashboard(current_user):
+    """Allt som startsidan behöver i ett anrop, med ett fast antal frågor:
+    användaren, barnen, kommande aktiviteter med samåkningar och bokningsläge
+    samt olästa notiser.
+
+    Med ?filter_by_role=false visas alla synliga aktiviteter, som /activity/no_role.
+    """
+    children = children_with_roles(current_user.user_id)
+
+    if request.args.get('filter_by_role', 'true').lower() == 'false':
+        activities = Activity.query.filter(
+            Activity.start_date >= datetime.now(),
+            Activity.is_visible == True
+        ).all()
+    else:
+        activities = activities_for_user(current_user.user_id)
+    activities.sort(key=lambda activity: activity.start_date)
+
+    listing = build_carpool_listing([activity.activity_id for activity in activities])
+
+    events = []
+    for activity in activities:
+        carpools = [
+            {**carpool, **participant_flags(carpool, current_user, children)}
+            for carpool in listing[activity.activity_id]
+        ]
+        events.append({**serialize_activity(activity), "carpools": carpools})
+
+    return jsonify({
+        "user": {
+            "id": current_user.user_id,
+            "first_name": current_user.first_name,
+            "last_name": current_user.last_name,
+            "roles": user_role_names(current_user.user_id),
+        },
+        "children": [{
+            "child_id": child.child_id,
+            "first_name": child.first_name,
+            "last_name": child.last_name,
+            "role": role_name,
+        } for child, role_name in children],
+        "events": events,
+        "notifications": unread_counts(current_user.user_id),
+    }), 200
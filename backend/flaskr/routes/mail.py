@@ -1,9 +1,10 @@
 from flask import Blueprint, request, jsonify, current_app, url_for
-from flask_mail import Message
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 from werkzeug.security import generate_password_hash
 from models.auth_model import User
-from extensions import mail, db
+from extensions import db
+from mail_outbox import enqueue_email
+from routes.auth import invalidate_user_tokens
 
 mail_bp = Blueprint('mail', __name__)
 
@@ -27,13 +28,8 @@ def reset_password():
     token = serializer.dumps(email, salt='password-reset-salt')
     reset_link = f"http://localhost:3000/reset-password?token={token}&email={email}"
 
-    # Send email
-    msg = Message(
-        subject='Återställning av lösenord',
-        sender=current_app.config['MAIL_USERNAME'],
-        recipients=[email]
-    )
-    msg.body = f"""
+    # Queue email, it is sent by the mail outbox worker
+    body = f"""
     Hej {user.first_name},
 
     Följ länken nedan för att återställa ditt lösenord:
@@ -44,7 +40,7 @@ def reset_password():
     Tack,
     Alltid Redo-supporten
     """
-    msg.html = f"""
+    html = f"""
     <p>Hej {user.first_name},</p>
     <p>Följ länken nedan för att återställa ditt lösenord:</p>
     <p><a href="{reset_link}" style="color:blue;">Återställ lösenord</a></p>
@@ -53,9 +49,16 @@ def reset_password():
     """
 
     try:
-        mail.send(msg)
+        enqueue_email(
+            'Återställning av lösenord',
+            [email],
+            body,
+            html=html,
+            sender=current_app.config['MAIL_USERNAME']
+        )
         return jsonify({'message': 'Password reset email sent successfully'}), 200
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Failed to send email', 'details': str(e)}), 500
 
 @mail_bp.route('/api/auth/reset-password-confirm', methods=['GET'])
@@ -103,5 +106,6 @@ def update_password():
 
     user.password = generate_password_hash(new_password)  # Uppdatera lösenordet
     db.session.commit()
+    invalidate_user_tokens(user.user_id)
 
     return jsonify({'message': 'Lösenordet har uppdaterats'}), 200
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify
 from extensions import db, socketio
 from models.message_model import CarpoolMessage
 from models.auth_model import User, ParentChildLink
@@ -6,18 +6,88 @@ from models.notifications_model import Notification
 from flask_socketio import join_room, leave_room, emit
 from routes.auth import token_required
 from routes.carpool import Carpool
-from datetime import datetime, timedelta
-from dateutil import tz
+from models.carpool_model import Passenger
+from sqlalchemy import select
+from datetime import datetime, timedelta, timezone
 from models.activity_model import Activity
-from flask_mail import Message
-from extensions import mail
+from cache import TTLCache
+from mail_outbox import enqueue_email
+from message_writer import PendingMessage, message_writer
+from unread_counters import increment_unread, push_unread_totals
+from notification_state import (
+    claim_email_notification, email_notification_sent, mark_active, mark_inactive, active_user_ids
+)
+import hashlib
 import json
 
 message_bp = Blueprint('message_bp', __name__)
-active_users = {}
-email_notifications_sent = {}
 
-def send_carpool_notification_email(carpool_id):
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+
+# Avsändarnamn och destination per samåkning för send_message. Ändringar syns efter högst TTL sekunder.
+ROOM_METADATA_CACHE_SIZE = 4096
+ROOM_METADATA_CACHE_TTL = 60
+room_metadata_cache = TTLCache(ROOM_METADATA_CACHE_SIZE, ROOM_METADATA_CACHE_TTL)
+
+def carpool_recipients_filter(carpool, exclude_user_id=None):
+    """Filter för föraren, direktpassagerare och föräldrar till barnpassagerare."""
+    passenger_user_ids = select(Passenger.user_id).where(
+        Passenger.carpool_id == carpool.id, Passenger.user_id.isnot(None)
+    )
+    parent_user_ids = select(ParentChildLink.user_id).join(
+        Passenger, Passenger.child_id == ParentChildLink.child_id
+    ).where(Passenger.carpool_id == carpool.id)
+
+    criteria = db.or_(
+        User.user_id == carpool.driver_id,
+        User.user_id.in_(passenger_user_ids),
+        User.user_id.in_(parent_user_ids)
+    )
+    if exclude_user_id is not None:
+        criteria = db.and_(criteria, User.user_id != exclude_user_id)
+    return criteria
+
+
+def resolve_carpool_recipients(carpool, exclude_user_id=None):
+    """Hämtar föraren, passagerare och föräldrar till barnpassagerare med en fråga."""
+    return User.query.filter(carpool_recipients_filter(carpool, exclude_user_id)).all()
+
+
+def cached_sender_name(user_id):
+    """Avsändarens fullständiga namn, eller None om användaren inte finns."""
+    key = ('user', user_id)
+    name = room_metadata_cache.get(key)
+    if name is None:
+        user = db.session.get(User, user_id) if user_id else None
+        if not user:
+            return None
+        name = f"{user.first_name} {user.last_name}"
+        room_metadata_cache.set(key, name)
+    return name
+
+
+def cached_carpool_destination(carpool_id):
+    """Adressen till samåkningens aktivitet, eller None om samåkningen inte finns."""
+    key = ('carpool', carpool_id)
+    address = room_metadata_cache.get(key)
+    if address is None:
+        row = (
+            db.session.query(Carpool.id, Activity.address)
+            .outerjoin(Activity, Activity.activity_id == Carpool.activity_id)
+            .filter(Carpool.id == carpool_id)
+            .first()
+        )
+        if not row:
+            return None
+        address = row.address or "okänd destination"
+        room_metadata_cache.set(key, address)
+    return address
+
+
+def send_carpool_notification_email(carpool_id, sender_id=None, commit=True):
+    """Köar notismejl till de mottagare som uppfyller villkoren. Med
+    commit=False sparas spärrar och mejl med anroparens transaktion."""
     print(f"send_carpool_notification_email called for carpool_id: {carpool_id}")
     
     carpool = Carpool.query.get(carpool_id)
@@ -35,215 +105,136 @@ def send_carpool_notification_email(carpool_id):
 
     recipients = set()
 
-    # Hämta senaste meddelandet för att identifiera avsändaren
-    last_message = db.session.query(CarpoolMessage).filter_by(carpool_id=carpool_id).order_by(CarpoolMessage.timestamp.desc()).first()
-    if not last_message:
-        print(f"No messages found for carpool {carpool_id}.")
-        return
-
-    sender_id = last_message.sender_id  # Avsändarens ID
-
-    # Hantera direktpassagerare (som lagt till sig själva)
-    for passenger in carpool.passengers:
-        if passenger.user_id and passenger.user_id != sender_id:  # Ignorera avsändaren
-            user = User.query.get(passenger.user_id)
-            if user and user.email:
-                if user.notification_preferences:
-                    notification_preferences = json.loads(user.notification_preferences)
-                else:
-                    notification_preferences = {}
-                if not notification_preferences.get("chat_notifications", False):
-                    print(f"User {user.email} has disabled chat notifications. Skipping.")
-                    continue
-                if email_notifications_sent.get(user.user_id, {}).get(carpool_id, False):
-                    print(f"Email already sent to {user.email} for carpool {carpool_id}. Skipping.")
-                    continue
-
-                # Kontroll 1: >0 olästa meddelanden och inte inloggad på 2 dygn
-                unread_messages_since_last_login = (
-                    db.session.query(CarpoolMessage)
-                    .filter(
-                        CarpoolMessage.carpool_id == carpool_id,
-                        CarpoolMessage.timestamp >= user.last_logged_in if user.last_logged_in else datetime.min
-                    )
-                    .count()
-                )
-                if not user.last_logged_in or user.last_logged_in < two_days_ago:
-                    if unread_messages_since_last_login > 0:
-                        print(f"Adding direct passenger recipient (not logged in 2 days): {user.email}")
-                        recipients.add(user.email)
-                        email_notifications_sent.setdefault(user.user_id, {})[carpool_id] = True
-                        continue
-
-                # Kontroll 2: 5+ olästa meddelanden senaste 1 dygn
-                unread_messages_last_day = (
-                    db.session.query(CarpoolMessage)
-                    .filter(
-                        CarpoolMessage.carpool_id == carpool_id,
-                        CarpoolMessage.timestamp >= one_day_ago
-                    )
-                    .count()
-                )
-                if unread_messages_last_day >= 5:
-                    print(f"Adding direct passenger recipient (5+ unread messages in last day): {user.email}")
-                    recipients.add(user.email)
-                    email_notifications_sent.setdefault(user.user_id, {})[carpool_id] = True
-
-    # Hantera föräldrar till barnpassagerare
-    for passenger in carpool.passengers:
-        parent_links = ParentChildLink.query.filter_by(child_id=passenger.child_id).all()
-        for link in parent_links:
-            parent = User.query.get(link.user_id)
-            if parent and parent.email and parent.user_id != sender_id:  # Ignorera avsändaren
-                if parent.notification_preferences:
-                    notification_preferences = json.loads(parent.notification_preferences)
-                else:
-                    notification_preferences = {}
-                if not notification_preferences.get("chat_notifications", False):
-                    print(f"User {parent.email} has disabled chat notifications. Skipping.")
-                    continue
-                if email_notifications_sent.get(parent.user_id, {}).get(carpool_id, False):
-                    print(f"Email already sent to {parent.email} for carpool {carpool_id}. Skipping.")
-                    continue
-
-                # Kontroll 1: >0 olästa meddelanden och inte inloggad på 2 dygn
-                unread_messages_since_last_login = (
-                    db.session.query(CarpoolMessage)
-                    .filter(
-                        CarpoolMessage.carpool_id == carpool_id,
-                        CarpoolMessage.timestamp >= parent.last_logged_in if parent.last_logged_in else datetime.min
-                    )
-                    .count()
-                )
-                if not parent.last_logged_in or parent.last_logged_in < two_days_ago:
-                    if unread_messages_since_last_login > 0:
-                        print(f"Adding parent recipient (not logged in 2 days): {parent.email}")
-                        recipients.add(parent.email)
-                        email_notifications_sent.setdefault(parent.user_id, {})[carpool_id] = True
-                        continue
-
-                # Kontroll 2: 5+ olästa meddelanden senaste 1 dygn
-                unread_messages_last_day = (
-                    db.session.query(CarpoolMessage)
-                    .filter(
-                        CarpoolMessage.carpool_id == carpool_id,
-                        CarpoolMessage.timestamp >= one_day_ago
-                    )
-                    .count()
-                )
-                if unread_messages_last_day >= 5:
-                    print(f"Adding parent recipient (5+ unread messages in last day): {parent.email}")
-                    recipients.add(parent.email)
-                    email_notifications_sent.setdefault(parent.user_id, {})[carpool_id] = True
-
-    # Hantera föraren
-    if carpool.driver_id and carpool.driver_id != sender_id:  # Ignorera avsändaren
-        driver = User.query.get(carpool.driver_id)
-        if driver and driver.email:
-            if driver.notification_preferences:
-                notification_preferences = json.loads(driver.notification_preferences)
-            else:
-                notification_preferences = {}
-            if not notification_preferences.get("chat_notifications", False):
-                print(f"User {driver.email} has disabled chat notifications. Skipping.")
-                return
-            if email_notifications_sent.get(driver.user_id, {}).get(carpool_id, False):
-                print(f"Email already sent to {driver.email} for carpool {carpool_id}. Skipping.")
-            else:
-                # Kontroll 1: >0 olästa meddelanden och inte inloggad på 2 dygn
-                unread_messages_since_last_login = (
-                    db.session.query(CarpoolMessage)
-                    .filter(
-                        CarpoolMessage.carpool_id == carpool_id,
-                        CarpoolMessage.timestamp >= driver.last_logged_in if driver.last_logged_in else datetime.min
-                    )
-                    .count()
-                )
-                if not driver.last_logged_in or driver.last_logged_in < two_days_ago:
-                    if unread_messages_since_last_login > 0:
-                        print(f"Adding driver recipient (not logged in 2 days): {driver.email}")
-                        recipients.add(driver.email)
-                        email_notifications_sent.setdefault(driver.user_id, {})[carpool_id] = True
-
-                # Kontroll 2: 5+ olästa meddelanden senaste 1 dygn
-                unread_messages_last_day = (
-                    db.session.query(CarpoolMessage)
-                    .filter(
-                        CarpoolMessage.carpool_id == carpool_id,
-                        CarpoolMessage.timestamp >= one_day_ago
-                    )
-                    .count()
-                )
-                if unread_messages_last_day >= 5:
-                    print(f"Adding driver recipient (5+ unread messages in last day): {driver.email}")
-                    recipients.add(driver.email)
-                    email_notifications_sent.setdefault(driver.user_id, {})[carpool_id] = True
-
-    if not recipients:
+    # Utan angiven avsändare är det avsändaren av senaste meddelandet
+    if sender_id is None:
+        last_message = db.session.query(CarpoolMessage).filter_by(carpool_id=carpool_id).order_by(CarpoolMessage.timestamp.desc()).first()
+        if not last_message:
+            print(f"No messages found for carpool {carpool_id}.")
+            return
+        sender_id = last_message.sender_id
+
+    # Förare, direktpassagerare och föräldrar till barnpassagerare, utom avsändaren
+    candidates = []
+    for user in resolve_carpool_recipients(carpool, exclude_user_id=sender_id):
+        if not user.email:
+            continue
+        notification_preferences = json.loads(user.notification_preferences) if user.notification_preferences else {}
+        if not notification_preferences.get("chat_notifications", False):
+            print(f"User {user.email} has disabled chat notifications. Skipping.")
+            continue
+        if email_notification_sent(user.user_id, carpool_id):
+            print(f"Email already sent to {user.email} for carpool {carpool_id}. Skipping.")
+            continue
+        candidates.append(user)
+
+    if not candidates:
         print(f"No recipients found for carpool {carpool_id} who match the criteria.")
         return
 
-    # Skicka email till mottagarna
-    try:
-        with mail.connect() as conn:
-            subject = f"Olästa meddelanden i samåkning {carpool_id}"
-            body = f"""
-                Hej,
-
-                Du har olästa meddelanden i en av dina samåknings-konversationer. Logga in på
-                http://redo.kustscoutjonstorp.se för att läsa.
-                Hälsningar, Redo-supporten.
-                """
-            html_body = f"""
-                <p>Hej,</p>
-                <p>Du har olästa meddelanden i en av dina samåknings-konversationer. Logga in via</p>
-                <p><a href="http://redo.kustscoutjonstorp.se" style="color:blue;">denna länk</a>
-                för att läsa.</p>
-                <p>Hälsningar, Redo-supporten</p>
-                """
-            msg = Message(subject=subject, recipients=list(recipients), body=body, sender="redo@kustscoutjonstorp.com")
-            msg.html = html_body
-            conn.send(msg)
-        print(f"Email sent to recipients: {recipients}")
-    except Exception as e:
-        print(f"Error sending email: {e}")
-
-
-def create_notification(user_id, carpool_id, message, message_id=None):
-    """Creates a notification for a user about a carpool message."""
-    notification = Notification(
-        user_id=user_id,
-        carpool_id=carpool_id,
-        message_id=message_id,
-        message=message,
-        is_read=False,
-        created_at=datetime.utcnow()
+    # Antal meddelanden senaste dygnet är samma för alla mottagare
+    messages_last_day = (
+        db.session.query(db.func.count(CarpoolMessage.id))
+        .filter(CarpoolMessage.carpool_id == carpool_id, CarpoolMessage.timestamp >= one_day_ago)
+        .scalar()
+    )
+
+    # Antal meddelanden sedan senaste inloggning, för alla mottagare i en grupperad fråga
+    messages_since_last_login = dict(
+        db.session.query(User.user_id, db.func.count(CarpoolMessage.id))
+        .join(CarpoolMessage, db.and_(
+            CarpoolMessage.carpool_id == carpool_id,
+            CarpoolMessage.timestamp >= db.func.coalesce(User.last_logged_in, datetime.min)
+        ))
+        .filter(User.user_id.in_([user.user_id for user in candidates]))
+        .group_by(User.user_id)
+        .all()
     )
-    db.session.add(notification)
-    db.session.commit()
 
-    # Kontrollera om vi behöver query
-    created_notification = Notification.query.filter_by(
-        user_id=user_id, 
-        carpool_id=carpool_id, 
-        message_id=message_id,
-        message=message
-    ).order_by(Notification.created_at.desc()).first()
+    for user in candidates:
+        # Kontroll 1: >0 olästa meddelanden och inte inloggad på 2 dygn
+        if not user.last_logged_in or user.last_logged_in < two_days_ago:
+            if messages_since_last_login.get(user.user_id, 0) > 0:
+                # En annan process kan ha hunnit skicka sedan kontrollen ovan
+                if claim_email_notification(user.user_id, carpool_id, commit=commit):
+                    print(f"Adding recipient (not logged in 2 days): {user.email}")
+                    recipients.add(user.email)
+                continue
 
-    return notification
+        # Kontroll 2: 5+ olästa meddelanden senaste 1 dygn
+        if messages_last_day >= 5 and claim_email_notification(user.user_id, carpool_id, commit=commit):
+            print(f"Adding recipient (5+ unread messages in last day): {user.email}")
+            recipients.add(user.email)
 
-# Helper function to notify users in a carpool
-def notify_users_in_carpool(carpool_id, message, sender_id, message_id):
-    # Initiera active_users om det saknas
-    if carpool_id not in active_users:
-        active_users[carpool_id] = set()
+    if not recipients:
+        print(f"No recipients found for carpool {carpool_id} who match the criteria.")
+        return
 
+    # Lägg mejlet i utkorgen, det skickas av bakgrundsworkern
+    subject = f"Olästa meddelanden i samåkning {carpool_id}"
+    body = f"""
+        Hej,
+
+        Du har olästa meddelanden i en av dina samåknings-konversationer. Logga in på
+        http://redo.kustscoutjonstorp.se för att läsa.
+        Hälsningar, Redo-supporten.
+        """
+    html_body = f"""
+        <p>Hej,</p>
+        <p>Du har olästa meddelanden i en av dina samåknings-konversationer. Logga in via</p>
+        <p><a href="http://redo.kustscoutjonstorp.se" style="color:blue;">denna länk</a>
+        för att läsa.</p>
+        <p>Hälsningar, Redo-supporten</p>
+        """
+    enqueue_email(subject, recipients, body, html=html_body, commit=commit)
+    print(f"Email queued for recipients: {recipients}")
+
+
+def create_notifications(user_ids, carpool_id, message, message_id=None, commit=True):
+    """Skapar notiser för flera användare med en insert och en commit.
+    Med commit=False sparas de med anroparens transaktion.
+
+    Returnerar {user_id: notification_id}.
+    """
+    now = datetime.utcnow()
+    notifications = [
+        Notification(
+            user_id=user_id,
+            carpool_id=carpool_id,
+            message_id=message_id,
+            message=message,
+            is_read=False,
+            created_at=now
+        )
+        for user_id in user_ids
+    ]
+    db.session.add_all(notifications)
+    # Läs id:n före commit, annars laddas varje objekt om efteråt
+    db.session.flush()
+    notification_ids = {notification.user_id: notification.id for notification in notifications}
+    increment_unread(notifications)
+    if commit:
+        db.session.commit()
+    return notification_ids
+
+def stage_carpool_notifications(carpool_id, message, sender_id, message_id):
+    """Skapar notiser om ett chattmeddelande utan att committa. Returnerar en
+    funktion som skickar dem till användarna när transaktionen är sparad."""
     carpool = Carpool.query.get(carpool_id)
     if not carpool:
         print(f"Carpool {carpool_id} not found.")
-        return
+        return None
+
+    # Användare som har chatten öppen behöver ingen notis
+    active_users = active_user_ids(carpool_id)
 
-    notified_users = set()  # För att undvika dubblerade notifieringar
+    # Förare, direktpassagerare och föräldrar till barnpassagerare, utom avsändaren
+    recipient_ids = [
+        user_id for (user_id,) in
+        db.session.query(User.user_id).filter(carpool_recipients_filter(carpool, exclude_user_id=sender_id))
+        if user_id not in active_users
+    ]
+    if not recipient_ids:
+        return None
 
     # Hämta bilinformation (om det finns)
     car_info = f"{carpool.car.model_name}" if carpool.car else "Ingen bil tilldelad"
@@ -259,79 +250,132 @@ def notify_users_in_carpool(carpool_id, message, sender_id, message_id):
         "car_info": car_info,
     }
 
-    # Notify the carpool driver if they are not the sender or active
-    if carpool.driver_id != sender_id and carpool.driver_id not in active_users[carpool_id]:
-        if carpool.driver_id not in notified_users:
-            notification = create_notification(
-                user_id=carpool.driver_id, carpool_id=carpool_id, message=message, message_id=message_id
-            )
+    notification_ids = create_notifications(recipient_ids, carpool_id, message, message_id, commit=False)
+
+    def emit_notifications():
+        for user_id, notification_id in notification_ids.items():
             socketio.emit(
                 'notification',
                 {
-                    'id': notification.id,
+                    'id': notification_id,
                     'message': message,
                     'carpool_details': carpool_details,
-                    'user_id': carpool.driver_id,
+                    'user_id': user_id,
                     'type': "chat"
                 },
-                room=f'user_{carpool.driver_id}'
+                room=f'user_{user_id}'
             )
-            notified_users.add(carpool.driver_id)
-
-    # Notify parents of passengers if they are not active
-    for passenger in carpool.passengers:
-        parent_links = ParentChildLink.query.filter_by(child_id=passenger.child_id).all()
-        for parent_link in parent_links:
-            if parent_link.user_id != sender_id and parent_link.user_id not in active_users[carpool_id]:
-                if parent_link.user_id not in notified_users:
-                    notification = create_notification(
-                        user_id=parent_link.user_id, carpool_id=carpool_id, message=message, message_id=message_id
-                    )
-                    socketio.emit(
-                        'notification',
-                        {
-                            'id': notification.id,
-                            'message': message,
-                            'carpool_details': carpool_details,
-                            'user_id': parent_link.user_id,
-                            'type': "chat"
-                        },
-                        room=f'user_{parent_link.user_id}'
-                    )
-                    notified_users.add(parent_link.user_id)
-
-        if passenger.user_id and passenger.user_id != sender_id:
-            if passenger.user_id not in active_users[carpool_id] and passenger.user_id not in notified_users:
-                notification = create_notification(
-                    user_id=passenger.user_id, carpool_id=carpool_id, message=message, message_id=message_id
-                )
-                socketio.emit(
-                    'notification',
-                    {
-                        'id': notification.id,
-                        'message': message,
-                        'carpool_details': carpool_details,
-                        'user_id': passenger.user_id,
-                        'type': "chat"
-                    },
-                    room=f'user_{passenger.user_id}'
-                )
-                notified_users.add(passenger.user_id)
 
+        push_unread_totals(notification_ids.keys())
+
+    return emit_notifications
+
+
+@message_writer.before_commit
+def stage_message_notifications(batch):
+    """Notiser och notismejl för en batch chattmeddelanden, i skrivarens
+    transaktion. Blir commit av, sparas varken meddelanden eller notiser."""
+    emitters = [
+        stage_carpool_notifications(
+            pending.carpool_id, f"meddelande i samåkning till {pending.destination}",
+            pending.sender_id, pending.message_id
+        )
+        for pending in batch
+    ]
+    # Mejlvillkoren gäller samåkningen, så en kontroll per avsändare räcker
+    for carpool_id, sender_id in dict.fromkeys((pending.carpool_id, pending.sender_id) for pending in batch):
+        send_carpool_notification_email(carpool_id, sender_id=sender_id, commit=False)
+
+    def after_commit():
+        for emit_notifications in emitters:
+            if emit_notifications:
+                emit_notifications()
+
+    return after_commit
+
+
+def parse_since(value):
+    """Tolkar en ISO-tidsstämpel. Tidszonsmedvetna tider görs om till naiv UTC som i databasen."""
+    since = datetime.fromisoformat(value)
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def history_etag(carpool_id, args):
+    """ETag för en historiksida. Meddelanden läggs bara till, så antal och
+    största id ändras när historiken ändras. Frågan täcks av indexet."""
+    count, last_id = (
+        db.session.query(db.func.count(CarpoolMessage.id), db.func.max(CarpoolMessage.id))
+        .filter(CarpoolMessage.carpool_id == carpool_id)
+        .one()
+    )
+    raw = f"{carpool_id}:{count}:{last_id}:{sorted(args.items())}"
+    return hashlib.sha1(raw.encode()).hexdigest()
 
 
 @message_bp.route('/api/carpool/<int:carpool_id>/messages', methods=['GET'])
 @token_required
 def get_carpool_messages(current_user, carpool_id):
-    """Hämtar historiska meddelanden för en given carpool, inklusive användarens namn."""
-    messages = (
+    """Hämtar meddelanden för en given carpool, inklusive användarens namn, äldst först.
+
+    Utan parametrar returneras de senaste `limit` meddelandena. before_id ger
+    äldre meddelanden, after_id och since bara de som kommit till efteråt.
+    Header X-Has-More anger om det finns fler meddelanden åt samma håll.
+    """
+    limit = request.args.get('limit', default=MESSAGES_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MESSAGES_MAX_PAGE_SIZE))
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    since = request.args.get('since')
+
+    etag = history_etag(carpool_id, request.args.to_dict())
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    query = (
         db.session.query(CarpoolMessage, User)
         .join(User, CarpoolMessage.sender_id == User.user_id)
         .filter(CarpoolMessage.carpool_id == carpool_id)
-        .order_by(CarpoolMessage.timestamp.asc())
-        .all()
     )
-    
+
+    # Keyset-paginering på (timestamp, id) relativt ett känt meddelande
+    anchor_id = before_id or after_id
+    if anchor_id:
+        anchor = CarpoolMessage.query.filter_by(id=anchor_id, carpool_id=carpool_id).first()
+        if not anchor:
+            return jsonify({'error': 'Message not found'}), 404
+        if before_id:
+            query = query.filter(db.or_(
+                CarpoolMessage.timestamp < anchor.timestamp,
+                db.and_(CarpoolMessage.timestamp == anchor.timestamp, CarpoolMessage.id < anchor.id)
+            ))
+        else:
+            query = query.filter(db.or_(
+                CarpoolMessage.timestamp > anchor.timestamp,
+                db.and_(CarpoolMessage.timestamp == anchor.timestamp, CarpoolMessage.id > anchor.id)
+            ))
+    elif since:
+        try:
+            query = query.filter(CarpoolMessage.timestamp > parse_since(since))
+        except ValueError:
+            return jsonify({'error': 'Invalid since timestamp'}), 400
+
+    # Framåt (after_id/since) läses äldst först, annars nyast först och vänds
+    forward = bool(after_id or (since and not before_id))
+    if forward:
+        query = query.order_by(CarpoolMessage.timestamp.asc(), CarpoolMessage.id.asc())
+    else:
+        query = query.order_by(CarpoolMessage.timestamp.desc(), CarpoolMessage.id.desc())
+
+    messages = query.limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if not forward:
+        messages.reverse()
+
     # Skapa en lista med alla meddelanden och relevant användarinformation
     messages_data = [{
         'id': msg.CarpoolMessage.id,
@@ -342,7 +386,11 @@ def get_carpool_messages(current_user, carpool_id):
         'status': msg.CarpoolMessage.status
     } for msg in messages]
 
-    return jsonify(messages_data), 200
+    response = jsonify(messages_data)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['X-Has-More'] = 'true' if has_more else 'false'
+    return response, 200
 
 # Socket.IO-händelsehanterare för anslutning, chattrum och meddelanden
 @socketio.on('join_carpool')
@@ -354,9 +402,7 @@ def handle_join_carpool(data):
         return
 
     join_room(f'carpool_{carpool_id}')
-    if carpool_id not in active_users:
-        active_users[carpool_id] = set()
-    active_users[carpool_id].add(user_id)
+    mark_active(user_id, carpool_id)
 
 @socketio.on('leave_carpool')
 def handle_leave_carpool(data):
@@ -367,10 +413,7 @@ def handle_leave_carpool(data):
         return
 
     leave_room(f'carpool_{carpool_id}')
-    if carpool_id in active_users:
-        active_users[carpool_id].discard(user_id)
-        if not active_users[carpool_id]:  # Rensa tomma rum
-            del active_users[carpool_id]
+    mark_inactive(user_id, carpool_id)
 
 @socketio.on('join_user')
 def handle_join_user_room(data):
@@ -397,59 +440,45 @@ def handle_send_message(data):
         emit('error', {'error': 'Message content is required!'}, room=request.sid)
         return
 
-    # Hämta användaren för att inkludera namnet i meddelandet
-    sender = User.query.get(sender_id)
-    if not sender:
+    # Namn och destination hämtas ur en kort cache i stället för från databasen per meddelande
+    sender_name = cached_sender_name(sender_id)
+    if not sender_name:
         emit('error', {'error': 'Sender not found.'}, room=request.sid)
         return
 
-    # Hämta `activity_id` från `Carpool`
-    carpool = db.session.query(Carpool).filter_by(id=carpool_id).first()
-    if not carpool:
+    activity_address = cached_carpool_destination(carpool_id)
+    if activity_address is None:
         emit('error', {'error': 'Carpool not found.'}, room=request.sid)
         return
 
-    # Hämta `address` från `Activity` baserat på `activity_id`
-    activity = db.session.query(Activity).filter_by(activity_id=carpool.activity_id).first()
-    activity_address = activity.address if activity else "okänd destination"
-
-    # Define timezone conversion
-    from_zone = tz.tzutc()
-    to_zone = tz.tzlocal()  # This converts to the server's local timezone
+    # Lämna tillbaka anslutningen innan vi väntar på skrivaren. Annars håller
+    # väntande avsändare hela poolen och skrivaren får ingen anslutning
+    db.session.close()
 
-    # Get UTC time for the message
-    utc_timestamp = datetime.utcnow()
-    utc_timestamp = utc_timestamp.replace(tzinfo=from_zone)  # Mark it as UTC
-    
-    # Convert UTC timestamp to local time
-    local_timestamp = utc_timestamp.astimezone(to_zone)
-
-    # Spara meddelandet i databasen med UTC-tid
-    message = CarpoolMessage(
-        sender_id=sender_id,
+    # Meddelandet sparas i nästa batch av skrivaren, tillsammans med notiser och
+    # notismejl. Skrivaren skickar new_message till rummet i den ordning
+    # meddelandena sparades
+    pending = message_writer.submit(PendingMessage(
         carpool_id=carpool_id,
+        sender_id=sender_id,
+        sender_name=sender_name,
         content=content,
-        timestamp=utc_timestamp,  # Still saving in UTC to the database
-        status='sent'
-    )
-    
-    db.session.add(message)
-    db.session.commit()
-
-    send_carpool_notification_email(carpool_id)
-
-    # Skicka meddelandet till alla anslutna klienter i rummet
-    emit('new_message', {
-        'carpool_id': carpool_id,
-        'message': {
-            'id': message.id,
-            'sender_id': message.sender_id,
-            'sender_name': f"{sender.first_name} {sender.last_name}",
-            'content': message.content,
-            'timestamp': local_timestamp.isoformat()  # Sending local time to clients
-        }
-    }, room=f'carpool_{carpool_id}')
-
-    # Skapa och skicka notifikation
-    notification_message = f"meddelande i samåkning till {activity_address}"
-    notify_users_in_carpool(carpool_id, notification_message, message.sender_id, message.id)
\ No newline at end of file
+        timestamp=datetime.now(timezone.utc),
+        destination=activity_address
+    ))
+    timeout = current_app.config['MESSAGE_WRITE_TIMEOUT']
+    if not pending.wait(timeout):
+        if pending.cancel():
+            # Meddelandet sparas inte, så klienten kan skicka det igen
+            emit('error', {'error': 'Message could not be saved.'}, room=request.sid)
+            return {'status': 'error'}
+        # Skrivaren har redan börjat spara det. Ett nytt försök skulle ge en
+        # dubblett, så klienten får new_message när det är klart
+        if not pending.wait(timeout):
+            return {'status': 'pending'}
+    if pending.error:
+        emit('error', {'error': 'Message could not be saved.'}, room=request.sid)
+        return {'status': 'error'}
+
+    # Bekräftelse till avsändaren när meddelandet är sparat
+    return {'status': 'ok', 'id': pending.message_id}
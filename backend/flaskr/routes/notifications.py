@@ -1,122 +1,111 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
+import base64
 from extensions import db
 from models.notifications_model import Notification
 from routes.auth import token_required
-from models.carpool_model import Carpool, Car
-from routes.message import email_notifications_sent
+from models.carpool_model import Carpool
+from notification_state import reset_email_notification
+from maintenance import purge_read_notifications
+from unread_counters import decrement_unread, unread_counts, unread_totals
+from routes.serializers import get_lookup, serialize_carpool_details, serialize_passengers
 from flask_socketio import emit
 from models.activity_model import Activity
-from models.auth_model import User, Child, ParentChildLink, Role
+from routes.activity import scout_level_by_role_id
 
 notifications_bp = Blueprint('notifications_bp', __name__)
 
-role_mapping = {
-    'vårdnadshavare': 1,
-    'ledare': 2,
-    'kutar': 3,
-    'tumlare': 4,
-    'upptäckare': 5,
-    'äventyrare': 6,
-    'utmanare': 7,
-    'rover': 8,
-    'vuxenscout': 10
-}
+NOTIFICATIONS_PAGE_SIZE = 50
+NOTIFICATIONS_MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(notification):
+    """Kodar id:t för den sista notisen på en sida till en opak cursor.
+    created_at kan vara NULL, så bara id används som nyckel."""
+    return base64.urlsafe_b64encode(str(notification.id).encode()).decode()
+
+
+def decode_cursor(cursor):
+    return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+
 
 @notifications_bp.route('/api/notifications', methods=['GET'])
 @token_required
 def get_notifications(current_user):
-    limit = request.args.get('limit', default=None, type=int)
-    query = Notification.query.filter_by(user_id=current_user.user_id).order_by(Notification.created_at.desc())
-    
-    if limit:
-        query = query.limit(limit)
-    
-    notifications = query.all()
-
-    notifications_data = []
-    for n in notifications:
-        carpool = Carpool.query.get(n.carpool_id)
-        activity = Activity.query.get(carpool.activity_id) if carpool else None  
-        car = Car.query.get(carpool.car_id)
-
-        scout_level_name = None
-        if activity:
-            role = Role.query.get(activity.role_id)
-            scout_level_name = role.name if role else None
-
-        passengers = []
-        for passenger in carpool.passengers:
-            # Hantera om passageraren är ett barn
-            if passenger.child_id:
-                child = Child.query.get(passenger.child_id)
-                if child:
-                    # Hämta föräldrar från ParentChildLink
-                    parent_links = ParentChildLink.query.filter_by(child_id=child.child_id).all()
-                    parents = [
-                        {
-                            "parent_id": parent.user_id,
-                            "parent_name": f"{User.query.get(parent.user_id).first_name} {User.query.get(parent.user_id).last_name}",
-                            "parent_phone": User.query.get(parent.user_id).phone
-                        }
-                        for parent in parent_links
-                    ]
-                    passengers.append({
-                        "type": "child",
-                        "child_id": child.child_id,
-                        "name": f"{child.first_name} {child.last_name}",
-                        "phone": child.phone,
-                        "parents": parents
-                    })
-
-            # Hantera om passageraren är en användare
-            elif passenger.user_id:
-                user = User.query.get(passenger.user_id)
-                if user:
-                    passengers.append({
-                        "type": "user",
-                        "user_id": user.user_id,
-                        "name": f"{user.first_name} {user.last_name}",
-                        "phone": user.phone
-                    })
-
-        carpool_details = {
-            "id": carpool.id,
-            "driver_id": carpool.driver_id,
-            "car_id": carpool.car_id,
-            "car_model_name": car.model_name if car else "Ingen bil tilldelad",
-            "available_seats": carpool.available_seats,
-            "departure_address": carpool.departure_address,
-            "departure_postcode": carpool.departure_postcode,
-            "departure_city": carpool.departure_city,
-            "carpool_type": carpool.carpool_type,
-            "passengers": passengers
-        } if carpool else None
-
-        activity_details = {
+    limit = request.args.get('limit', default=NOTIFICATIONS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, NOTIFICATIONS_MAX_PAGE_SIZE))
+    cursor = request.args.get('cursor')
+
+    query = Notification.query.filter_by(user_id=current_user.user_id)
+
+    # Keyset-paginering på id, nyaste först. Id:n delas ut i samma ordning som created_at.
+    if cursor:
+        try:
+            cursor_id = decode_cursor(cursor)
+        except (ValueError, UnicodeDecodeError):
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.filter(Notification.id < cursor_id)
+
+    notifications = (
+        query
+        .order_by(Notification.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(notifications) > limit
+    notifications = notifications[:limit]
+
+    # Hämta carpool- och aktivitetsdetaljer en gång per unik carpool på sidan
+    lookup = get_lookup()
+    carpools = lookup.load(Carpool, [n.carpool_id for n in notifications])
+    activities = lookup.load(Activity, [carpool.activity_id for carpool in carpools.values()])
+    passengers = serialize_passengers(carpools.keys(), lookup=lookup)
+
+    carpool_details = {
+        carpool_id: serialize_carpool_details(carpool, passengers[carpool_id])
+        for carpool_id, carpool in carpools.items()
+    }
+    activity_details = {
+        activity.activity_id: {
             "activity_id": activity.activity_id,
             "summary": activity.name,
             "dtstart": activity.start_date.isoformat(),
             "dtend": activity.end_date.isoformat() if activity.end_date else None,
             "location": activity.address,
             "description": activity.description,
-            "scout_level": list(role_mapping.keys())[list(role_mapping.values()).index(activity.role_id)]
-            if activity.role_id in role_mapping.values() else None
-        } if activity else None
+            "scout_level": scout_level_by_role_id.get(activity.role_id)
+        }
+        for activity in activities.values()
+    }
 
+    notifications_data = []
+    for n in notifications:
+        carpool = carpools.get(n.carpool_id)
         notification_type = "chat" if n.message_id else "passenger"
 
         notifications_data.append({
             "id": n.id,
             "message": n.message,
-            "carpool_details": carpool_details,
-            "activity_details": activity_details,  
+            "carpool_details": carpool_details.get(n.carpool_id),
+            "activity_details": activity_details.get(carpool.activity_id) if carpool else None,
             "is_read": n.is_read,
             "created_at": n.created_at.isoformat(),
             "type": notification_type,  # Lägg till typ
         })
 
-    unread_count = sum(1 for n in notifications if not n.is_read)
-    return jsonify({"notifications": notifications_data, "unreadCount": unread_count}), 200
+    unread_count = unread_totals([current_user.user_id])[current_user.user_id]
+
+    return jsonify({
+        "notifications": notifications_data,
+        "unreadCount": unread_count,
+        "next_cursor": encode_cursor(notifications[-1]) if has_more else None
+    }), 200
+
+
+@notifications_bp.route('/api/notifications/unread-count', methods=['GET'])
+@token_required
+def get_unread_count(current_user):
+    """Antal olästa notiser, totalt och per samåkning och typ, ur räknartabellen."""
+    return jsonify(unread_counts(current_user.user_id)), 200
 
 
 
@@ -142,17 +131,18 @@ def mark_notifications_as_read(current_user):
         )
         query = query.filter(Notification.message_id.isnot(None) if notif_type == 'chat' else Notification.message_id.is_(None))
 
-        notifications = query.all()
-
-        if not notifications:
+        # Markera alla notifikationer som lästa
+        updated = query.update({'is_read': True}, synchronize_session=False)
+        if not updated:
             return jsonify({"message": f"No unread {notif_type} notifications found"}), 200
 
-        # Markera alla notifikationer som lästa
-        query.update({'is_read': True}, synchronize_session=False)
+        decrement_unread(current_user.user_id, carpool_id, notif_type, updated)
+        # Utan lagringstid raderas de lästa notiserna direkt, i samma transaktion
+        if current_app.config['NOTIFICATION_RETENTION_DAYS'] <= 0:
+            purge_read_notifications(0, current_user.user_id, carpool_id, notif_type)
         db.session.commit()
 
         reset_email_notification_flag(current_user.user_id, carpool_id)
-        delete_read_notifications(current_user.user_id, carpool_id, notif_type)
 
         # Skicka socket-event
         emit(
@@ -160,7 +150,8 @@ def mark_notifications_as_read(current_user):
             {
                 'message': f"{notif_type.capitalize()} notifications updated",
                 'carpool_id': carpool_id,
-                'type': notif_type
+                'type': notif_type,
+                'unreadCount': unread_totals([current_user.user_id])[current_user.user_id]
             },
             room=f"user_{current_user.user_id}",
             namespace='/'
@@ -173,37 +164,6 @@ def mark_notifications_as_read(current_user):
         return jsonify({"error": "Internal server error"}), 500
 
 
-def delete_read_notifications(user_id, carpool_id=None, notif_type=None):
-    # Local helper function
-    try:
-        query = Notification.query.filter_by(user_id=user_id, is_read=True)
-        if carpool_id:
-            query = query.filter_by(carpool_id=carpool_id)
-
-        # Filtrera baserat på type
-        if notif_type == 'message':
-            query = query.filter(Notification.message_id.isnot(None))  # Endast med message_id
-        elif notif_type == 'passenger':
-            query = query.filter(Notification.message_id.is_(None))  # Endast utan message_id
-
-        # Hämta och radera alla matchande notifikationer
-        notifications_to_delete = query.all()
-        if notifications_to_delete:
-            for notification in notifications_to_delete:
-                db.session.delete(notification)
-            db.session.commit()
-
-    except Exception as e:
-        print(f"Error deleting read notifications: {str(e)}")
-
-
 def reset_email_notification_flag(user_id, carpool_id):
-    """Nollställer email_notifications_sent-flaggan för användaren och samåkningen."""
-    if user_id in email_notifications_sent:
-        if carpool_id in email_notifications_sent[user_id]:
-            del email_notifications_sent[user_id][carpool_id]
-
-        # Ta bort användaren från email_notifications_sent om alla carpools har tagits bort
-        if not email_notifications_sent[user_id]:
-            del email_notifications_sent[user_id]
-
+    """Nollställer flaggan för skickat notismejl för användaren och samåkningen."""
+    reset_email_notification(user_id, carpool_id)
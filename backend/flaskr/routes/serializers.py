@@ -0,0 +1,156 @@
+from flask import g, has_app_context
+from models.auth_model import User, Child, ParentChildLink
+from models.carpool_model import Passenger
+
+
+class EntityLookup:
+    """Uppslagstabell per request för objekt som används vid serialisering.
+
+    Varje objekt hämtas högst en gång per request, och id:n som saknas hämtas
+    med en IN-fråga per modell.
+    """
+
+    def __init__(self):
+        self._entities = {}
+        self._parent_ids = {}
+
+    def load(self, model, ids):
+        """Returnerar en dict id -> objekt. Okända id:n hämtas i en fråga."""
+        ids = {i for i in ids if i is not None}
+        cache = self._entities.setdefault(model, {})
+        missing = ids - cache.keys()
+        if missing:
+            pk = model.__mapper__.primary_key[0]
+            for entity in model.query.filter(pk.in_(missing)).all():
+                cache[getattr(entity, pk.key)] = entity
+            for i in missing:
+                cache.setdefault(i, None)
+        return {i: cache[i] for i in ids if cache[i] is not None}
+
+    def get(self, model, entity_id):
+        return self.load(model, [entity_id]).get(entity_id)
+
+    def parent_ids(self, child_ids):
+        """Returnerar en dict child_id -> [förälderns user_id]. Okända barn hämtas i en fråga."""
+        child_ids = {i for i in child_ids if i is not None}
+        missing = child_ids - self._parent_ids.keys()
+        if missing:
+            for child_id in missing:
+                self._parent_ids[child_id] = []
+            for link in ParentChildLink.query.filter(ParentChildLink.child_id.in_(missing)).all():
+                self._parent_ids[link.child_id].append(link.user_id)
+        return {i: self._parent_ids[i] for i in child_ids}
+
+
+def get_lookup():
+    """Returnerar uppslagstabellen för aktuell request (eller en ny utanför en kontext)."""
+    if not has_app_context():
+        return EntityLookup()
+    if 'entity_lookup' not in g:
+        g.entity_lookup = EntityLookup()
+    return g.entity_lookup
+
+
+def serialize_passengers(carpool_ids, prefixed_keys=False, lookup=None):
+    """Serialiserar passagerarna i de angivna samåkningarna.
+
+    Returnerar en dict carpool_id -> lista med passagerare. Barn får med sina
+    föräldrar. Med prefixed_keys används formatet från
+    /api/carpool/<id>/passengers (child_name, user_name, ...).
+    """
+    lookup = lookup or get_lookup()
+    carpool_ids = list(carpool_ids)
+    serialized = {carpool_id: [] for carpool_id in carpool_ids}
+    if not carpool_ids:
+        return serialized
+
+    passengers = (
+        Passenger.query
+        .filter(Passenger.carpool_id.in_(carpool_ids))
+        .order_by(Passenger.id)
+        .all()
+    )
+
+    child_ids = [p.child_id for p in passengers if p.child_id]
+    children = lookup.load(Child, child_ids)
+    parent_ids = lookup.parent_ids(child_ids)
+
+    user_ids = [p.user_id for p in passengers if p.user_id and not p.child_id]
+    for ids in parent_ids.values():
+        user_ids.extend(ids)
+    users = lookup.load(User, user_ids)
+
+    for passenger in passengers:
+        # Hantera om passageraren är ett barn
+        if passenger.child_id:
+            child = children.get(passenger.child_id)
+            if not child:
+                continue
+            parents = [
+                {
+                    "parent_id": parent_id,
+                    "parent_name": f"{users[parent_id].first_name} {users[parent_id].last_name}",
+                    "parent_phone": users[parent_id].phone
+                }
+                for parent_id in parent_ids.get(child.child_id, [])
+                if parent_id in users
+            ]
+            if prefixed_keys:
+                entry = {
+                    "type": "child",
+                    "child_id": child.child_id,
+                    "child_name": f"{child.first_name} {child.last_name}",
+                    "child_phone": child.phone,
+                    "parents": parents
+                }
+            else:
+                entry = {
+                    "type": "child",
+                    "child_id": child.child_id,
+                    "name": f"{child.first_name} {child.last_name}",
+                    "phone": child.phone,
+                    "parents": parents
+                }
+
+        # Hantera om passageraren är en användare
+        elif passenger.user_id:
+            user = users.get(passenger.user_id)
+            if not user:
+                continue
+            if prefixed_keys:
+                entry = {
+                    "type": "user",
+                    "user_id": user.user_id,
+                    "user_name": f"{user.first_name} {user.last_name}",
+                    "user_phone": user.phone,
+                    "parents": []  # Tom lista för att matcha frontend-struktur
+                }
+            else:
+                entry = {
+                    "type": "user",
+                    "user_id": user.user_id,
+                    "name": f"{user.first_name} {user.last_name}",
+                    "phone": user.phone
+                }
+        else:
+            continue
+
+        serialized[passenger.carpool_id].append(entry)
+
+    return serialized
+
+
+def serialize_carpool_details(carpool, passengers):
+    """Samåkningsdetaljer som de skickas med notiser."""
+    return {
+        "id": carpool.id,
+        "driver_id": carpool.driver_id,
+        "car_id": carpool.car_id,
+        "car_model_name": carpool.car.model_name if carpool.car else "Ingen bil tilldelad",
+        "available_seats": carpool.available_seats,
+        "departure_address": carpool.departure_address,
+        "departure_postcode": carpool.departure_postcode,
+        "departure_city": carpool.departure_city,
+        "carpool_type": carpool.carpool_type,
+        "passengers": passengers
+    }
@@ -4,7 +4,8 @@ from extensions import db
 from models.auth_model import User, Role, UserRole, Child, ParentChildLink
 from functools import wraps
 from datetime import datetime
-from routes.auth import token_required  # Import token_required decorator
+from routes.auth import token_required, invalidate_user_tokens, current_role_ids, role_names_by_id  # Import token_required decorator
+from carpool_snapshots import activity_ids_for_child, activity_ids_for_user, invalidate_activities
 import json
 
 user_handler = Blueprint('user_handler', __name__)
@@ -52,19 +53,30 @@ def add_address(current_user):
             return jsonify({"error": f"Failed to update notification preferences: {str(e)}"}), 500
 
     db.session.commit()
+    invalidate_user_tokens(current_user.user_id)
+    # Namn och telefon syns i carpool-listorna där användaren är med
+    invalidate_activities(activity_ids_for_user(current_user.user_id))
 
     return make_response(jsonify({"message": "Profile updated!"}), 200)
 
+def user_role_names(user_id):
+    """Användarens rollnamn, från token om möjligt."""
+    role_ids = current_role_ids(user_id)
+    if role_ids is not None:
+        names = role_names_by_id()
+        return [names[role_id] for role_id in sorted(role_ids) if role_id in names]
+    user_roles = db.session.query(Role.name).join(UserRole, Role.role_id == UserRole.role_id).filter(
+        UserRole.user_id == user_id
+    ).all()
+    return [role.name for role in user_roles]
+
+
 # Exempel på en skyddad route som returnerar inloggad användare och deras roll
 @user_handler.route('/api/protected/user', methods=['GET'])
 @token_required
 def get_logged_in_user(current_user):
     # Hämta användarens roll(er)
-    user_roles = db.session.query(Role.name).join(UserRole, Role.role_id == UserRole.role_id).filter(
-        UserRole.user_id == current_user.user_id
-    ).all()
-
-    role_names = [role.name for role in user_roles] if user_roles else ["Ingen roll tilldelad"]
+    role_names = user_role_names(current_user.user_id) or ["Ingen roll tilldelad"]
 
     # Skapa ett svar med den inloggade användarens information
     user_data = {
@@ -174,6 +186,9 @@ def delete_child(current_user):
     if not link:
         return jsonify({"error": "No link found between current user and specified child!"}), 404
 
+    # Barnets föräldrar syns i carpool-listorna där barnet åker med
+    activity_ids = activity_ids_for_child(child_to_unlink.child_id)
+
     # Ta bort länken
     db.session.delete(link)
     db.session.commit()
@@ -183,6 +198,7 @@ def delete_child(current_user):
     if not remaining_links:
         db.session.delete(child_to_unlink)
         db.session.commit()
+    invalidate_activities(activity_ids)
 
     return jsonify({"message": f"Unlinked child {child_to_unlink.first_name} {child_to_unlink.last_name} from current user!"}), 200
 
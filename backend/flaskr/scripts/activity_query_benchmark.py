@@ -0,0 +1,205 @@
+"""Mäter /api/protected/activity/by_role mot syntetiska data med tusentals
+aktiviteter, med den tidigare implementationen (en rollfråga per barn och
+fyra aktivitetsfrågor) som jämförelse. Implementationerna körs om vartannat.
+
+Skapar en temporär SQLite-databas med aktiviteter för alla scoutnivåer, en
+förälder med barn i flera nivåer som också är ledare, samt samåkningar där
+föräldern kör eller där föräldern eller ett barn åker med. Testet misslyckas
+om implementationerna inte hittar samma aktiviteter eller om den nuvarande
+har högre median än den tidigare.
+
+Användning (från backend/flaskr):
+    python scripts/activity_query_benchmark.py [--activities 5000] [--children 3] [--repeat 20]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+FLASKR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, FLASKR_DIR)
+
+
+def legacy_events(user_id):
+    """Den tidigare implementationen av get_activities_by_role."""
+    from extensions import db
+    from models.activity_model import Activity
+    from models.auth_model import Child, ParentChildLink, Role, UserRole
+    from models.carpool_model import Carpool, Passenger
+    from routes.activity import role_mapping
+
+    now = datetime.now()
+    children = db.session.query(Child).join(ParentChildLink).filter(ParentChildLink.user_id == user_id).all()
+    children_roles = [Role.query.filter_by(role_id=child.role_id).first().name.lower() for child in children]
+    role_ids = [role_mapping[role] for role in children_roles if role in role_mapping]
+    children_activities = Activity.query.filter(
+        Activity.role_id.in_(role_ids), Activity.start_date >= now, Activity.is_visible == True
+    ).all()
+
+    leader_role_id = role_mapping.get('ledare')
+    leader_activities = []
+    if db.session.query(UserRole).filter_by(user_id=user_id, role_id=leader_role_id).first():
+        leader_activities = Activity.query.filter(
+            Activity.role_id == leader_role_id, Activity.start_date >= now, Activity.is_visible == True
+        ).all()
+
+    driver_activities = Activity.query.join(Carpool).filter(
+        Carpool.driver_id == user_id, Activity.start_date >= now, Activity.is_visible == True
+    ).all()
+    passenger_activities = Activity.query.join(Carpool).join(Passenger).filter(
+        db.or_(Passenger.user_id == user_id, Passenger.child_id.in_([child.child_id for child in children])),
+        Activity.start_date >= now, Activity.is_visible == True
+    ).all()
+
+    all_activities = list({activity.activity_id: activity for activity in (
+        children_activities + leader_activities + driver_activities + passenger_activities
+    )}.values())
+    return [{
+        'activity_id': activity.activity_id,
+        'summary': activity.name,
+        'dtstart': str(activity.start_date),
+        'dtend': str(activity.end_date),
+        'location': activity.address,
+        'description': activity.description,
+        'scout_level': list(role_mapping.keys())[list(role_mapping.values()).index(activity.role_id)]
+    } for activity in all_activities]
+
+
+def current_events(user_id):
+    from routes.activity import activities_for_user, serialize_activity
+
+    return [serialize_activity(activity) for activity in activities_for_user(user_id)]
+
+
+def create_data(activities, children):
+    """Skapar roller, aktiviteter, en förälder med barn och samåkningar. Returnerar förälderns user_id."""
+    from extensions import db
+    from migrations import upgrade
+    from models.activity_model import Activity
+    from models.auth_model import Child, ParentChildLink, User, UserRole
+    from models.carpool_model import Carpool, Passenger
+    from routes.activity import role_mapping
+    from seed_roles import seed_roles
+
+    upgrade()
+    seed_roles()
+    rng = random.Random(42)
+    scout_role_ids = [role_mapping[name] for name in ('kutar', 'tumlare', 'upptäckare', 'äventyrare', 'utmanare', 'rover')]
+    all_role_ids = scout_role_ids + [role_mapping['ledare']]
+
+    now = datetime.utcnow()
+    db.session.add_all([
+        Activity(
+            name=f'Aktivitet {i}',
+            start_date=now + timedelta(days=rng.randint(-60, 300), hours=rng.randint(0, 23)),
+            role_id=rng.choice(all_role_ids),
+            address='Scoutstugan',
+            description='Syntetisk aktivitet',
+            is_visible=rng.random() > 0.1
+        )
+        for i in range(activities)
+    ])
+
+    parent = User(email='bench-parent@example.com', password='x', first_name='Bench', last_name='Parent', is_accepted=True)
+    driver = User(email='bench-driver@example.com', password='x', first_name='Bench', last_name='Driver', is_accepted=True)
+    kids = [
+        Child(first_name='Barn', last_name=str(i), role_id=scout_role_ids[i % len(scout_role_ids)], date_of_birth=date(2015, 1, 1))
+        for i in range(children)
+    ]
+    db.session.add_all([parent, driver] + kids)
+    db.session.flush()
+    db.session.add_all([ParentChildLink(user_id=parent.user_id, child_id=kid.child_id) for kid in kids])
+    db.session.add(UserRole(user_id=parent.user_id, role_id=role_mapping['ledare']))
+
+    # Samåkningar i slumpvisa aktiviteter där föräldern kör eller någon i familjen åker med
+    activity_ids = [activity_id for (activity_id,) in db.session.query(Activity.activity_id)]
+    for activity_id in rng.sample(activity_ids, min(len(activity_ids), 200)):
+        driving = rng.random() < 0.3
+        carpool = Carpool(
+            driver_id=parent.user_id if driving else driver.user_id, activity_id=activity_id, available_seats=4,
+            departure_address='Gatan 1', departure_postcode='12345', departure_city='Staden', carpool_type='both'
+        )
+        db.session.add(carpool)
+        db.session.flush()
+        if not driving:
+            if kids and rng.random() < 0.7:
+                db.session.add(Passenger(carpool_id=carpool.id, child_id=rng.choice(kids).child_id))
+            else:
+                db.session.add(Passenger(carpool_id=carpool.id, user_id=parent.user_id))
+    db.session.commit()
+    return parent.user_id
+
+
+def measure(app, implementations, user_id, repeat):
+    """Kör implementationerna om vartannat, så att de mäts under samma
+    förhållanden. Returnerar {namn: (svarstider i ms, antal frågor per anrop, händelser)}."""
+    from sqlalchemy import event
+    from extensions import db
+
+    results = {name: ([], [], None) for name in implementations}
+    for _ in range(repeat):
+        for name, events in implementations.items():
+            timings, queries, _ = results[name]
+            with app.app_context():
+                count = [0]
+
+                def on_execute(*args):
+                    count[0] += 1
+
+                event.listen(db.engine, 'before_cursor_execute', on_execute)
+                start = time.perf_counter()
+                result = events(user_id)
+                timings.append((time.perf_counter() - start) * 1000)
+                event.remove(db.engine, 'before_cursor_execute', on_execute)
+                queries.append(count[0])
+            results[name] = (timings, queries, result)
+    return {name: (timings, max(queries), result) for name, (timings, queries, result) in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--activities', type=int, default=5000)
+    parser.add_argument('--children', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    from app import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'activities.db')}"})
+        with app.app_context():
+            user_id = create_data(args.activities, args.children)
+
+        measured = measure(app, {'legacy': legacy_events, 'current': current_events}, user_id, args.repeat)
+        results = {}
+        medians = {}
+        print(f"{'implementation':<15} {'events':>7} {'queries':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for name, (timings, queries, result) in measured.items():
+            results[name] = result
+            medians[name] = statistics.median(timings)
+            p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+            print(f"{name:<15} {len(result):>7} {queries:>8} {medians[name]:>8.1f} {p95:>8.1f}")
+
+        with app.app_context():
+            from extensions import db
+            db.engine.dispose()
+
+    def by_id(events):
+        return {event['activity_id']: event for event in events}
+
+    if by_id(results['legacy']) != by_id(results['current']):
+        print('FAILED: implementations returned different activities')
+        return 1
+    if medians['current'] > medians['legacy']:
+        print('FAILED: current implementation is slower than legacy')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Kontrollerar att kalendersynken fortsätter där förra synken slutade och
+aldrig sparar samma aktivitet två gånger.
+
+Skapar en temporär SQLite-databas och en lokal iCal-fil. Varje steg körs med
+en ny CalendarSync, som ett nytt engångskommando eller en omstartad process
+skulle göra, så att valideringsdatan bara kan komma från databasen. Testet
+misslyckas om en oförändrad kalender läses igen, om en aktivitet som redan
+finns sparas en gång till, om en misslyckad synk sparar valideringsdata
+eller om en synk efter ett fel inte hämtar kalendern igen.
+
+Användning (från backend/flaskr):
+    python scripts/calendar_sync_check.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+FLASKR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, FLASKR_DIR)
+
+START = (datetime.utcnow() + timedelta(days=7)).replace(hour=18, minute=0, second=0, microsecond=0)
+
+
+def event(i):
+    start = START + timedelta(days=i)
+    return (
+        'BEGIN:VEVENT\r\n'
+        f'UID:check-{i}\r\n'
+        f'SUMMARY:Möte {i} // Kutar - Scoutstugan\r\n'
+        f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}\r\n"
+        f"DTEND:{(start + timedelta(hours=2)).strftime('%Y%m%dT%H%M%S')}\r\n"
+        'LOCATION:Scoutstugan\r\n'
+        'DESCRIPTION:Check\r\n'
+        'END:VEVENT\r\n'
+    )
+
+
+def write_calendar(path, events, mtime):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//check//EN\r\n')
+        f.write(''.join(event(i) for i in events))
+        f.write('END:VCALENDAR\r\n')
+    os.utime(path, (mtime, mtime))
+
+
+def main():
+    from app import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'calendar.ics')
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'calendar.db')}",
+            'CALENDAR_URL': path,
+        })
+        with app.app_context():
+            from extensions import db
+            from calendar_sync import create_calendar_sync
+            from migrations import upgrade
+            from models.activity_model import Activity
+            from seed_roles import seed_roles
+
+            upgrade()
+            seed_roles()
+
+            def sync():
+                """(nya aktiviteter, antal aktiviteter, hash i databasen)"""
+                calendar_sync = create_calendar_sync(app)
+                try:
+                    added = calendar_sync.sync()
+                except Exception:
+                    db.session.rollback()
+                    added = 'error'
+                state = calendar_sync.load_state()
+                return added, Activity.query.count(), state.content_hash if state else None
+
+            mtime = 1_700_000_000
+            results = []
+
+            write_calendar(path, range(3), mtime)
+            first = sync()
+            results.append(('first sync', first[:2], (3, 3)))
+            results.append(('unchanged calendar', sync()[:2], (0, 3)))
+
+            # Samma innehåll med ny ändringstid: hashen är densamma, så inget sparas
+            os.utime(path, (mtime + 60, mtime + 60))
+            results.append(('touched calendar', sync(), (0, 3, first[2])))
+
+            # En annan process har redan sparat händelse 3
+            db.session.add(Activity(name='Möte 3 // Kutar - Scoutstugan', start_date=START + timedelta(days=3),
+                                    role_id=3, address='Scoutstugan'))
+            db.session.commit()
+            write_calendar(path, range(5), mtime + 120)
+            second = sync()
+            results.append(('new events', second[:2], (1, 5)))
+
+            # Trasig kalender: valideringsdatan får inte sparas, så nästa synk försöker igen
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('not a calendar')
+            os.utime(path, (mtime + 180, mtime + 180))
+            results.append(('broken calendar', sync(), ('error', 5, second[2])))
+            write_calendar(path, range(6), mtime + 180)
+            results.append(('retry after error', sync()[:2], (1, 6)))
+
+            db.engine.dispose()
+
+    failed = False
+    for name, got, expected in results:
+        ok = got == expected
+        failed = failed or not ok
+        print(f"{name:<20} {'ok' if ok else 'FAIL'}")
+        if not ok:
+            print(f"  got {got}, expected {expected}")
+    print('FAILED' if failed else 'OK')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""Kontrollerar att build_carpool_listing gör lika många frågor oavsett hur
+många samåkningar och passagerare en aktivitet har.
+
+Skapar en temporär SQLite-databas med två aktiviteter, en med --carpools
+samåkningar och en med tio gånger så många. Varje samåkning har en bil, en
+vuxen passagerare och barnpassagerare med föräldrar. Frågorna räknas med en
+before_cursor_execute-lyssnare, och testet misslyckas om antalet skiljer sig
+mellan aktiviteterna, t.ex. om en relation börjar laddas per rad.
+
+Användning (från backend/flaskr):
+    python scripts/carpool_listing_query_count.py [--carpools 20] [--children 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+FLASKR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, FLASKR_DIR)
+
+
+def create_activity(name, carpools, children):
+    """Skapar en aktivitet med samåkningar och passagerare. Returnerar activity_id."""
+    from extensions import db
+    from models.activity_model import Activity
+    from models.auth_model import Child, ParentChildLink, User
+    from models.carpool_model import Car, Carpool, Passenger
+
+    activity = Activity(name=name, start_date=datetime.utcnow() + timedelta(days=1), address='Scoutstugan')
+    db.session.add(activity)
+    db.session.flush()
+    for i in range(carpools):
+        driver = User(email=f'{name}-driver{i}@example.com', password='x', first_name='Förare', last_name=str(i), is_accepted=True)
+        parent = User(email=f'{name}-parent{i}@example.com', password='x', first_name='Förälder', last_name=str(i), is_accepted=True)
+        kids = [Child(first_name='Barn', last_name=f'{i}-{j}', date_of_birth=date(2015, 1, 1)) for j in range(children)]
+        db.session.add_all([driver, parent] + kids)
+        db.session.flush()
+        car = Car(owner_id=driver.user_id, reg_number=f'{name[:3]}{i}', fuel_type='el', model_name=f'Bil {i}')
+        db.session.add(car)
+        db.session.flush()
+        carpool = Carpool(
+            driver_id=driver.user_id, car_id=car.car_id, activity_id=activity.activity_id,
+            available_seats=children + 1, departure_address='Gatan 1', departure_postcode='12345',
+            departure_city='Staden', carpool_type='both'
+        )
+        db.session.add(carpool)
+        db.session.flush()
+        db.session.add(Passenger(carpool_id=carpool.id, user_id=parent.user_id))
+        db.session.add_all([Passenger(carpool_id=carpool.id, child_id=kid.child_id) for kid in kids])
+        db.session.add_all([ParentChildLink(user_id=parent.user_id, child_id=kid.child_id) for kid in kids])
+    db.session.commit()
+    return activity.activity_id
+
+
+def count_queries(app, activity_id):
+    """Returnerar (antal frågor, antal passagerare i listan) för en aktivitet."""
+    from sqlalchemy import event
+    from extensions import db
+    from routes.carpool import build_carpool_listing
+
+    with app.app_context():
+        count = [0]
+
+        def on_execute(*args):
+            count[0] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', on_execute)
+        try:
+            listing = build_carpool_listing([activity_id])[activity_id]
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', on_execute)
+        return count[0], sum(len(carpool['passengers']) for carpool in listing)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--carpools', type=int, default=20)
+    parser.add_argument('--children', type=int, default=3)
+    args = parser.parse_args()
+
+    from app import create_app
+    from migrations import upgrade
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'listing.db')}"})
+        with app.app_context():
+            upgrade()
+            small = create_activity('small', args.carpools, args.children)
+            large = create_activity('large', args.carpools * 10, args.children)
+
+        results = {}
+        print(f"{'activity':<10} {'carpools':>8} {'passengers':>10} {'queries':>8}")
+        for name, activity_id, carpools in (('small', small, args.carpools), ('large', large, args.carpools * 10)):
+            queries, passengers = count_queries(app, activity_id)
+            results[name] = queries
+            print(f"{name:<10} {carpools:>8} {passengers:>10} {queries:>8}")
+
+        with app.app_context():
+            from extensions import db
+            db.engine.dispose()
+
+    if results['small'] != results['large']:
+        print('FAILED: query count grows with the number of carpools')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
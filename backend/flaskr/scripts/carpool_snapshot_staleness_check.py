@@ -0,0 +1,178 @@
+"""Kontrollerar att cachade carpool-listor ogiltigförklaras av alla ändringar
+som syns i /api/carpool/list.
+
+För varje ändring hämtas listan först två gånger, så att ögonblicksbilden
+ligger i cachen och den andra hämtningen ger 304. Efter ändringen hämtas
+listan igen med samma ETag. Testet misslyckas om svaret är 304, om det är
+samma lista som före ändringen eller om det skiljer sig från en lista som
+byggs direkt från databasen.
+
+Med --redis-url används en delad cache, och listan läses via en andra app
+mot samma databas, som en annan process skulle göra.
+
+Användning (från backend/flaskr):
+    python scripts/carpool_snapshot_staleness_check.py
+    python scripts/carpool_snapshot_staleness_check.py --redis-url redis://localhost:6379/1
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+FLASKR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, FLASKR_DIR)
+
+PASSWORD = 'stale-check'
+
+
+def create_data(app):
+    """Skapar en förare med två bilar och en samåkning, och en förälder med två barn."""
+    from werkzeug.security import generate_password_hash
+    from extensions import db
+    from migrations import upgrade
+    from models.activity_model import Activity
+    from models.auth_model import Child, ParentChildLink, User
+    from models.carpool_model import Car, Carpool
+
+    with app.app_context():
+        upgrade()
+        password = generate_password_hash(PASSWORD)
+        driver = User(email='stale-driver@example.com', password=password, first_name='Stale', last_name='Driver', is_accepted=True)
+        parent = User(email='stale-parent@example.com', password=password, first_name='Stale', last_name='Parent', is_accepted=True)
+        kids = [Child(first_name='Barn', last_name=str(i), date_of_birth=date(2015, 1, 1)) for i in range(2)]
+        activity = Activity(name='Stale', start_date=datetime.utcnow() + timedelta(days=1), address='Scoutstugan')
+        db.session.add_all([driver, parent, activity] + kids)
+        db.session.flush()
+        cars = [Car(owner_id=driver.user_id, reg_number=f'ABC{i}', fuel_type='el', model_name=f'Bil {i}') for i in range(2)]
+        db.session.add_all(cars + [ParentChildLink(user_id=parent.user_id, child_id=kid.child_id) for kid in kids])
+        db.session.flush()
+        carpool = Carpool(
+            driver_id=driver.user_id, car_id=cars[0].car_id, activity_id=activity.activity_id, available_seats=4,
+            departure_address='Gatan 1', departure_postcode='12345', departure_city='Staden', carpool_type='both'
+        )
+        db.session.add(carpool)
+        db.session.commit()
+        return {
+            'activity_id': activity.activity_id,
+            'carpool_id': carpool.id,
+            'second_car_id': cars[1].car_id,
+            'child_ids': [kid.child_id for kid in kids],
+        }
+
+
+def login(client, email):
+    response = client.post('/api/login', json={'email': email, 'password': PASSWORD})
+    assert response.status_code == 200, response.get_json()
+    return client.get_cookie('jwt_token').value
+
+
+def mutations(ids):
+    """(namn, vem, anrop) i en ordning där varje steg ändrar listan."""
+    return [
+        ('create carpool', 'driver', lambda c: c.post('/api/carpool/create', json={
+            'car_id': ids['second_car_id'], 'activity_id': ids['activity_id'], 'available_seats': 3,
+            'departure_address': 'Vägen 2', 'departure_postcode': '54321', 'departure_city': 'Byn', 'carpool_type': 'both'
+        })),
+        ('add passenger', 'parent', lambda c: c.post('/api/carpool/add-passenger', json={
+            'carpool_id': ids['carpool_id'], 'add_self': True
+        })),
+        ('update passengers', 'parent', lambda c: c.post('/api/carpool/update-passengers', json={
+            'carpool_id': ids['carpool_id'],
+            'add': [{'type': 'child', 'id': child_id} for child_id in ids['child_ids']],
+            'remove': [{'type': 'user'}]
+        })),
+        ('remove passenger', 'parent', lambda c: c.delete('/api/carpool/remove-passenger', json={
+            'carpool_id': ids['carpool_id'], 'child_id': ids['child_ids'][0]
+        })),
+        ('edit user profile', 'driver', lambda c: c.post('/api/protected/edit-user-profile', json={
+            'address': 'Gatan 3', 'postcode': '12345', 'city': 'Staden', 'phone': '070-1234567',
+            'first_name': 'Ny', 'last_name': 'Förare', 'email': 'stale-driver@example.com'
+        })),
+        ('delete child', 'parent', lambda c: c.delete('/api/protected/delete-child', json={
+            'child_id': ids['child_ids'][1]
+        })),
+        ('delete car', 'driver', lambda c: c.delete(f"/api/protected/delete-car/{ids['second_car_id']}")),
+        ('delete carpool', 'driver', lambda c: c.delete(f"/api/carpool/{ids['carpool_id']}/delete")),
+    ]
+
+
+def fresh_listing(app, activity_id):
+    from routes.carpool import build_carpool_listing
+
+    with app.app_context():
+        return json.loads(app.json.dumps({'carpools': build_carpool_listing([activity_id])[activity_id]}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--redis-url', help='delad cache, t.ex. redis://localhost:6379/1')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'stale.db')}",
+            'NOTIFICATION_STATE_BACKEND': 'memory',
+            'CARPOOL_SNAPSHOT_REDIS_URL': args.redis_url,
+        }
+        app = create_app(config)
+        ids = create_data(app)
+        activity_id = ids['activity_id']
+        if args.redis_url:
+            # Rensa listor från tidigare körningar med samma id:n
+            with app.app_context():
+                app.extensions['carpool_snapshots'].clear()
+        # Utan delad cache ser en annan process inte ändringarna, så då läser samma app
+        reader_app = create_app(config) if args.redis_url else app
+
+        clients = {'driver': app.test_client(), 'parent': app.test_client()}
+        tokens = {
+            'driver': login(clients['driver'], 'stale-driver@example.com'),
+            'parent': login(clients['parent'], 'stale-parent@example.com'),
+        }
+        reader = reader_app.test_client()
+        reader.set_cookie('jwt_token', tokens['driver'])
+
+        def get_list(etag=None):
+            headers = {'If-None-Match': etag} if etag else {}
+            return reader.get('/api/carpool/list', query_string={'activity_id': activity_id}, headers=headers)
+
+        failed = False
+        for name, who, mutate in mutations(ids):
+            errors = []
+            before = get_list()
+            etag = before.headers['ETag']
+            if get_list(etag).status_code != 304:
+                errors.append('snapshot was not cached before the change')
+
+            response = mutate(clients[who])
+            if response.status_code >= 300:
+                errors.append(f'mutation failed with {response.status_code}: {response.get_json()}')
+
+            after = get_list(etag)
+            if after.status_code == 304:
+                errors.append('got 304 for the old ETag')
+            elif after.get_json() == before.get_json():
+                errors.append('got the same list as before the change')
+            elif after.get_json() != fresh_listing(app, activity_id):
+                errors.append('list differs from one built from the database')
+
+            print(f"{name:<20} {'FAIL' if errors else 'ok'}")
+            for error in errors:
+                print(f"  {error}")
+            failed = failed or bool(errors)
+
+        for flask_app in {app, reader_app}:
+            with flask_app.app_context():
+                from extensions import db
+                db.engine.dispose()
+
+    print('FAILED' if failed else 'OK')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+"""Flödar ett carpool-rum med chattmeddelanden och mäter genomströmning och
+ack-latens för send_message, med och utan batchning av skrivningar.
+
+Startar en server mot en temporär SQLite-databas, ansluter ett antal
+avsändare som skickar meddelanden samtidigt och en observatör i rummet.
+Testet misslyckas om något meddelande saknas, om new_message inte kommer i
+stigande id-ordning eller om en avsändares meddelanden kommer i fel ordning.
+Serverns logg skrivs ut när en körning misslyckas, eller sparas med
+--server-log.
+
+Kräver websocket-client, annars använder klienterna long-polling.
+
+Användning (från backend/flaskr):
+    python scripts/chat_flood_benchmark.py [--senders 20] [--messages 50] [--batch-sizes 1 200]
+    python scripts/chat_flood_benchmark.py --server-log flood_server.log
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+FLASKR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, FLASKR_DIR)
+
+SERVER_SNIPPET = """
+import sys
+from app import create_app
+from extensions import socketio
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': sys.argv[2],
+    'SOCKETIO_ASYNC_MODE': 'threading',
+    'NOTIFICATION_STATE_BACKEND': 'memory',
+    'MESSAGE_BATCH_SIZE': int(sys.argv[3]),
+})
+socketio.run(app, host='127.0.0.1', port=int(sys.argv[1]), allow_unsafe_werkzeug=True)
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(port, timeout=30):
+    url = f'http://127.0.0.1:{port}/socket.io/?EIO=4&transport=polling'
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+def print_server_log(path, lines=50):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        tail = f.readlines()[-lines:]
+    print(f"--- last {len(tail)} lines of {path} ---")
+    print(''.join(tail), end='')
+
+
+def create_database(uri, senders):
+    """Skapar schemat, avsändarna och en samåkning. Returnerar (carpool_id, user_ids)."""
+    from datetime import datetime, timedelta
+    from app import create_app
+    from extensions import db
+    from migrations import upgrade
+    from models.activity_model import Activity
+    from models.auth_model import User
+    from models.carpool_model import Carpool
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri})
+    with app.app_context():
+        upgrade()
+        users = [
+            User(email=f'flood{i}@example.com', password='x', first_name='Flood', last_name=str(i), is_accepted=True)
+            for i in range(senders)
+        ]
+        activity = Activity(name='Flood', start_date=datetime.utcnow() + timedelta(days=1), address='Scoutstugan')
+        db.session.add_all(users + [activity])
+        db.session.flush()
+        carpool = Carpool(
+            driver_id=users[0].user_id, activity_id=activity.activity_id, available_seats=4,
+            departure_address='Gatan 1', departure_postcode='12345', departure_city='Staden', carpool_type='both'
+        )
+        db.session.add(carpool)
+        db.session.commit()
+        return carpool.id, [user.user_id for user in users]
+
+
+def connect(port, carpool_id, user_id, on_message=None):
+    import socketio
+
+    client = socketio.Client(reconnection=False)
+    if on_message:
+        client.on('new_message', on_message)
+    client.connect(f'http://127.0.0.1:{port}')
+    client.call('join_carpool', {'carpool_id': carpool_id, 'user_id': user_id})
+    return client
+
+
+def failed(result):
+    return bool(result['errors'] or result['received'] < result['expected'] or not result['ordered'])
+
+
+def run(batch_size, senders, messages, server_log=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = f"sqlite:///{os.path.join(tmp, 'flood.db')}"
+        carpool_id, user_ids = create_database(uri, senders)
+
+        log_path = server_log or os.path.join(tmp, 'server.log')
+        port = free_port()
+        with open(log_path, 'a') as log:
+            server = subprocess.Popen(
+                [sys.executable, '-c', SERVER_SNIPPET, str(port), uri, str(batch_size)],
+                cwd=FLASKR_DIR, stdout=log, stderr=subprocess.STDOUT
+            )
+        clients = []
+        result = None
+        try:
+            wait_for_server(port)
+
+            received = []
+            observer = connect(port, carpool_id, user_ids[0], lambda data: received.append(data['message']))
+            clients.append(observer)
+            sender_clients = [connect(port, carpool_id, user_id) for user_id in user_ids]
+            clients.extend(sender_clients)
+
+            latencies = []
+            errors = []
+            lock = threading.Lock()
+
+            def flood(client, user_id):
+                for seq in range(messages):
+                    start = time.perf_counter()
+                    ack = client.call('send_message', {
+                        'carpool_id': carpool_id, 'sender_id': user_id, 'content': f'{user_id}:{seq}'
+                    }, timeout=30)
+                    elapsed = (time.perf_counter() - start) * 1000
+                    with lock:
+                        latencies.append(elapsed)
+                        if not ack or ack.get('status') != 'ok':
+                            errors.append(ack)
+
+            threads = [
+                threading.Thread(target=flood, args=(client, user_id))
+                for client, user_id in zip(sender_clients, user_ids)
+            ]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duration = time.perf_counter() - start
+
+            # Vänta in de sista new_message till observatören
+            expected = senders * messages
+            deadline = time.monotonic() + 10
+            while len(received) < expected and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+            ids = [message['id'] for message in received]
+            last_seq = {}
+            sender_order_ok = True
+            for message in received:
+                user_id, seq = (int(part) for part in message['content'].split(':'))
+                sender_order_ok = sender_order_ok and seq > last_seq.get(user_id, -1)
+                last_seq[user_id] = seq
+
+            result = {
+                'batch_size': batch_size,
+                'expected': expected,
+                'received': len(received),
+                'errors': len(errors),
+                'rate': expected / duration,
+                'p50': statistics.median(latencies),
+                'p95': statistics.quantiles(latencies, n=20)[-1],
+                'ordered': ids == sorted(ids) and len(set(ids)) == len(ids) and sender_order_ok,
+            }
+            return result
+        finally:
+            for client in clients:
+                try:
+                    client.disconnect()
+                except Exception:
+                    pass
+            server.terminate()
+            server.wait()
+            # Loggen i den temporära katalogen försvinner, så visa den om något gick fel
+            if not server_log and (result is None or failed(result)):
+                print_server_log(log_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--senders', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 200])
+    parser.add_argument('--server-log', help='sparar serverns logg i filen i stället för att bara visa den vid fel')
+    args = parser.parse_args()
+
+    any_failed = False
+    print(f"{'batch':>5} {'received':>13} {'errors':>6} {'msg/s':>8} {'p50 ms':>8} {'p95 ms':>8}  ordered")
+    for batch_size in args.batch_sizes:
+        result = run(batch_size, args.senders, args.messages, args.server_log)
+        print(
+            f"{result['batch_size']:>5} {result['received']:>6}/{result['expected']:<6} {result['errors']:>6} "
+            f"{result['rate']:>8.0f} {result['p50']:>8.1f} {result['p95']:>8.1f}  {result['ordered']}"
+        )
+        any_failed = any_failed or failed(result)
+
+    return 1 if any_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
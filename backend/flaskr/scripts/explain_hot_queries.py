@@ -0,0 +1,118 @@
+"""Kör EXPLAIN QUERY PLAN på de frekventa frågorna i routes och misslyckas om
+någon av dem gör en full tabellskanning.
+
+Användning (från backend/flaskr):
+    python scripts/explain_hot_queries.py [sökväg till .db]
+
+Utan argument används en tom temporär SQLite-databas med aktuellt schema.
+"""
+import os
+import re
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from sqlalchemy import select, func, or_, and_, text
+from extensions import db
+from migrations import upgrade_indexes
+from models.activity_model import Activity
+from models.auth_model import ParentChildLink, UserRole
+from models.carpool_model import Carpool, Passenger, Car
+from models.message_model import CarpoolMessage
+from models.notifications_model import Notification, NotificationState
+from routes.activity import user_activities_criteria
+
+# Små uppslagstabeller där en skanning är billig
+SCAN_ALLOWED = {'roles'}
+
+SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?(\w+)\b(?! USING (?:COVERING )?INDEX)(?! USING INTEGER PRIMARY KEY)')
+
+
+def hot_queries():
+    now = datetime.utcnow()
+    return {
+        'carpool list by activity': select(Carpool).where(Carpool.activity_id.in_([1, 2])),
+        'carpools by driver': select(Carpool).where(Carpool.driver_id == 1),
+        'passengers by carpool': select(Passenger).where(Passenger.carpool_id.in_([1, 2])).order_by(Passenger.id),
+        'existing passenger': select(Passenger).where(
+            Passenger.carpool_id == 1, Passenger.child_id == 1, Passenger.user_id.is_(None)
+        ),
+        'parents by child': select(ParentChildLink).where(ParentChildLink.child_id.in_([1, 2])),
+        'children by parent': select(ParentChildLink).where(ParentChildLink.user_id == 1),
+        'roles by user': select(UserRole).where(UserRole.user_id == 1),
+        'cars by owner': select(Car).where(Car.owner_id == 1),
+        'chat history': select(CarpoolMessage).where(CarpoolMessage.carpool_id == 1).order_by(
+            CarpoolMessage.timestamp.desc(), CarpoolMessage.id.desc()
+        ).limit(51),
+        'chat history before message': select(CarpoolMessage).where(
+            CarpoolMessage.carpool_id == 1,
+            or_(CarpoolMessage.timestamp < now, and_(CarpoolMessage.timestamp == now, CarpoolMessage.id < 10))
+        ).order_by(CarpoolMessage.timestamp.desc(), CarpoolMessage.id.desc()).limit(51),
+        'chat history etag': select(func.count(CarpoolMessage.id), func.max(CarpoolMessage.id)).where(
+            CarpoolMessage.carpool_id == 1
+        ),
+        'chat messages last day': select(func.count(CarpoolMessage.id)).where(
+            CarpoolMessage.carpool_id == 1, CarpoolMessage.timestamp >= now
+        ),
+        'notification feed': select(Notification).where(Notification.user_id == 1, Notification.id < 100).order_by(
+            Notification.id.desc()
+        ).limit(50),
+        'unread count': select(func.count(Notification.id)).where(
+            Notification.user_id == 1, Notification.is_read == False
+        ),
+        'mark read': select(Notification).where(
+            Notification.carpool_id == 1, Notification.user_id == 1,
+            Notification.is_read == False, Notification.message_id.isnot(None)
+        ),
+        'active users in carpool': select(NotificationState.user_id).where(
+            NotificationState.kind == 'active', NotificationState.carpool_id == 1, NotificationState.expires_at > now
+        ),
+        'visible upcoming activities': select(Activity).where(
+            Activity.start_date >= now, Activity.is_visible == True
+        ),
+        'activities by role': select(Activity).where(
+            Activity.role_id.in_([3, 4]), Activity.start_date >= now, Activity.is_visible == True
+        ),
+        'activity by name and start': select(Activity).where(Activity.name == 'x', Activity.start_date == now),
+        'activities for user': select(Activity).where(*user_activities_criteria(1, now)),
+    }
+
+
+def full_scans(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    plan = connection.execute(text(f'EXPLAIN QUERY PLAN {compiled}')).fetchall()
+    details = [row[-1] for row in plan]
+    scans = [
+        detail for detail in details
+        if (match := SCAN_PATTERN.match(detail)) and match.group(1) not in SCAN_ALLOWED
+    ]
+    return details, scans
+
+
+def main(db_path=None):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}' if db_path else 'sqlite://'
+    db.init_app(app)
+
+    failed = False
+    with app.app_context():
+        if not db_path:
+            db.create_all()
+        upgrade_indexes()
+
+        with db.engine.connect() as connection:
+            for name, statement in hot_queries().items():
+                details, scans = full_scans(connection, statement)
+                status = 'FULL SCAN' if scans else 'ok'
+                print(f"[{status}] {name}")
+                for detail in details:
+                    print(f"    {detail}")
+                failed = failed or bool(scans)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,132 @@
+"""Uppgraderar en databas med det ursprungliga schemat och kontrollerar att
+alla migreringar går igenom även när den har dubbletter bland passagerarna
+och aktiviteterna.
+
+Skapar en temporär SQLite-databas med bara de ursprungliga tabellerna och
+utan index, som en äldre users.db. Samma aktivitet finns två gånger, med
+samåkningen på dubbletten, och samma vuxna och samma barn åker två gånger i
+samåkningen. Testet misslyckas om upgrade() inte kör alla steg, om
+dubbletterna finns kvar, om samåkningen inte har flyttats till aktiviteten
+som behålls, om platserna inte har getts tillbaka eller om något index i
+modellerna saknas efteråt.
+
+Användning (från backend/flaskr):
+    python scripts/migration_upgrade_check.py
+"""
+import os
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+
+FLASKR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, FLASKR_DIR)
+
+# Tabellerna i schemat innan migreringarna fanns
+ORIGINAL_TABLES = [
+    'roles', 'users', 'user_role', 'children', 'parent_child_link', 'activities',
+    'cars', 'carpool', 'passengers', 'carpoolmessage', 'notifications',
+]
+SEATS = 4
+
+
+def create_original_schema():
+    """Skapar de ursprungliga tabellerna utan index. Returnerar carpool_id."""
+    from sqlalchemy import text
+    from extensions import db
+    from migrations import create_tables
+    from models.activity_model import Activity
+    from models.auth_model import Child, ParentChildLink, User
+    from models.carpool_model import Carpool, Passenger
+
+    create_tables()
+    with db.engine.begin() as connection:
+        for table in reversed(db.metadata.sorted_tables):
+            if table.name not in ORIGINAL_TABLES:
+                connection.execute(text(f'DROP TABLE {table.name}'))
+            else:
+                for index in table.indexes:
+                    connection.execute(text(f'DROP INDEX {index.name}'))
+
+    user = User(email='old-user@example.com', password='x', first_name='Old', last_name='User', is_accepted=True)
+    child = Child(first_name='Old', last_name='Child', date_of_birth=date(2015, 1, 1))
+    start_date = datetime.utcnow() + timedelta(days=1)
+    activities = [Activity(name='Old', start_date=start_date, address='Scoutstugan') for _ in range(2)]
+    db.session.add_all([user, child] + activities)
+    db.session.flush()
+    db.session.add(ParentChildLink(user_id=user.user_id, child_id=child.child_id))
+    carpool = Carpool(
+        driver_id=user.user_id, activity_id=activities[1].activity_id, available_seats=SEATS,
+        departure_address='Gatan 1', departure_postcode='12345', departure_city='Staden', carpool_type='both'
+    )
+    db.session.add(carpool)
+    db.session.flush()
+    # Varje passagerare har tagit en plats, även dubbletterna
+    db.session.add_all([Passenger(carpool_id=carpool.id, user_id=user.user_id) for _ in range(2)])
+    db.session.add_all([Passenger(carpool_id=carpool.id, child_id=child.child_id) for _ in range(2)])
+    carpool.available_seats = SEATS - 4
+    db.session.commit()
+    return carpool.id
+
+
+def check(carpool_id, ran):
+    from sqlalchemy import inspect
+    from extensions import db
+    from migrations import MIGRATIONS
+    from models.activity_model import Activity
+    from models.carpool_model import Carpool, Passenger
+
+    errors = []
+    expected = [version for version, _, _ in MIGRATIONS]
+    if ran != expected:
+        errors.append(f'ran migrations {ran}, expected {expected}')
+
+    passengers = Passenger.query.filter_by(carpool_id=carpool_id).count()
+    if passengers != 2:
+        errors.append(f'{passengers} passengers left, expected 2')
+    activity_ids = [activity_id for (activity_id,) in db.session.query(Activity.activity_id).filter_by(name='Old')]
+    if len(activity_ids) != 1:
+        errors.append(f'{len(activity_ids)} activities left, expected 1')
+    elif db.session.get(Carpool, carpool_id).activity_id != activity_ids[0]:
+        errors.append('carpool was not moved to the activity that was kept')
+
+    available = db.session.get(Carpool, carpool_id).available_seats
+    if available != SEATS - 2:
+        errors.append(f'available_seats={available}, expected {SEATS - 2}')
+
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        missing = {index.name for index in table.indexes} - existing
+        if missing:
+            errors.append(f'missing indexes on {table.name}: {sorted(missing)}')
+    return errors
+
+
+def main():
+    from app import create_app
+    from migrations import upgrade
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'users.db')}"})
+        with app.app_context():
+            from extensions import db
+
+            carpool_id = create_original_schema()
+            try:
+                ran = upgrade()
+            except Exception as e:
+                db.session.rollback()
+                print(f'FAILED: upgrade stopped: {e}')
+                return 1
+            errors = check(carpool_id, ran)
+            db.engine.dispose()
+
+    print(f"ran migrations {ran}")
+    for error in errors:
+        print(f"  FAIL {error}")
+    print('FAILED' if errors else 'OK')
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
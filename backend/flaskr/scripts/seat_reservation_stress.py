@@ -0,0 +1,160 @@
+"""Belastar en samåkning med samtidiga anmälningar och avanmälningar och
+kontrollerar att platserna stämmer efteråt.
+
+Ett antal trådar försöker anmäla fler användare än det finns platser, varje
+användare två gånger samtidigt, och tar sedan bort en del av dem, också det
+dubbelt. Testet misslyckas om samåkningen överbokas, om någon åker med två
+gånger eller om antalet lediga platser inte stämmer med passagerarna.
+
+Användning (från backend/flaskr):
+    python scripts/seat_reservation_stress.py [--seats 10] [--users 50] [--threads 16]
+    python scripts/seat_reservation_stress.py --database-uri postgresql://...
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+FLASKR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, FLASKR_DIR)
+
+
+def create_carpool(app, seats, users):
+    """Skapar schemat, användarna och en samåkning. Returnerar (carpool_id, user_ids)."""
+    from datetime import datetime, timedelta
+    from extensions import db
+    from migrations import upgrade
+    from models.activity_model import Activity
+    from models.auth_model import User
+    from models.carpool_model import Carpool
+
+    with app.app_context():
+        upgrade()
+        run_id = int(time.time() * 1000)
+        driver = User(email=f'stress-driver-{run_id}@example.com', password='x', first_name='Stress', last_name='Driver', is_accepted=True)
+        passengers = [
+            User(email=f'stress{run_id}-{i}@example.com', password='x', first_name='Stress', last_name=str(i), is_accepted=True)
+            for i in range(users)
+        ]
+        activity = Activity(name='Stress', start_date=datetime.utcnow() + timedelta(days=1), address='Scoutstugan')
+        db.session.add_all([driver, activity] + passengers)
+        db.session.flush()
+        carpool = Carpool(
+            driver_id=driver.user_id, activity_id=activity.activity_id, available_seats=seats,
+            departure_address='Gatan 1', departure_postcode='12345', departure_city='Staden', carpool_type='both'
+        )
+        db.session.add(carpool)
+        db.session.commit()
+        return carpool.id, [user.user_id for user in passengers]
+
+
+def join(app, carpool_id, user_id):
+    from seat_reservations import AlreadyPassenger, NoSeatsAvailable, add_passengers
+
+    with app.app_context():
+        try:
+            add_passengers(carpool_id, [(None, user_id)])
+            return 'joined'
+        except NoSeatsAvailable:
+            return 'full'
+        except AlreadyPassenger:
+            return 'duplicate'
+
+
+def leave(app, carpool_id, user_id):
+    from models.carpool_model import Passenger
+    from seat_reservations import remove_passengers
+
+    with app.app_context():
+        passenger = Passenger.query.filter_by(carpool_id=carpool_id, user_id=user_id).first()
+        if not passenger:
+            return 'missing'
+        return 'left' if remove_passengers(carpool_id, [passenger.id]) else 'missing'
+
+
+def check(app, carpool_id, seats):
+    """Returnerar (brutna invarianter, antal passagerare, lediga platser)."""
+    from models.carpool_model import Carpool, Passenger
+
+    with app.app_context():
+        available = Carpool.query.get(carpool_id).available_seats
+        user_ids = [user_id for (user_id,) in Passenger.query.with_entities(Passenger.user_id).filter_by(carpool_id=carpool_id)]
+
+    errors = []
+    if available < 0:
+        errors.append(f'overbooked: available_seats={available}')
+    if len(user_ids) + available != seats:
+        errors.append(f'seat count drifted: {len(user_ids)} passengers + {available} free != {seats}')
+    duplicates = [user_id for user_id, count in Counter(user_ids).items() if count > 1]
+    if duplicates:
+        errors.append(f'duplicate passengers: {duplicates}')
+    return errors, len(user_ids), available
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seats', type=int, default=10)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--database-uri', help='standard: en temporär SQLite-databas')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = args.database_uri or f"sqlite:///{os.path.join(tmp, 'stress.db')}"
+        app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'NOTIFICATION_STATE_BACKEND': 'memory'})
+        carpool_id, user_ids = create_carpool(app, args.seats, args.users)
+
+        failed = False
+        with ThreadPoolExecutor(args.threads) as pool:
+            # Alla anmäler sig två gånger samtidigt
+            start = time.perf_counter()
+            outcomes = Counter(pool.map(lambda user_id: join(app, carpool_id, user_id), user_ids * 2))
+            duration = time.perf_counter() - start
+            errors, passengers, available = check(app, carpool_id, args.seats)
+            if outcomes['joined'] != min(args.seats, args.users):
+                errors.append(f"expected {min(args.seats, args.users)} joins, got {outcomes['joined']}")
+            print(f"join:  {dict(outcomes)} in {duration:.2f}s, {passengers} passengers, {available} free")
+            for error in errors:
+                print(f"  FAIL {error}")
+            failed = failed or bool(errors)
+
+            # Hälften av passagerarna lämnar, var och en två gånger samtidigt
+            with app.app_context():
+                from models.carpool_model import Passenger
+                leaving = [user_id for (user_id,) in Passenger.query.with_entities(Passenger.user_id).filter_by(carpool_id=carpool_id)]
+            leaving = leaving[:len(leaving) // 2]
+            outcomes = Counter(pool.map(lambda user_id: leave(app, carpool_id, user_id), leaving * 2))
+            errors, passengers, available = check(app, carpool_id, args.seats)
+            if outcomes['left'] != len(leaving):
+                errors.append(f"expected {len(leaving)} removals, got {outcomes['left']}")
+            print(f"leave: {dict(outcomes)}, {passengers} passengers, {available} free")
+            for error in errors:
+                print(f"  FAIL {error}")
+            failed = failed or bool(errors)
+
+            # De som står utanför försöker fylla de lediga platserna
+            free = available
+            outcomes = Counter(pool.map(lambda user_id: join(app, carpool_id, user_id), user_ids))
+            errors, passengers, available = check(app, carpool_id, args.seats)
+            if outcomes['joined'] != free:
+                errors.append(f"expected {free} joins, got {outcomes['joined']}")
+            print(f"refill: {dict(outcomes)}, {passengers} passengers, {available} free")
+            for error in errors:
+                print(f"  FAIL {error}")
+            failed = failed or bool(errors)
+
+        with app.app_context():
+            from extensions import db
+            db.engine.dispose()
+
+    print('FAILED' if failed else 'OK')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
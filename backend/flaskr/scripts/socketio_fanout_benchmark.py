@@ -0,0 +1,172 @@
+"""Lasttest för Socket.IO-broadcast över flera serverprocesser.
+
+Startar N serverprocesser som delar en meddelandekö, ansluter klienter
+fördelade jämnt över processerna till samma carpool-rum och skickar
+meddelanden till rummet från en extern avsändare via kön. Testet misslyckas
+om någon klient missar ett meddelande, dvs. om emit inte når alla processer.
+
+Användning (från backend/flaskr, kräver en körande Redis eller annan kö):
+    python scripts/socketio_fanout_benchmark.py [--workers 1 2 4] [--clients 100]
+        [--messages 50] [--message-queue redis://localhost:6379/0]
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+FLASKR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CARPOOL_ID = 1
+
+SERVER_SNIPPET = """
+import sys
+from app import create_app
+from extensions import socketio
+app = create_app({
+    'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+    'SOCKETIO_MESSAGE_QUEUE': sys.argv[2],
+    'SOCKETIO_ASYNC_MODE': 'threading',
+    'NOTIFICATION_STATE_BACKEND': 'memory',
+})
+socketio.run(app, host='127.0.0.1', port=int(sys.argv[1]), allow_unsafe_werkzeug=True)
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(port, timeout=30):
+    url = f'http://127.0.0.1:{port}/socket.io/?EIO=4&transport=polling'
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+def start_servers(count, message_queue):
+    servers = []
+    for _ in range(count):
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, '-c', SERVER_SNIPPET, str(port), message_queue],
+            cwd=FLASKR_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        servers.append((port, process))
+    for port, _ in servers:
+        wait_for_server(port)
+    return servers
+
+
+class BenchmarkClient:
+    def __init__(self, user_id, port):
+        import socketio
+
+        self.user_id = user_id
+        self.port = port
+        self.received = {}  # seq -> mottagningstid
+        self.client = socketio.Client(reconnection=False)
+        self.client.on('benchmark', self._on_benchmark)
+
+    def _on_benchmark(self, data):
+        self.received[data['seq']] = time.time()
+
+    def connect(self):
+        self.client.connect(f'http://127.0.0.1:{self.port}')
+        # Rummet joinas genom samma händelse som chatten använder
+        self.client.emit('join_carpool', {'carpool_id': CARPOOL_ID, 'user_id': self.user_id})
+
+    def disconnect(self):
+        self.client.disconnect()
+
+
+def run(workers, clients, messages, message_queue, timeout):
+    from flask_socketio import SocketIO
+
+    servers = start_servers(workers, message_queue)
+    connected = []
+    try:
+        connected = [BenchmarkClient(user_id, servers[user_id % workers][0]) for user_id in range(1, clients + 1)]
+        for client in connected:
+            client.connect()
+        time.sleep(1)  # låt join_carpool hinna behandlas
+
+        # Extern avsändare, som en separat worker-process, emit går bara via kön
+        emitter = SocketIO(message_queue=message_queue)
+        sent_at = {}
+        for seq in range(messages):
+            sent_at[seq] = time.time()
+            emitter.emit('benchmark', {'seq': seq}, to=f'carpool_{CARPOOL_ID}')
+
+        expected = clients * messages
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and sum(len(c.received) for c in connected) < expected:
+            time.sleep(0.05)
+
+        latencies = [
+            (received - sent_at[seq]) * 1000
+            for client in connected for seq, received in client.received.items()
+        ]
+        delivered = len(latencies)
+        last = max((max(c.received.values()) for c in connected if c.received), default=time.time())
+        elapsed = max(last - sent_at[0], 1e-9)
+        per_worker = {}
+        for client in connected:
+            per_worker[client.port] = per_worker.get(client.port, 0) + len(client.received)
+
+        return {
+            'workers': workers,
+            'expected': expected,
+            'delivered': delivered,
+            'rate': delivered / elapsed,
+            'p50': statistics.median(latencies) if latencies else 0.0,
+            'p95': statistics.quantiles(latencies, n=20)[-1] if len(latencies) >= 2 else 0.0,
+            'per_worker': sorted(per_worker.values()),
+        }
+    finally:
+        for client in connected:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+        for _, process in servers:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--message-queue', default=os.getenv('SOCKETIO_MESSAGE_QUEUE', 'redis://localhost:6379/0'))
+    parser.add_argument('--timeout', type=float, default=30)
+    args = parser.parse_args()
+
+    if args.message_queue.startswith('memory://'):
+        parser.error('memory:// only works within one process, use Redis or another shared queue')
+
+    failed = False
+    print(f"{'workers':>7} {'delivered':>15} {'msg/s':>10} {'p50 ms':>8} {'p95 ms':>8}  per worker")
+    for workers in args.workers:
+        result = run(workers, args.clients, args.messages, args.message_queue, args.timeout)
+        print(
+            f"{result['workers']:>7} {result['delivered']:>7}/{result['expected']:<7} {result['rate']:>10.0f} "
+            f"{result['p50']:>8.1f} {result['p95']:>8.1f}  {result['per_worker']}"
+        )
+        failed = failed or result['delivered'] < result['expected']
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Mäter kallstart för en ny worker: `from app import create_app` följt av
+create_app(), i en ny process per körning. Misslyckas om medianen överskrider
+budgeten. De tyngsta importerna listas med `python -X importtime`.
+
+Nästan hela tiden går åt till att importera Flask, SQLAlchemy och
+Flask-SocketIO, som create_app() behöver. Det är totalen som räknas när
+workers startas, så importen av app mäts inte för sig.
+
+Användning (från backend/flaskr):
+    python scripts/startup_benchmark.py [--runs N] [--budget MS]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+FLASKR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Uppmätt median 870-1230 ms (Python 3.12, SQLite), med marginal för
+# långsammare maskiner. Justera efter mätning om beroendena ändras.
+COLD_START_BUDGET_MS = 1500
+
+COLD_START_SNIPPET = """
+import time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+done = time.perf_counter()
+print((imported - start) * 1000, (done - imported) * 1000)
+"""
+
+
+def run_python(args):
+    return subprocess.run(
+        [sys.executable, *args],
+        cwd=FLASKR_DIR, capture_output=True, text=True, check=True
+    )
+
+
+def parse_importtime(stderr):
+    """Returnerar [(cumulative_us, depth, module)] från -X importtime-utskriften."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((int(fields[1]), depth, name.strip()))
+    return modules
+
+
+def heaviest_imports(limit=10):
+    """De tyngsta modulerna (kumulativ tid) som app och create_app() importerar
+    direkt, [(ms, modul)]."""
+    snippet = "from app import create_app; create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})"
+    modules = parse_importtime(run_python(['-X', 'importtime', '-c', snippet]).stderr)
+    heaviest = {}
+    for cumulative, depth, name in modules:
+        # Djup 0 är app och blueprints som create_app() importerar, djup 1 deras importer
+        if depth <= 1 and name != 'app':
+            heaviest[name] = max(heaviest.get(name, 0), cumulative / 1000)
+    return sorted(((ms, name) for name, ms in heaviest.items()), reverse=True)[:limit]
+
+
+def cold_start_ms():
+    """Returnerar (import av app, create_app()) i millisekunder."""
+    import_ms, create_ms = run_python(['-c', COLD_START_SNIPPET]).stdout.strip().splitlines()[-1].split()
+    return float(import_ms), float(create_ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=COLD_START_BUDGET_MS)
+    args = parser.parse_args()
+
+    runs = [cold_start_ms() for _ in range(args.runs)]
+    import_ms = statistics.median(run[0] for run in runs)
+    create_ms = statistics.median(run[1] for run in runs)
+    total_ms = statistics.median(sum(run) for run in runs)
+
+    print(f"import app:   {import_ms:8.1f} ms")
+    print(f"create_app(): {create_ms:8.1f} ms")
+    print(f"cold start:   {total_ms:8.1f} ms (budget {args.budget:.0f} ms)")
+    print("Heaviest imports (cumulative):")
+    for ms, name in heaviest_imports():
+        print(f"    {ms:8.1f} ms  {name}")
+
+    if total_ms > args.budget:
+        print('FAILED: cold start is over budget')
+        return 1
+    print('OK')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Kontrollerar att cachade inloggningar ogiltigförklaras och att tabellen
+med ogiltigförklaringar inte växer utan gräns.
+
+Skapar en temporär SQLite-databas med en användare och loggar in. Testet
+misslyckas om ett andra anrop läser users-tabellen, om en ändrad användare
+inte läses om efter invalidate_user_tokens, om tabellen har fler poster än
+token-cachen rymmer efter många ogiltigförklaringar, eller om gamla poster
+ligger kvar efter en TTL.
+
+Användning (från backend/flaskr):
+    python scripts/token_cache_check.py [--users 5000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+FLASKR_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, FLASKR_DIR)
+
+PASSWORD = 'token-check'
+
+
+def count_user_reads(app, client):
+    """(statuskod, antal frågor mot users) för ett anrop med cachad token."""
+    from sqlalchemy import event
+    from extensions import db
+
+    with app.app_context():
+        reads = [0]
+
+        def on_execute(conn, cursor, statement, *args):
+            if 'FROM users' in statement:
+                reads[0] += 1
+
+        event.listen(db.engine, 'before_cursor_execute', on_execute)
+        try:
+            status = client.get('/api/protected').status_code
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', on_execute)
+        return status, reads[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=5000, help='antal ogiltigförklaringar i följd')
+    args = parser.parse_args()
+
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from extensions import db
+    from migrations import upgrade
+    from models.auth_model import User
+    import routes.auth as auth
+
+    errors = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'token.db')}"})
+        with app.app_context():
+            upgrade()
+            user = User(email='token@example.com', password=generate_password_hash(PASSWORD),
+                        first_name='Token', last_name='Check', is_accepted=True)
+            db.session.add(user)
+            db.session.commit()
+            user_id = user.user_id
+
+        client = app.test_client()
+        client.post('/api/login', json={'email': 'token@example.com', 'password': PASSWORD})
+        client.get('/api/protected')
+        if count_user_reads(app, client) != (200, 0):
+            errors.append('second request read the users table')
+
+        with app.app_context():
+            User.query.filter_by(user_id=user_id).update({User.is_accepted: False})
+            db.session.commit()
+            auth.invalidate_user_tokens(user_id)
+        status, reads = count_user_reads(app, client)
+        if status != 403 or reads == 0:
+            errors.append(f'changed user was served from the cache (status {status})')
+
+        for other_id in range(user_id + 1, user_id + 1 + args.users):
+            auth.invalidate_user_tokens(other_id)
+        size, limit = len(auth._user_invalidations), auth.token_cache.maxsize
+        if size > limit:
+            errors.append(f'{size} invalidations kept, token cache holds {limit}')
+
+        # Med kort TTL ska gamla ogiltigförklaringar rensas vid nästa
+        ttl = auth.token_cache.ttl
+        auth.token_cache.ttl = 0.05
+        try:
+            time.sleep(0.1)
+            auth.invalidate_user_tokens(user_id)
+            if list(auth._user_invalidations) != [user_id]:
+                errors.append(f'{len(auth._user_invalidations) - 1} expired invalidations kept')
+        finally:
+            auth.token_cache.ttl = ttl
+
+        with app.app_context():
+            db.engine.dispose()
+
+    for error in errors:
+        print(f"  FAIL {error}")
+    print('FAILED' if errors else 'OK')
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
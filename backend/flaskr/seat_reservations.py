@@ -0,0 +1,90 @@
+import random
+import time
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from extensions import db
+from models.carpool_model import Carpool, Passenger
+
+# Försök vid låskonflikter (SQLite "database is locked", deadlock i PostgreSQL)
+WRITE_ATTEMPTS = 5
+RETRY_DELAY = 0.02
+
+
+class NoSeatsAvailable(Exception):
+    pass
+
+
+class AlreadyPassenger(Exception):
+    pass
+
+
+def reserve_seats(carpool_id, count=1):
+    """Drar av count platser om så många finns kvar. Villkoret kontrolleras av
+    databasen i samma UPDATE, så samtidiga anrop kan inte överboka. Ett
+    negativt count ger tillbaka platser. Returnerar False om platserna inte
+    räckte. Körs före commit."""
+    result = db.session.execute(
+        update(Carpool)
+        .where(Carpool.id == carpool_id, Carpool.available_seats >= count)
+        .values(available_seats=Carpool.available_seats - count)
+    )
+    return result.rowcount == 1
+
+
+def with_retry(write):
+    """Kör write() och gör om den om transaktionen stöter på ett lås.
+    write ska själv committa. Andra fel rullas tillbaka och kastas vidare."""
+    for attempt in range(WRITE_ATTEMPTS):
+        try:
+            return write()
+        except OperationalError:
+            db.session.rollback()
+            if attempt == WRITE_ATTEMPTS - 1:
+                raise
+            time.sleep(RETRY_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5))
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def change_passengers(carpool_id, participants=(), passenger_ids=()):
+    """Tar bort passagerarna passenger_ids och lägger till participants, en
+    lista med (child_id, user_id), i en transaktion.
+
+    Platserna justeras med en enda villkorad UPDATE för nettoförändringen.
+    Bara rader som faktiskt raderades ger tillbaka en plats, så samtidiga
+    borttagningar av samma passagerare räknas en gång. Kastar NoSeatsAvailable
+    om platserna inte räcker och AlreadyPassenger om någon redan åker med
+    (unika index på passengers), och då ändras ingenting. Returnerar antalet
+    borttagna.
+    """
+    def write():
+        removed = 0
+        if passenger_ids:
+            removed = (
+                Passenger.query
+                .filter(Passenger.carpool_id == carpool_id, Passenger.id.in_(list(passenger_ids)))
+                .delete(synchronize_session=False)
+            )
+        if not reserve_seats(carpool_id, len(participants) - removed):
+            raise NoSeatsAvailable()
+        db.session.add_all([
+            Passenger(carpool_id=carpool_id, child_id=child_id, user_id=user_id)
+            for child_id, user_id in participants
+        ])
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise AlreadyPassenger()
+        return removed
+
+    return with_retry(write)
+
+
+def add_passengers(carpool_id, participants):
+    change_passengers(carpool_id, participants=participants)
+
+
+def remove_passengers(carpool_id, passenger_ids):
+    return change_passengers(carpool_id, passenger_ids=passenger_ids)
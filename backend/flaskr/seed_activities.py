@@ -93,6 +93,7 @@ def seed_activities():
 
     # Generate activities
     activities = []
+    seen = set()  # (name, start_date) är unikt
     for _ in range(30):
         name = random.choice(activity_names)
         random_start_hour = random.randint(6, 18)
@@ -102,6 +103,9 @@ def seed_activities():
             hours=random_start_hour,
             minutes=random_start_minute
         )
+        if (name, start_date) in seen:
+            continue
+        seen.add((name, start_date))
         end_date = start_date + timedelta(hours=random.randint(2, 6))
         role_id = random.choice(roles)
         address = random.choice(addresses)
@@ -0,0 +1,92 @@
+from collections import Counter
+from sqlalchemy import insert, select
+from extensions import db, dialect_insert, socketio
+from models.notifications_model import Notification, UnreadCounter
+
+
+def notification_type(message_id):
+    return 'chat' if message_id else 'passenger'
+
+
+def increment_unread(notifications):
+    """Räknar upp olästa för nya notiser. Körs före commit, i samma transaktion som notiserna."""
+    counts = Counter(
+        (n.user_id, n.carpool_id, notification_type(n.message_id)) for n in notifications
+    )
+    for (user_id, carpool_id, notif_type), count in counts.items():
+        stmt = dialect_insert(UnreadCounter).values(
+            user_id=user_id, carpool_id=carpool_id, type=notif_type, count=count
+        )
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['user_id', 'carpool_id', 'type'],
+            set_={'count': UnreadCounter.count + stmt.excluded.count}
+        ))
+
+
+def decrement_unread(user_id, carpool_id, notif_type, count):
+    """Räknar ned med antalet notiser som markerades som lästa. Räknaren
+    nollställs inte, eftersom en notis kan ha committats efter UPDATE:n.
+    Raden raderas när den når 0. Körs före commit."""
+    counter = UnreadCounter.query.filter_by(user_id=user_id, carpool_id=carpool_id, type=notif_type)
+    counter.update(
+        {UnreadCounter.count: db.case((UnreadCounter.count > count, UnreadCounter.count - count), else_=0)},
+        synchronize_session=False
+    )
+    counter.filter(UnreadCounter.count <= 0).delete(synchronize_session=False)
+
+
+def unread_totals(user_ids):
+    """Totalt antal olästa per användare, {user_id: count}."""
+    rows = (
+        db.session.query(UnreadCounter.user_id, db.func.sum(UnreadCounter.count))
+        .filter(UnreadCounter.user_id.in_(list(user_ids)))
+        .group_by(UnreadCounter.user_id)
+    )
+    totals = {user_id: 0 for user_id in user_ids}
+    totals.update({user_id: int(total or 0) for user_id, total in rows})
+    return totals
+
+
+def unread_counts(user_id):
+    """Totalen och räknarna per samåkning och typ för en användare."""
+    counters = UnreadCounter.query.filter(UnreadCounter.user_id == user_id, UnreadCounter.count > 0).all()
+    carpools = {}
+    for counter in counters:
+        carpools.setdefault(counter.carpool_id, {'carpool_id': counter.carpool_id, 'chat': 0, 'passenger': 0})
+        carpools[counter.carpool_id][counter.type] = counter.count
+    return {
+        'unreadCount': sum(counter.count for counter in counters),
+        'carpools': list(carpools.values()),
+    }
+
+
+def push_unread_totals(user_ids):
+    """Skickar nya totaler med update_notifications. counts_only betyder att
+    listan inte behöver laddas om."""
+    for user_id, total in unread_totals(user_ids).items():
+        socketio.emit(
+            'update_notifications',
+            {'unreadCount': total, 'counts_only': True},
+            room=f'user_{user_id}'
+        )
+
+
+def rebuild_unread_counters(user_ids=None):
+    """Bygger om räknarna från notifications, för alla eller för vissa användare.
+    Körs bl.a. när tabellen skapas och när notiser raderas utan att räknarna följt med."""
+    notif_type = db.case((Notification.message_id.isnot(None), 'chat'), else_='passenger')
+    unread = (
+        select(Notification.user_id, Notification.carpool_id, notif_type, db.func.count(Notification.id))
+        .where(Notification.is_read == False)
+        .group_by(Notification.user_id, Notification.carpool_id, notif_type)
+    )
+    counters = db.session.query(UnreadCounter)
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        unread = unread.where(Notification.user_id.in_(user_ids))
+        counters = counters.filter(UnreadCounter.user_id.in_(user_ids))
+    counters.delete(synchronize_session=False)
+    db.session.execute(
+        insert(UnreadCounter).from_select(['user_id', 'carpool_id', 'type', 'count'], unread)
+    )
+    db.session.commit()
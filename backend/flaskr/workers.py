@@ -0,0 +1,21 @@
+from calendar_sync import start_calendar_sync
+from mail_outbox import start_mail_outbox
+from maintenance import start_maintenance
+
+
+def start_background_workers(app):
+    """Startar kalendersynk, utkorgen för e-post och underhåll som bakgrundsuppgifter."""
+    start_calendar_sync(app)
+    start_mail_outbox(app)
+    start_maintenance(app)
+
+
+def init_workers(app):
+    @app.cli.command('run-workers')
+    def run_workers_command():
+        """Kör bakgrundsuppgifterna i en egen process, utan webbserver."""
+        from extensions import socketio
+
+        start_background_workers(app)
+        while True:
+            socketio.sleep(60)
@@ -0,0 +1,22 @@
+"""Startpunkt för produktion med flera processer, t.ex.
+
+    gunicorn -k eventlet -w 1 -b 0.0.0.0:5001 wsgi:app
+
+Kör en gunicorn-instans per port bakom en lastbalanserare med sticky sessions
+och sätt SOCKETIO_MESSAGE_QUEUE så att alla instanser delar rummen.
+Bakgrundsjobben körs separat med `flask --app app run-workers`.
+"""
+import os
+
+# eventlet och gevent måste patcha standardbiblioteket innan något annat importeras
+async_mode = os.getenv('SOCKETIO_ASYNC_MODE')
+if async_mode == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif async_mode == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from app import create_app
+
+app = create_app()
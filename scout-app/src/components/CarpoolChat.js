@@ -26,6 +26,7 @@ function CarpoolChat() {
   const [messageContent, setMessageContent] = useState('');
   const [messagesToShow, setMessagesToShow] = useState(10);
   const [hasMoreMessages, setHasMoreMessages] = useState(true);
+  const [hasOlderOnServer, setHasOlderOnServer] = useState(false);
   const messagesContainerRef = useRef(null);
 
   const scrollToBottom = () => {
@@ -56,9 +57,11 @@ function CarpoolChat() {
         if (response.ok) {
           const data = await response.json();
           const sortedData = data.sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
+          const olderOnServer = response.headers.get('X-Has-More') === 'true';
           setAllMessages(sortedData);
           setVisibleMessages(sortedData.slice(-messagesToShow));
-          setHasMoreMessages(sortedData.length > messagesToShow);
+          setHasOlderOnServer(olderOnServer);
+          setHasMoreMessages(sortedData.length > messagesToShow || olderOnServer);
           scrollToBottom();
         } else {
           console.error('Misslyckades med att hämta meddelanden');
@@ -104,15 +107,46 @@ function CarpoolChat() {
     };
   }, [carpoolId, userId]);
 
-  const handleScroll = () => {
+  // Servern skickar bara de senaste meddelandena, äldre hämtas sida för sida
+  const fetchOlderMessages = async () => {
+    if (allMessages.length === 0) {
+      return { messages: allMessages, olderOnServer: false };
+    }
+    try {
+      const response = await fetch(`/api/carpool/${carpoolId}/messages?before_id=${allMessages[0].id}`, {
+        method: 'GET',
+        credentials: 'include',
+      });
+      if (response.ok) {
+        const older = await response.json();
+        return {
+          messages: [...older, ...allMessages],
+          olderOnServer: response.headers.get('X-Has-More') === 'true',
+        };
+      }
+      console.error('Misslyckades med att hämta äldre meddelanden');
+    } catch (error) {
+      console.error('Fel vid hämtning av äldre meddelanden:', error);
+    }
+    return { messages: allMessages, olderOnServer: hasOlderOnServer };
+  };
+
+  const handleScroll = async () => {
     if (messagesContainerRef.current.scrollTop === 0 && hasMoreMessages) {
       const prevScrollHeight = messagesContainerRef.current.scrollHeight;
       const newMessagesToShow = messagesToShow + 10;
-      const newVisibleMessages = allMessages.slice(-newMessagesToShow);
+
+      let messages = allMessages;
+      let olderOnServer = hasOlderOnServer;
+      if (newMessagesToShow > allMessages.length && hasOlderOnServer) {
+        ({ messages, olderOnServer } = await fetchOlderMessages());
+        setAllMessages(messages);
+        setHasOlderOnServer(olderOnServer);
+      }
 
       setMessagesToShow(newMessagesToShow);
-      setVisibleMessages(newVisibleMessages);
-      setHasMoreMessages(allMessages.length > newMessagesToShow);
+      setVisibleMessages(messages.slice(-newMessagesToShow));
+      setHasMoreMessages(messages.length > newMessagesToShow || olderOnServer);
       setTimeout(() => maintainScrollPosition(prevScrollHeight), 0);
     }
   };
@@ -18,7 +18,7 @@ import {
   useDisclosure,
 } from '@chakra-ui/react';
 import { BellIcon } from '@chakra-ui/icons';
-import { fetchNotifications } from '../utils/notifications';
+import { fetchNotifications, fetchUnreadCounts } from '../utils/notifications';
 import socket from '../utils/socket';
 import { useUser } from '../utils/UserContext';
 import CarpoolChat from './CarpoolChat';
@@ -43,7 +43,10 @@ const ClockNotifications = ({ isScrolled }) => {
     openChat
   } = useCarpool();
   const [notifications, setNotifications] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setLoadingMore] = useState(false);
   const [unreadCount, setUnreadCount] = useState(0);
+  const [unreadCarpools, setUnreadCarpools] = useState([]);
   const { userId, fullName } = useUser();
 
   useEffect(() => {
@@ -51,19 +54,20 @@ const ClockNotifications = ({ isScrolled }) => {
 
     socket.emit('join_user', { user_id: userId });
 
+    // Bara första sidan, äldre notiser hämtas med "Visa fler"
     const loadNotifications = async () => {
       try {
-        const { notifications: fetchedNotifications, unreadCount: fetchedUnreadCount } =
+        const { notifications: fetchedNotifications, nextCursor: fetchedCursor } =
           await fetchNotifications();
         setNotifications(fetchedNotifications);
-    
-        setUnreadCount(fetchedUnreadCount);
+        setNextCursor(fetchedCursor);
       } catch (error) {
         console.error('Error loading notifications:', error);
       }
     };
 
     loadNotifications();
+    loadUnreadCounts();
 
     const handleNotification = (notification) => {
       
@@ -71,8 +75,15 @@ const ClockNotifications = ({ isScrolled }) => {
       setUnreadCount((prevCount) => prevCount + 1);
     };
 
-    const updateNotifications = () => {
-      loadNotifications();
+    const updateNotifications = (data) => {
+      if (data && typeof data.unreadCount === 'number') {
+        setUnreadCount(data.unreadCount);
+      }
+      loadUnreadCounts();
+      // Räknaruppdateringar behöver inte ladda om listan
+      if (!data || !data.counts_only) {
+        loadNotifications();
+      }
     };
 
     socket.on('notification', handleNotification);
@@ -84,6 +95,27 @@ const ClockNotifications = ({ isScrolled }) => {
   };
   }, [userId]);
 
+  const loadUnreadCounts = async () => {
+    const counts = await fetchUnreadCounts();
+    if (counts) {
+      setUnreadCount(counts.unreadCount);
+      setUnreadCarpools(counts.carpools);
+    }
+  };
+
+  const loadMoreNotifications = async () => {
+    if (!nextCursor || isLoadingMore) return;
+    setLoadingMore(true);
+    try {
+      const { notifications: olderNotifications, nextCursor: fetchedCursor } =
+        await fetchNotifications(nextCursor);
+      setNotifications((prevNotifications) => [...prevNotifications, ...olderNotifications]);
+      setNextCursor(fetchedCursor);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const markNotificationsForCarpoolAsRead = async (carpoolId, type) => {
     try {
       const response = await fetch('/api/notifications/mark-read', {
@@ -105,18 +137,7 @@ const ClockNotifications = ({ isScrolled }) => {
           )
         );
   
-        setUnreadCount((prevCount) =>
-          Math.max(
-            prevCount -
-              notifications.filter(
-                (n) =>
-                  n.carpool_details?.id === carpoolId &&
-                  n.type === type &&
-                  !n.is_read
-              ).length,
-            0
-          )
-        );
+        loadUnreadCounts();
       } else {
         console.error('Misslyckades att markera som läst:', result);
       }
@@ -172,23 +193,25 @@ const ClockNotifications = ({ isScrolled }) => {
     setDetailsOpen(false);
   };
 
-  const groupedNotifications = notifications
-  .filter((notification) => !notification.is_read)
-  .reduce((acc, notification) => {
-    const carpoolId = notification.carpool_details?.id || 'unknown';
-    const type = notification.type || 'unknown';
-
-    const key = `${carpoolId}_${type}`;
-
-    if (!acc[key]) {
-      acc[key] = { ...notification, count: 0 };
-    }
-    acc[key].count += 1;
-
-    return acc;
-  }, {});
-
-  const displayedNotifications = Object.values(groupedNotifications);
+  // Antalen kommer från räknarna, så de stämmer även för notiser som inte är hämtade.
+  // Texten tas från den senaste hämtade notisen i gruppen.
+  const displayedNotifications = unreadCarpools.flatMap((counts) =>
+    ['chat', 'passenger']
+      .filter((type) => counts[type] > 0)
+      .map((type) => {
+        const latest = notifications.find(
+          (n) => n.carpool_details?.id === counts.carpool_id && n.type === type
+        );
+        return {
+          ...(latest || {
+            carpool_details: { id: counts.carpool_id },
+            type,
+            message: type === 'chat' ? 'meddelande i en samåkning' : 'Ändringar i en samåkning',
+          }),
+          count: counts[type],
+        };
+      })
+  );
 
   return (
     <>
@@ -259,6 +282,11 @@ const ClockNotifications = ({ isScrolled }) => {
                 <Text>Inga nya notiser</Text>
               </MenuItem>
             )}
+            {nextCursor && (
+              <MenuItem closeOnSelect={false} onClick={loadMoreNotifications} isDisabled={isLoadingMore}>
+                <Text color="gray.500">{isLoadingMore ? 'Hämtar...' : 'Visa fler'}</Text>
+              </MenuItem>
+            )}
           </MenuList>
         </Menu>
       </Flex>
@@ -141,31 +141,14 @@ const DashBoardParent = ({ token }) => {
   const fetchActivities = async () => {
     setActivityLoading(true);
     try {
-      const apiEndpoint = filterByRole
-        ? '/api/protected/activity/by_role'
-        : '/api/protected/activity/no_role';
-  
-      const response = await fetch(apiEndpoint, { credentials: 'include' });
+      // Aktiviteter, samåkningar och bokningsläge hämtas i ett anrop
+      const response = await fetch(`/api/protected/dashboard?filter_by_role=${filterByRole}`, {
+        credentials: 'include',
+      });
+      if (!response.ok) throw new Error('Misslyckades med att hämta aktiviteter.');
       const data = await response.json();
   
-      const sortedActivities = data.events.sort((a, b) => new Date(a.dtstart) - new Date(b.dtstart));
-  
-      const activitiesWithCarpools = await Promise.all(
-        sortedActivities.map(async (activity) => {
-          try {
-            const carpoolResponse = await fetch(`/api/carpool/list?activity_id=${activity.activity_id}`, {
-              credentials: 'include',
-            });
-            const carpoolData = await carpoolResponse.json();
-            return { ...activity, carpools: carpoolData.carpools || [] };
-          } catch (error) {
-            console.error(`Error fetching carpools for activity ${activity.activity_id}:`, error);
-            return { ...activity, carpools: [] };
-          }
-        })
-      );
-  
-      setActivities(activitiesWithCarpools);
+      setActivities(data.events);
     } catch (err) {
       console.error('Error fetching activities:', err);
       setError(err.message);
@@ -201,7 +184,10 @@ const DashBoardParent = ({ token }) => {
     for (const activity of activities) {
       if (activity.carpools) {
         for (const carpool of activity.carpools) {
-          const allChildrenJoined = await checkIfAllChildrenJoined(carpool.id);
+          // Dashboarden skickar med bokningsläget, annars frågas servern
+          const allChildrenJoined = carpool.all_children_joined !== undefined
+            ? carpool.all_children_joined && carpool.user_already_joined
+            : await checkIfAllChildrenJoined(carpool.id);
           joinedStatus[carpool.id] = { allJoined: allChildrenJoined };
         }
       }
@@ -263,25 +249,30 @@ const DashBoardParent = ({ token }) => {
   };
   
 
-  const handleParticipantSelect = async (participant) => {
+  const handleParticipantSelect = async (selected) => {
     try {
-      const response = await fetch(`/api/carpool/add-passenger`, {
+      // Alla valda deltagare bokas i ett anrop
+      const response = await fetch(`/api/carpool/update-passengers`, {
         method: 'POST',
         credentials: 'include',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({
           carpool_id: selectedCarpoolId,
-          ...(participant.type === 'user'
-            ? { add_self: true }
-            : { child_id: participant.id }),
+          add: selected.map((participant) => ({ type: participant.type, id: participant.id })),
         }),
       });
   
-      if (!response.ok) throw new Error('Misslyckades med att lägga till deltagare.');
+      if (!response.ok) {
+        throw new Error(
+          response.status === 402
+            ? 'Det finns inte tillräckligt med platser för alla valda.'
+            : 'Misslyckades med att lägga till deltagare.'
+        );
+      }
   
       toast({
         title: 'Samåkning uppdaterad',
-        description: `${participant.name} har lagts till i samåkningen!`,
+        description: `${selected.map((participant) => participant.name).join(', ')} har lagts till i samåkningen!`,
         status: 'success',
         duration: 5000,
         isClosable: true,
@@ -1,4 +1,4 @@
-import React from 'react';
+import React, { useEffect, useState } from 'react';
 import {
   Modal,
   ModalOverlay,
@@ -15,6 +15,23 @@ import {
 } from '@chakra-ui/react';
 
 const SelectParticipantModal = ({ isOpen, onClose, participants, onSelect }) => {
+    const [selected, setSelected] = useState([]);
+
+    useEffect(() => {
+      if (isOpen) setSelected([]);
+    }, [isOpen]);
+
+    const isSelected = (participant) =>
+      selected.some((p) => p.type === participant.type && p.id === participant.id);
+
+    const toggle = (participant) => {
+      setSelected((prev) =>
+        isSelected(participant)
+          ? prev.filter((p) => !(p.type === participant.type && p.id === participant.id))
+          : [...prev, participant]
+      );
+    };
+
     return (
       <Modal isOpen={isOpen} onClose={onClose} isCentered>
         <ModalOverlay />
@@ -29,11 +46,11 @@ const SelectParticipantModal = ({ isOpen, onClose, participants, onSelect }) =>
                   w="100%"
                   p={4}
                   borderRadius="md"
-                  bg={participant.is_booked ? 'red.100' : 'green.100'}
+                  bg={participant.is_booked ? 'red.100' : isSelected(participant) ? 'green.300' : 'green.100'}
                   cursor={participant.is_booked ? 'not-allowed' : 'pointer'}
                   onClick={() => {
                     if (!participant.is_booked) {
-                      onSelect(participant);
+                      toggle(participant);
                     }
                   }}
                   _hover={{
@@ -42,7 +59,7 @@ const SelectParticipantModal = ({ isOpen, onClose, participants, onSelect }) =>
                 >
                   <Text fontWeight="bold">{participant.name}</Text>
                   <Text fontSize="sm" color="gray.500">
-                    {participant.is_booked ? 'Redan bokad' : 'Tillgänglig'}
+                    {participant.is_booked ? 'Redan bokad' : isSelected(participant) ? 'Vald' : 'Tillgänglig'}
                   </Text>
                 </Box>
               ))}
@@ -50,6 +67,14 @@ const SelectParticipantModal = ({ isOpen, onClose, participants, onSelect }) =>
             </VStack>
           </ModalBody>
           <ModalFooter>
+            <Button
+              colorScheme="green"
+              mr={3}
+              isDisabled={selected.length === 0}
+              onClick={() => onSelect(selected)}
+            >
+              Boka valda
+            </Button>
             <Button colorScheme="gray" onClick={onClose}>
               Stäng
             </Button>
@@ -1,6 +1,12 @@
-export const fetchNotifications = async () => {
+// Notiserna hämtas en sida i taget, nästa sida först när användaren ber om den
+const PAGE_SIZE = 50;
+
+export const fetchNotifications = async (cursor = null) => {
   try {
-    const response = await fetch('/api/notifications', {
+    const params = new URLSearchParams({ limit: PAGE_SIZE });
+    if (cursor) params.set('cursor', cursor);
+
+    const response = await fetch(`/api/notifications?${params}`, {
       method: 'GET',
       credentials: 'include',
       headers: {
@@ -8,18 +14,38 @@ export const fetchNotifications = async () => {
       },
     });
 
-    if (response.ok) {
-      const data = await response.json();
-      return {
-        notifications: data.notifications,
-        unreadCount: data.unreadCount,
-      };
-    } else {
+    if (!response.ok) {
       console.error('Failed to fetch notifications');
-      return { notifications: [], unreadCount: 0 };
+      return { notifications: [], nextCursor: null };
     }
+
+    const data = await response.json();
+    return { notifications: data.notifications, nextCursor: data.next_cursor };
   } catch (error) {
     console.error('Error fetching notifications:', error);
-    return { notifications: [], unreadCount: 0 };
+    return { notifications: [], nextCursor: null };
+  }
+};
+
+// Olästa totalt och per samåkning och typ, ur räknartabellen
+export const fetchUnreadCounts = async () => {
+  try {
+    const response = await fetch('/api/notifications/unread-count', {
+      method: 'GET',
+      credentials: 'include',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+    });
+
+    if (!response.ok) {
+      console.error('Failed to fetch unread counts');
+      return null;
+    }
+
+    return await response.json();
+  } catch (error) {
+    console.error('Error fetching unread counts:', error);
+    return null;
   }
 };